@@ -0,0 +1,114 @@
+"""
+In-process caches
+Size-bounded LRU cache with time-to-live, used for GitLab metadata
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """Cached value with its ETag and fetch time"""
+    __slots__ = ("value", "etag", "stored_at")
+
+    def __init__(self, value: Any, etag: Optional[str] = None):
+        self.value = value
+        self.etag = etag
+        self.stored_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+
+class TTLCache:
+    """
+    LRU cache with per-entry time-to-live
+
+    Expired entries are kept (until evicted) so callers can revalidate them
+    with their ETag instead of downloading the resource again.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+    def lookup(self, key: Hashable, max_age: Optional[float] = None) -> Tuple[Optional[CacheEntry], bool]:
+        """
+        Find entry and tell if it is still fresh
+
+        Returns (entry, fresh). Entry is None on a miss; a stale entry is
+        returned with fresh=False so its ETag can be used for revalidation.
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+
+            self._entries.move_to_end(key)
+            if entry.age() < max_age:
+                self.hits += 1
+                return entry, True
+
+            self.stale += 1
+            return entry, False
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get fresh value or None"""
+        entry, fresh = self.lookup(key)
+        return entry.value if fresh else None
+
+    def set(self, key: Hashable, value: Any, etag: Optional[str] = None):
+        """Store value, evicting least recently used entries over max_size"""
+        with self._lock:
+            self._entries[key] = CacheEntry(value, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def mark_revalidated(self, key: Hashable):
+        """Resource is unchanged (304) - restart entry's time-to-live"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry.stored_at = time.monotonic()
+                self.revalidated += 1
+
+    def invalidate(self, key: Hashable):
+        """Drop entry (after a write to the resource)"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters"""
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0
+        }
@@ -3,49 +3,222 @@ Code Analyzer - Main logic for analyzing code changes
 """
 
 import logging
-from typing import Dict, Any, List
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple, Union, AsyncIterator
 import asyncio
 
-from backend.models import AnalysisResult, CodeIssue, Severity, IssueType
-from backend.llm_provider import get_llm_provider
-from backend.prompts import get_review_prompt
+from backend.models import AnalysisResult, CodeIssue, Severity, IssueType, count_changed_lines
+from backend.llm_provider import LLMProvider
+from backend.llm_hedging import get_review_provider
+from backend.model_router import ModelRouter, TIERS
+from backend.prompts import get_review_prompt, PROMPT_VERSION
 from backend.config import settings
 from backend.feedback import learning_system
+from backend.review_cache import ReviewCache, make_cache_key
+from backend.file_filter import FileFilter
+from backend.diff_compactor import DiffCompactor
+from backend.static_checks import StaticAnalyzer, rule_error_issues
+from backend.tokens import DEFAULT_CHARS_PER_TOKEN, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 
+async def iterate_changes(changes: Union[List[Dict], AsyncIterator[Dict]]) -> AsyncIterator[Dict]:
+    """Iterate over a list or an async stream of file changes"""
+    if hasattr(changes, '__aiter__'):
+        async for change in changes:
+            yield change
+    else:
+        for change in changes:
+            yield change
+
+
+HUNK_RANGES_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@', re.MULTILINE)
+
+
+def hunk_ranges(diff: str) -> List[Tuple[int, int, int, int]]:
+    """(old_start, old_count, new_start, new_count) of every hunk of a diff"""
+    ranges = []
+    for match in HUNK_RANGES_RE.finditer(diff):
+        old_start, new_start = int(match.group(1)), int(match.group(3))
+        old_count = int(match.group(2)) if match.group(2) is not None else 1
+        new_count = int(match.group(4)) if match.group(4) is not None else 1
+        # An empty side points at the line before the hunk
+        ranges.append((old_start + (old_count == 0), old_count, new_start + (new_count == 0), new_count))
+    return ranges
+
+
+def remap_line(line: int, hunks: List[Tuple[int, int, int, int]]) -> Optional[int]:
+    """Line of the old file in the new file, None if a hunk changed it"""
+    offset = 0
+    for old_start, old_count, new_start, new_count in hunks:
+        if line < old_start:
+            break
+        if line < old_start + old_count:
+            return None
+        offset = (new_start + new_count) - (old_start + old_count)
+    return line + offset
+
+
+def recommendation_for(score: float, critical_count: int) -> str:
+    """Recommendation by the same rules the review prompt gives to the LLM"""
+    if score < 6.0:
+        return "reject"
+    if score < 8.0 or critical_count > 0:
+        return "needs_fixes"
+    return "merge"
+
+
+def file_path_of(change: Dict) -> str:
+    """Path of a changed file as shown to the LLM"""
+    return change.get('new_path', change.get('old_path', 'unknown'))
+
+
+class Chunk:
+    """File pieces packed into one LLM request"""
+    
+    def __init__(self):
+        self.parts: List[str] = []
+        self.keys: List[Tuple[Optional[str], str]] = []  # (cache key, file path) of every part
+        self.tokens = 0
+        self.chars = 0
+    
+    def add(self, piece: str, tokens: int, key: Tuple[Optional[str], str]):
+        self.parts.append(piece)
+        self.keys.append(key)
+        self.tokens += tokens
+        self.chars += len(piece) + 1
+    
+    @property
+    def text(self) -> str:
+        return "\n".join(self.parts)
+
+
+class ChunkPacker:
+    """
+    Online first-fit packing of file pieces into LLM requests
+    
+    A piece goes into the first open chunk with room for it. When none fits and
+    `max_open` chunks are already open, the fullest one is closed and handed back
+    for dispatch - memory stays bounded while the stream is read, yet small
+    files fill the room left by big ones and requests stay few and full.
+    """
+    
+    FULL_RATIO = 0.95  # chunk this full is closed right away
+    
+    def __init__(self, max_tokens: int, max_chars: int, max_open: int = 4):
+        self.max_tokens = max(1, max_tokens)
+        self.max_chars = max(1, max_chars)
+        self.max_open = max(1, max_open)
+        self.open: List[Chunk] = []
+    
+    def _fits(self, chunk: Chunk, tokens: int, chars: int) -> bool:
+        return chunk.tokens + tokens <= self.max_tokens and chunk.chars + chars <= self.max_chars
+    
+    def add(self, piece: str, tokens: int, key: Tuple[Optional[str], str]) -> List[Chunk]:
+        """Place piece, return chunks that are closed and ready to be sent"""
+        closed = []
+        target = next((c for c in self.open if self._fits(c, tokens, len(piece))), None)
+        if target is None:
+            if len(self.open) >= self.max_open:
+                fullest = max(self.open, key=lambda c: c.tokens)
+                self.open.remove(fullest)
+                closed.append(fullest)
+            target = Chunk()
+            self.open.append(target)
+        target.add(piece, tokens, key)
+        
+        if target.tokens >= self.max_tokens * self.FULL_RATIO or target.chars >= self.max_chars * self.FULL_RATIO:
+            self.open.remove(target)
+            closed.append(target)
+        return closed
+    
+    def flush(self) -> List[Chunk]:
+        """Close all open chunks"""
+        closed, self.open = self.open, []
+        return closed
+
+
 class CodeAnalyzer:
     """Analyzes code changes using LLM"""
     
+    llm_provider: Optional[LLMProvider] = None
+    cache: Optional[ReviewCache] = None
+    static_analyzer: Optional[StaticAnalyzer] = None
+    
     def __init__(self):
-        self.llm_provider = get_llm_provider()
+        self.llm_provider = ModelRouter.from_settings() if settings.MODEL_ROUTING_ENABLED else get_review_provider()
+        if settings.REVIEW_CACHE_ENABLED:
+            self.cache = ReviewCache(
+                max_size=settings.REVIEW_CACHE_MAX_SIZE,
+                ttl=settings.REVIEW_CACHE_TTL,
+                db_max_rows=settings.REVIEW_CACHE_DB_MAX_ROWS
+            )
+        if settings.STATIC_ANALYSIS_ENABLED:
+            self.static_analyzer = StaticAnalyzer(
+                workers=settings.STATIC_ANALYSIS_WORKERS,
+                rules_timeout=settings.STATIC_RULES_TIMEOUT
+            )
         logger.info("✅ Code Analyzer initialized")
     
+    def _format_file(self, file_path: str, diff: str, part: str = None) -> str:
+        """Format diff of one file (or one part of it) for LLM"""
+        header = f"FILE: {file_path}" + (f" (часть {part})" if part else "")
+        return "\n".join([f"\n{'='*60}", header, f"{'='*60}", diff])
+    
     def _format_changes_for_analysis(self, changes: List[Dict]) -> str:
         """Format GitLab changes into readable text for LLM"""
         formatted = []
         
         for change in changes:
-            file_path = change.get('new_path', change.get('old_path', 'unknown'))
-            diff = change.get('diff', '')
-            
-            formatted.append(f"\n{'='*60}")
-            formatted.append(f"FILE: {file_path}")
-            formatted.append(f"{'='*60}")
-            formatted.append(diff)
+            formatted.append(self._format_file(file_path_of(change), change.get('diff', '')))
         
         return "\n".join(formatted)
     
-    def _truncate_if_needed(self, code_text: str, max_length: int = None) -> str:
-        """Truncate code if it exceeds max length"""
-        max_length = max_length or settings.MAX_CODE_LENGTH
+    def _split_change(self, change: Dict, max_length: int) -> List[str]:
+        """
+        Format one file change as pieces that fit into a chunk
+        
+        Small files stay whole; big diffs are split along hunk boundaries,
+        a single oversized hunk is split by lines.
+        """
+        file_path = file_path_of(change)
+        diff = change.get('diff', '')
+        formatted = self._format_file(file_path, diff)
+        if len(formatted) <= max_length:
+            return [formatted]
+        
+        # Hunks start with '@@ -a,b +c,d @@'
+        hunks = []
+        for line in diff.split('\n'):
+            if line.startswith('@@') or not hunks:
+                hunks.append([line])
+            else:
+                hunks[-1].append(line)
         
-        if len(code_text) > max_length:
-            logger.warning(f"⚠️ Code length {len(code_text)} exceeds limit {max_length}. Truncating...")
-            return code_text[:max_length] + "\n\n... (код обрезан из-за размера)"
+        budget = max(max_length - len(self._format_file(file_path, '', part='99/99')), 1)
+        segments = []
+        current, current_length = [], 0
+        for hunk in hunks:
+            hunk_length = sum(len(line) + 1 for line in hunk)
+            if current and current_length + hunk_length > budget:
+                segments.append("\n".join(current))
+                current, current_length = [], 0
+            for line in hunk:
+                # Hunk bigger than a whole chunk - hard split by lines
+                if current and current_length + len(line) + 1 > budget:
+                    segments.append("\n".join(current))
+                    current, current_length = [], 0
+                current.append(line)
+                current_length += len(line) + 1
+        if current:
+            segments.append("\n".join(current))
         
-        return code_text
+        return [
+            self._format_file(file_path, segment, part=f"{i}/{len(segments)}")
+            for i, segment in enumerate(segments, 1)
+        ]
     
     def _parse_llm_response(self, llm_result: Dict[str, Any]) -> AnalysisResult:
         """Parse LLM response into structured AnalysisResult"""
@@ -99,45 +272,491 @@ class CodeAnalyzer:
         
         return result
     
-    async def analyze_changes(self, changes: List[Dict], mr_data: Dict, custom_rules: str = None) -> Dict[str, Any]:
+    def _merge_incremental(
+        self,
+        previous: Dict[str, Any],
+        delta: AnalysisResult,
+        delta_changes: List[Dict]
+    ) -> AnalysisResult:
+        """
+        Merge analysis of newly pushed commits with the previous review
+        
+        Previous issues on lines changed by the new commits are replaced by the new
+        findings, the rest are still valid and carried over (moved to their new line).
+        Issues of deleted files, or of files whose diff has no hunk headers, are dropped.
+        Score is the average of both reviews weighted by changed lines.
+        """
+        # old path -> (new path, hunks or None when the whole file is affected)
+        touched_files = {}
+        for change in delta_changes:
+            diff = change.get('diff', '')
+            hunks = hunk_ranges(diff)
+            if change.get('deleted_file') or (diff.strip() and not hunks):
+                hunks = None
+            touched_files[change.get('old_path') or change.get('new_path')] = (change.get('new_path'), hunks)
+        
+        kept_issues = []
+        for issue_data in previous.get('issues', []):
+            file_path = issue_data.get('file_path')
+            if file_path in touched_files:
+                new_path, hunks = touched_files[file_path]
+                line = issue_data.get('line')
+                if hunks is None:
+                    continue
+                if line is not None:
+                    line = remap_line(line, hunks)
+                    if line is None:
+                        continue
+                issue_data = {**issue_data, 'file_path': new_path or file_path, 'line': line}
+            try:
+                kept_issues.append(CodeIssue(**issue_data))
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to restore previous issue: {str(e)}")
+        
+        issues = kept_issues + delta.issues
+        
+        previous_lines = max(previous.get('lines_changed', 0), 1)
+        delta_lines = max(count_changed_lines(delta_changes), 1)
+        score = (float(previous.get('score', delta.score)) * previous_lines + delta.score * delta_lines) / (previous_lines + delta_lines)
+        score = round(score, 1)
+        
+        critical_count = sum(1 for i in issues if i.severity == Severity.CRITICAL)
+        medium_count = sum(1 for i in issues if i.severity == Severity.MEDIUM)
+        low_count = sum(1 for i in issues if i.severity == Severity.LOW)
+        
+        logger.info(f"🧩 Incremental merge: {len(kept_issues)} previous + {len(delta.issues)} new issues")
+        
+        return AnalysisResult(
+            summary=f"Инкрементальный анализ новых коммитов: {delta.summary}",
+            score=score,
+            issues=issues,
+            recommendation=recommendation_for(score, critical_count),
+            critical_count=critical_count,
+            medium_count=medium_count,
+            low_count=low_count,
+            estimated_time_saved=delta.estimated_time_saved
+        )
+    
+    def _resolve_rules(self, custom_rules: str = None) -> str:
+        """Custom rules from settings or environment"""
+        return custom_rules or os.getenv("CUSTOM_RULES", "")
+    
+    def _cache_context(self, custom_rules: str = None, project_rules: str = None) -> str:
+        """Hash of everything besides the diff that shapes the LLM answer"""
+        provider = self.llm_provider
+        return make_cache_key(
+            PROMPT_VERSION,
+            self._resolve_rules(custom_rules),
+            project_rules or "",
+            learning_system.get_feedback_for_prompt(),
+            f"{getattr(provider, 'name', '')}:{getattr(provider, 'model_name', '')}"
+        )
+    
+    async def _store_in_cache(self, result: AnalysisResult, pieces: List[Tuple[str, str]], tier: Optional[str] = None):
+        """Store analysis of a chunk per file piece (key, file path) with the routing tier that produced it"""
+        by_file: Dict[str, List[Dict]] = {}
+        unmatched = []
+        for issue in result.issues:
+            data = issue.model_dump(mode='json')
+            if any(issue.file_path == file_path for _, file_path in pieces):
+                by_file.setdefault(issue.file_path, []).append(data)
+            else:
+                unmatched.append(data)
+        
+        stored_files = set()
+        for key, file_path in pieces:
+            issues = []
+            if file_path not in stored_files:
+                # Pieces of one file share its issues - keep them on the first piece only
+                issues = by_file.get(file_path, [])
+                stored_files.add(file_path)
+            if unmatched:
+                issues, unmatched = issues + unmatched, []
+            await self.cache.set(key, {
+                "file_path": file_path,
+                "score": result.score,
+                "issues": issues,
+                "estimated_time_saved": result.estimated_time_saved // max(len(pieces), 1),
+                "tier": tier
+            })
+    
+    def _cached_result(self, entries: List[Tuple[Dict, int]]) -> AnalysisResult:
+        """Build analysis of files whose results were found in the cache"""
+        issues = []
+        for entry, _ in entries:
+            for issue_data in entry.get('issues', []):
+                try:
+                    issues.append(CodeIssue(**issue_data))
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to restore cached issue: {str(e)}")
+        
+        total_weight = sum(weight for _, weight in entries) or 1
+        score = round(sum(float(entry.get('score', 7.0)) * weight for entry, weight in entries) / total_weight, 1)
+        critical_count = sum(1 for i in issues if i.severity == Severity.CRITICAL)
+        files = len({entry.get('file_path') for entry, _ in entries})
+        
+        return AnalysisResult(
+            summary=f"{files} файл(ов) не изменились с прошлого анализа, результаты взяты из кэша",
+            score=score,
+            issues=issues,
+            recommendation=recommendation_for(score, critical_count),
+            critical_count=critical_count,
+            medium_count=sum(1 for i in issues if i.severity == Severity.MEDIUM),
+            low_count=sum(1 for i in issues if i.severity == Severity.LOW),
+            estimated_time_saved=sum(int(entry.get('estimated_time_saved', 0)) for entry, _ in entries)
+        )
+    
+    def _token_budget(self, custom_rules: str = None, project_rules: str = None) -> Tuple[int, int]:
+        """
+        Prompt overhead and the number of diff tokens that fit into one request
+        
+        The model's context window must hold the prompt template, rules, learned
+        patterns, the diff and the reserved response tokens.
+        """
+        provider = self.llm_provider
+        rules = self._resolve_rules(custom_rules)
+        template = get_review_prompt(
+            "",
+            custom_rules=rules if rules else None,
+            learned_patterns=learning_system.get_feedback_for_prompt(),
+            project_rules=project_rules
+        )
+        
+        if provider is None:
+            overhead = estimate_tokens(template)
+            room = settings.ANALYSIS_MAX_INPUT_TOKENS
+        else:
+            overhead = provider.estimate_tokens(template)
+            room = provider.context_window - provider.max_output_tokens
+        return overhead, max(1, min(room, settings.ANALYSIS_MAX_INPUT_TOKENS) - overhead)
+    
+    async def _analyze_text(self, code_text: str, custom_rules: str = None, tier: Optional[str] = None,
+                            project_rules: str = None) -> AnalysisResult:
+        """Build prompt for formatted changes, call LLM (model of given routing tier) and parse its answer"""
+        # Review prompt with custom rules and learned patterns from feedback in its
+        # stable prefix - the diff goes last so provider prompt caches can reuse the prefix
+        rules = self._resolve_rules(custom_rules)
+        learned_context = learning_system.get_feedback_for_prompt()
+        if learned_context:
+            logger.info("📚 Added learned patterns to prompt")
+        prompt = get_review_prompt(
+            code_text,
+            custom_rules=rules if rules else None,
+            learned_patterns=learned_context,
+            project_rules=project_rules
+        )
+        
+        # Call LLM with timeout
+        call = self.llm_provider.analyze_code(prompt, tier=tier) if tier else self.llm_provider.analyze_code(prompt)
+        llm_result = await asyncio.wait_for(call, timeout=settings.ANALYSIS_TIMEOUT)
+        
+        return self._parse_llm_response(llm_result)
+    
+    def _merge_chunk_results(self, results: List[Tuple[AnalysisResult, int]]) -> AnalysisResult:
+        """
+        Reduce per-chunk analyses into one result
+        
+        Issues are concatenated (duplicates of the same file/line/description dropped),
+        score is the average weighted by chunk size, time saved is summed.
+        """
+        if len(results) == 1:
+            return results[0][0]
+        
+        issues = []
+        seen = set()
+        for result, _ in results:
+            for issue in result.issues:
+                key = (issue.file_path, issue.line, issue.description)
+                if key in seen:
+                    continue
+                seen.add(key)
+                issues.append(issue)
+        
+        total_weight = sum(weight for _, weight in results) or 1
+        score = round(sum(result.score * weight for result, weight in results) / total_weight, 1)
+        
+        critical_count = sum(1 for i in issues if i.severity == Severity.CRITICAL)
+        medium_count = sum(1 for i in issues if i.severity == Severity.MEDIUM)
+        low_count = sum(1 for i in issues if i.severity == Severity.LOW)
+        
+        summaries = "\n".join(f"- {result.summary}" for result, _ in results)
+        
+        return AnalysisResult(
+            summary=f"Изменения проанализированы по частям ({len(results)}):\n{summaries}",
+            score=score,
+            issues=issues,
+            recommendation=recommendation_for(score, critical_count),
+            critical_count=critical_count,
+            medium_count=medium_count,
+            low_count=low_count,
+            estimated_time_saved=sum(result.estimated_time_saved for result, _ in results)
+        )
+    
+    def _add_static_issues(self, analysis: AnalysisResult, static_issues: List[Dict], rescore: bool = False) -> AnalysisResult:
+        """
+        Add findings of local static checks to the LLM analysis
+        
+        A finding the LLM already reported (same file, line and issue type) is not duplicated.
+        Without an LLM verdict (rescore) the score is derived from the findings.
+        """
+        reported = {(i.file_path, i.line, i.issue_type) for i in analysis.issues}
+        issues = list(analysis.issues)
+        for issue_data in static_issues:
+            try:
+                issue = CodeIssue(**issue_data)
+            except Exception as e:
+                logger.warning(f"⚠️ Skipping invalid static finding {issue_data.get('rule_id')}: {str(e)}")
+                continue
+            if (issue.file_path, issue.line, issue.issue_type) not in reported:
+                reported.add((issue.file_path, issue.line, issue.issue_type))
+                issues.append(issue)
+        
+        critical_count = sum(1 for i in issues if i.severity == Severity.CRITICAL)
+        medium_count = sum(1 for i in issues if i.severity == Severity.MEDIUM)
+        low_count = sum(1 for i in issues if i.severity == Severity.LOW)
+        score = analysis.score
+        if rescore:
+            score = round(max(0.0, 10.0 - 3 * critical_count - medium_count - 0.3 * low_count), 1)
+        
+        return analysis.model_copy(update={
+            "issues": issues,
+            "score": score,
+            "recommendation": recommendation_for(score, critical_count) if rescore or critical_count else analysis.recommendation,
+            "critical_count": critical_count,
+            "medium_count": medium_count,
+            "low_count": low_count
+        })
+    
+    async def analyze_changes(
+        self,
+        changes: Union[List[Dict], AsyncIterator[Dict]],
+        mr_data: Dict,
+        custom_rules: str = None,
+        previous_result: Dict[str, Any] = None,
+        file_filter: Optional[FileFilter] = None,
+        compactor: Optional[DiffCompactor] = None,
+        repo_checks: Optional[Dict[str, Any]] = None,
+        project_rules: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Main method to analyze code changes
         
+        Changes may be a list or an async stream of file diffs (paginated fetch).
+        Files are bin-packed into as few requests as fit the model's context window
+        (estimated tokens, minus prompt template and reserved response tokens; big
+        files are split along hunk boundaries) and every chunk is analyzed by its
+        own LLM call (map), at most ANALYSIS_FANOUT at a time. Per-chunk results are merged
+        into one review (reduce). Reading the stream waits for a free slot, so memory
+        stays flat however large the MR is.
+        
         Args:
-            changes: List of file changes from GitLab
+            changes: List or async iterator of file changes from GitLab
             mr_data: Merge Request metadata
             custom_rules: Optional custom rules from settings
+            previous_result: Result of the previous review when `changes` is
+                only the delta of newly pushed commits (incremental mode)
+            file_filter: Classifier of lock/generated/vendored/binary files that
+                are not sent to the LLM (default: built from settings)
+            compactor: Diff compaction with the project's options (default: global settings)
+            repo_checks: Machine-checkable rules of the repository run by static checks
+            project_rules: Rules of the repository for the LLM, added to the review prompt
             
         Returns:
-            Analysis result dictionary
+            Analysis result dictionary, None if there were no changes
         """
-        logger.info(f"🔍 Analyzing {len(changes)} file(s)")
+        provider = self.llm_provider
+        max_chunks = settings.ANALYSIS_MAX_CHUNKS
+        slots = asyncio.Semaphore(max(1, settings.ANALYSIS_FANOUT))
+        cache = self.cache
+        cache_context = self._cache_context(custom_rules, project_rules) if cache else None
+        cached: List[Tuple[Dict, int]] = []  # (cached file analysis, weight)
+        tasks: List[Tuple[asyncio.Task, int]] = []
+        overhead, max_tokens = self._token_budget(custom_rules, project_rules)
+        chars_per_token = getattr(provider, 'chars_per_token', DEFAULT_CHARS_PER_TOKEN)
+        max_length = min(settings.MAX_CODE_LENGTH, int(max_tokens * chars_per_token))
+        packer = ChunkPacker(max_tokens, max_length, max_open=settings.ANALYSIS_FANOUT)
+        count_tokens = provider.estimate_tokens if provider else estimate_tokens
+        estimated_tokens = 0
+        files_total = 0
+        skipped_files = set()
+        if file_filter is None and settings.ANALYSIS_FILTER_ENABLED:
+            file_filter = FileFilter.from_settings()
+        filtered: Dict[str, int] = {}  # reason -> files
+        if compactor is None:
+            compactor = DiffCompactor()
+        static = self.static_analyzer
+        static_tasks: List[asyncio.Future] = []
+        static_by_file: Dict[str, asyncio.Future] = {}
+        router = provider if isinstance(provider, ModelRouter) else None
+        tiers: Dict[str, int] = {}  # routing tier -> requests
+        llm_skipped = False
+        filtered_bytes = 0
+        filtered_tokens = 0
+        
+        async def run_chunk(chunk: Chunk, tier: Optional[str]) -> AnalysisResult:
+            try:
+                result = await self._analyze_text(chunk.text, custom_rules, tier, project_rules=project_rules)
+            finally:
+                slots.release()
+            if cache:
+                await self._store_in_cache(result, chunk.keys, tier)
+            return result
+        
+        async def dispatch(chunk: Chunk):
+            nonlocal estimated_tokens
+            if len(tasks) >= max_chunks:
+                skipped_files.update(file_path for _, file_path in chunk.keys)
+                return
+            tier = None
+            if router:
+                # Risk of the chunk: size, touched paths and static findings in its files
+                paths = {file_path for _, file_path in chunk.keys}
+                scans = await asyncio.gather(*(static_by_file[p] for p in paths if p in static_by_file))
+                tier = router.route(overhead + chunk.tokens, paths, [i for scan in scans for i in scan['issues']])
+                tiers[tier] = tiers.get(tier, 0) + 1
+            await slots.acquire()  # backpressure - wait until an in-flight chunk finishes
+            estimated_tokens += overhead + chunk.tokens
+            tasks.append((asyncio.create_task(run_chunk(chunk, tier)), chunk.tokens))
+            logger.info(
+                f"🚀 Started analysis of chunk {len(tasks)} (~{overhead + chunk.tokens} tokens, "
+                f"{len(chunk.parts)} part(s)" + (f", {tier} tier)" if tier else ")")
+            )
         
         try:
-            # Format changes for LLM
-            code_text = self._format_changes_for_analysis(changes)
-            code_text = self._truncate_if_needed(code_text)
-            
-            # Get review prompt with custom rules if provided
-            import os
-            rules = custom_rules or os.getenv("CUSTOM_RULES", "")
-            prompt = get_review_prompt(code_text, custom_rules=rules if rules else None)
-            
-            # Add learned patterns from feedback
-            learned_context = learning_system.get_feedback_for_prompt()
-            if learned_context:
-                prompt += learned_context
-                logger.info("📚 Added learned patterns to prompt")
-            
-            # Call LLM with timeout
-            llm_result = await asyncio.wait_for(
-                self.llm_provider.analyze_code(prompt),
-                timeout=settings.ANALYSIS_TIMEOUT
+            async for change in iterate_changes(changes):
+                files_total += 1
+                file_path = file_path_of(change)
+                if len(tasks) >= max_chunks:
+                    skipped_files.add(file_path)  # chunk limit reached, only drain the stream
+                    continue
+                
+                reason = file_filter.classify(change) if file_filter else None
+                if reason:
+                    diff = change.get('diff') or ''
+                    filtered[reason] = filtered.get(reason, 0) + 1
+                    filtered_bytes += len(diff.encode('utf-8'))
+                    filtered_tokens += count_tokens(diff)
+                    logger.debug(f"🚮 Skipping {file_path} ({reason})")
+                    continue
+                
+                if static:
+                    # Local checks see the full diff (with context) and run in parallel with the LLM
+                    scan = asyncio.ensure_future(static.scan(file_path, change.get('diff') or '', repo_checks))
+                    static_tasks.append(scan)
+                    static_by_file[file_path] = scan
+                
+                change = compactor.compact_change(change)
+                for piece in self._split_change(change, max_length):
+                    key = None
+                    tokens = count_tokens(piece)
+                    if cache:
+                        key = make_cache_key(cache_context, piece)
+                        entry = await cache.get(key)
+                        if entry is not None and router:
+                            # Reuse answers of a model at least as strong as this file needs on its own
+                            scan = await static_by_file[file_path] if file_path in static_by_file else {'issues': []}
+                            needed = router.route(overhead + tokens, [file_path], scan['issues'])
+                            if TIERS.index(entry.get('tier') or TIERS[0]) < TIERS.index(needed):
+                                logger.debug(f"♻️ Cached {entry.get('tier')} analysis of {file_path} too weak for {needed} tier")
+                                entry = None
+                        if entry is not None:
+                            cached.append((entry, tokens))
+                            continue
+                    
+                    for chunk in packer.add(piece, tokens, (key, file_path)):
+                        await dispatch(chunk)
+            
+            if files_total == 0:
+                return None
+            
+            static_results = await asyncio.gather(*static_tasks)
+            static_issues = [issue for result in static_results for issue in result['issues']]
+            if static and repo_checks:
+                static_issues.extend(rule_error_issues(repo_checks))
+            changed_code_lines = sum(result['meaningful_lines'] for result in static_results)
+            
+            if (static and not tasks and settings.STATIC_SKIP_LLM_FOR_TRIVIAL
+                    and changed_code_lines <= settings.STATIC_TRIVIAL_MAX_LINES):
+                # Only docs, comments or formatting changed - static checks are enough
+                llm_skipped = True
+                static.llm_skipped += 1
+                packer.flush()
+                logger.info(f"⏩ Trivial change ({changed_code_lines} code line(s)), skipping LLM")
+            
+            for chunk in packer.flush():
+                await dispatch(chunk)
+            
+            if filtered:
+                logger.info(
+                    f"🚮 Filtered {sum(filtered.values())} file(s) {filtered}, "
+                    f"saved {filtered_bytes} bytes / ~{filtered_tokens} tokens"
+                )
+            if compactor.bytes_in > compactor.bytes_out:
+                logger.info(f"🗜️ Diff compaction: {compactor.bytes_in} -> {compactor.bytes_out} bytes")
+            if cached:
+                logger.info(f"♻️ Reusing cached analysis of {len(cached)} file part(s)")
+            logger.info(
+                f"🔍 Analyzing {files_total - len(skipped_files)} of {files_total} file(s) "
+                f"in {len(tasks)} request(s), ~{estimated_tokens} prompt tokens"
             )
+            outcomes = await asyncio.gather(*(task for task, _ in tasks), return_exceptions=True)
+            
+            results = []
+            failed = 0
+            for outcome, (_, weight) in zip(outcomes, tasks):
+                if isinstance(outcome, BaseException):
+                    failed += 1
+                    logger.warning(f"⚠️ Chunk analysis failed: {outcome!r}")
+                else:
+                    results.append((outcome, weight))
             
-            # Parse result
-            analysis = self._parse_llm_response(llm_result)
+            if cached:
+                results.append((self._cached_result(cached), sum(weight for _, weight in cached)))
             
+            if not results and not tasks:
+                # Every file was filtered out or is trivial - nothing left for the LLM to review
+                summary = (
+                    "Тривиальные изменения (документация, комментарии, форматирование) проверены локальными правилами"
+                    if llm_skipped else
+                    "Изменения содержат только служебные файлы (lock, сгенерированный или бинарный код), ревью не требуется"
+                )
+                results.append((AnalysisResult(summary=summary, score=10.0, issues=[], recommendation="merge"), 1))
+            
+            if not results:
+                first_error = outcomes[0]
+                if isinstance(first_error, asyncio.TimeoutError):
+                    raise first_error
+                raise Exception(f"All {failed} chunk(s) failed: {first_error}")
+            
+            analysis = self._merge_chunk_results(results)
+            if static_issues:
+                analysis = self._add_static_issues(analysis, static_issues, rescore=not (tasks or cached))
+            
+            notes = []
+            if failed:
+                notes.append(f"{failed} из {len(tasks)} частей не удалось проанализировать")
+            if skipped_files:
+                notes.append(f"{len(skipped_files)} файл(ов) не проанализировано: превышен лимит в {max_chunks} частей")
+            if filtered and tasks:
+                reasons = ", ".join(f"{reason}: {count}" for reason, count in sorted(filtered.items()))
+                notes.append(f"пропущено служебных файлов: {sum(filtered.values())} ({reasons})")
+            if notes:
+                analysis.summary += "\n\n⚠️ " + "; ".join(notes) + "."
+            
+            # Incremental mode - combine with still valid issues of the previous review
+            if previous_result:
+                analysis = self._merge_incremental(previous_result, analysis, changes)
+            
+            analysis.estimated_tokens = estimated_tokens
+            analysis.llm_requests = len(tasks)
+            analysis.filtered_files = sum(filtered.values())
+            analysis.filtered_bytes = filtered_bytes
+            analysis.filtered_tokens = filtered_tokens
+            analysis.diff_bytes_in = compactor.bytes_in
+            analysis.diff_bytes_out = compactor.bytes_out
+            analysis.static_issues = len(static_issues)
+            analysis.llm_skipped = llm_skipped
+            analysis.model_tiers = tiers
             logger.info(f"✅ Analysis complete: {len(analysis.issues)} issues found")
             logger.info(f"   Critical: {analysis.critical_count}, Medium: {analysis.medium_count}, Low: {analysis.low_count}")
             
@@ -150,3 +769,10 @@ class CodeAnalyzer:
         except Exception as e:
             logger.error(f"❌ Analysis failed: {str(e)}")
             raise
+        
+        finally:
+            for task, _ in tasks:
+                if not task.done():
+                    task.cancel()
+            for future in static_tasks:
+                future.cancel()
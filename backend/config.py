@@ -3,7 +3,7 @@ Configuration management using Pydantic Settings
 """
 
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -12,10 +12,56 @@ class Settings(BaseSettings):
     # GitLab Configuration
     GITLAB_URL: str = "https://gitlab.com"
     GITLAB_TOKEN: str = "test_token"  # Required in production
+    GITLAB_TIMEOUT: float = 30.0  # seconds per request
+    GITLAB_MAX_CONNECTIONS: int = 20  # connection pool size for the GitLab host
+    GITLAB_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    GITLAB_KEEPALIVE_EXPIRY: float = 30.0  # seconds
+    GITLAB_HTTP2: bool = True  # used when the h2 package is installed
+    GITLAB_STREAM_DIFFS: bool = True  # read MR diffs page by page instead of /changes
+    GITLAB_DIFFS_PER_PAGE: int = 20
+    GITLAB_CACHE_TTL: int = 300  # seconds before project/MR metadata is revalidated
+    GITLAB_CACHE_MAX_SIZE: int = 1000  # cached project/MR entries
+    GITLAB_RATE_LIMIT_RPS: float = 10.0  # shared token bucket refill rate
+    GITLAB_RATE_LIMIT_BURST: int = 20
+    GITLAB_RATE_LIMIT_RESERVE: int = 50  # below this RateLimit-Remaining polling pauses until reset
+    GITLAB_MAX_RETRIES: int = 3  # for 429/5xx and network errors
+    GITLAB_RETRY_BACKOFF: float = 1.0  # seconds, doubled on each attempt (with jitter)
     
     # LLM Provider Configuration
     LLM_PROVIDER: str = "gemini"  # openai, gemini, claude
     
+    # Model Routing (tiers by size and risk of the reviewed code)
+    MODEL_ROUTING_ENABLED: bool = True
+    MODEL_TIER_FAST: str = ""  # "provider:model" or "model", empty = provider default
+    MODEL_TIER_STANDARD: str = ""
+    MODEL_TIER_STRONG: str = ""
+    ROUTING_FAST_MAX_RISK: float = 1.0  # risk below this goes to the fast tier
+    ROUTING_STRONG_MIN_RISK: float = 3.0  # risk from this goes to the strong tier
+    ROUTING_RISKY_PATHS: str = "auth/**,payment/**,payments/**,billing/**,security/**,migrations/**,*migration*"
+    
+    # LLM Provider Limits (per provider account, 0 = unlimited)
+    LLM_MAX_IN_FLIGHT: int = 4  # concurrent requests
+    LLM_REQUESTS_PER_MINUTE: int = 60
+    LLM_TOKENS_PER_MINUTE: int = 1000000
+    LLM_PROVIDER_LIMITS: Dict[str, Dict[str, int]] = {}  # provider -> {"max_in_flight", "rpm", "tpm"} overrides
+    
+    # LLM Resilience (retries, circuit breaker, fallback providers)
+    LLM_MAX_RETRIES: int = 2  # per provider, for 429/5xx/timeouts/invalid JSON
+    LLM_RETRY_BACKOFF: float = 1.0  # seconds, doubled on each attempt (with jitter)
+    LLM_RETRY_MAX_DELAY: float = 20.0
+    LLM_ATTEMPT_TIMEOUT: float = 90.0  # seconds per LLM call, 0 disables (ANALYSIS_TIMEOUT is also split between fallback providers)
+    LLM_FALLBACK_PROVIDERS: str = "openai,claude"  # tried in order when LLM_PROVIDER fails (only with API key)
+    LLM_BREAKER_FAILURES: int = 5  # consecutive failures that open the circuit breaker
+    LLM_BREAKER_RESET: float = 60.0  # seconds before a trial request is let through
+    
+    # LLM Hedging (backup request when the first one is slower than usual)
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95  # of recent latencies, after which the backup request is sent
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # latencies needed before the percentile is used
+    LLM_HEDGE_INITIAL_DELAY: float = 60.0  # seconds, until enough samples are collected
+    LLM_HEDGE_MIN_DELAY: float = 5.0
+    LLM_HEDGE_PROVIDER: str = ""  # provider of the backup request, empty = same provider and model
+    
     # API Keys
     OPENAI_API_KEY: Optional[str] = None
     GEMINI_API_KEY: Optional[str] = None
@@ -33,10 +79,61 @@ class Settings(BaseSettings):
     DEBUG: bool = False
     
     # Analysis Settings
-    MAX_CODE_LENGTH: int = 50000
+    MAX_CODE_LENGTH: int = 200000  # max characters of diff per LLM request (chunk)
+    ANALYSIS_MAX_INPUT_TOKENS: int = 60000  # max prompt tokens per LLM request (capped by model context window)
+    LLM_MAX_OUTPUT_TOKENS: int = 4000  # tokens reserved for the response
+    LLM_STREAMING: bool = True  # stream responses, parse issues incrementally, abort malformed output early
+    LLM_STRUCTURED_OUTPUT: bool = True  # enforce the review JSON schema (OpenAI json_schema, Gemini response_schema, Claude tool use)
+    LLM_PROMPT_CACHING: bool = True  # provider prompt caching of the stable prompt prefix
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS: int = 4096  # smaller prefixes rely on Gemini implicit caching
+    GEMINI_CONTEXT_CACHE_TTL: int = 3600  # seconds
+    GEMINI_CONTEXT_CACHE_MAX_SIZE: int = 32  # distinct prompt prefixes kept per process
     ANALYSIS_TIMEOUT: int = 300  # seconds
+    ANALYSIS_FANOUT: int = 4  # chunks analyzed in parallel per review
+    ANALYSIS_MAX_CHUNKS: int = 20  # files beyond this many chunks are skipped
+    
+    # File Filter Settings (lock, vendored, generated, minified and binary files are not analyzed)
+    ANALYSIS_FILTER_ENABLED: bool = True
+    ANALYSIS_SKIP_PATTERNS: str = ""  # extra comma-separated globs, e.g. "migrations/**,*.sql" (a "build/**" glob matches at any depth)
+    ANALYSIS_FILTER_MAX_LINE_LENGTH: int = 500  # average added line length of minified code
+    ANALYSIS_FILTER_MAX_ENTROPY: float = 5.8  # bits per char of embedded blobs (base64, keys)
+    
+    # Static Pre-analysis Settings (local detectors run before the LLM)
+    STATIC_ANALYSIS_ENABLED: bool = True
+    STATIC_ANALYSIS_WORKERS: int = 2  # worker processes, 0 runs checks in the event loop
+    STATIC_RULES_TIMEOUT: float = 1.0  # seconds per repository forbidden pattern and file (stops runaway regexes), 0 disables
+    STATIC_SKIP_LLM_FOR_TRIVIAL: bool = True  # docs/comments/formatting-only MRs skip the LLM
+    STATIC_TRIVIAL_MAX_LINES: int = 0  # changed code lines still considered trivial
+    
+    # Repository Rules Settings (rules file in the reviewed repository)
+    REPO_RULES_ENABLED: bool = True
+    REPO_RULES_FILE: str = ".codereview-rules.yaml"
+    
+    # Diff Compaction Settings (shrink diffs before prompting, line numbers stay mappable)
+    DIFF_COMPACTION_ENABLED: bool = True
+    DIFF_CONTEXT_LINES: int = 2  # context lines kept around changes, -1 keeps all
+    DIFF_COLLAPSE_WHITESPACE: bool = True  # whitespace-only changes become context
+    DIFF_COLLAPSE_MOVED: bool = True  # blocks moved unchanged are replaced by a note
+    DIFF_MIN_MOVED_LINES: int = 3
+    DIFF_MAX_DELETED_LINES: int = 20  # deletion-only runs are cut after this many lines
+    DIFF_COMPACTION_PROJECTS: Dict[str, Dict[str, Any]] = {}  # per-project overrides, JSON: {"42": {"context_lines": 3}}
+    
+    # Review Cache Settings (per-file results keyed by diff + prompt + rules + model)
+    REVIEW_CACHE_ENABLED: bool = True
+    REVIEW_CACHE_MAX_SIZE: int = 2000  # entries kept in memory (LRU)
+    REVIEW_CACHE_TTL: int = 604800  # seconds (7 days)
+    REVIEW_CACHE_DB_MAX_ROWS: int = 50000  # rows kept in review_cache table (LRU)
+    
+    # Review Queue Settings
+    REVIEW_WORKERS: int = 2  # concurrent analysis workers
+    REVIEW_QUEUE_MAX_SIZE: int = 100  # max jobs waiting in queue
+    REVIEW_QUEUE_POLL_INTERVAL: float = 5.0  # seconds between DB polls when idle
+    REVIEW_JOB_LEASE_SECONDS: int = 600  # job is re-queued if worker stops renewing lease
+    REVIEW_JOB_MAX_ATTEMPTS: int = 3
+    REVIEW_JOB_RETRY_DELAY: int = 30  # seconds, doubled on each attempt
     
     # Review Settings
+    INCREMENTAL_REVIEW: bool = True  # re-review only commits pushed since the last review
     MIN_SCORE_FOR_APPROVAL: float = 7.0
     AUTO_LABEL_MR: bool = True
     
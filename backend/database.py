@@ -2,10 +2,12 @@
 Database configuration and models
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any
+import json
 import logging
 
 from backend.config import settings
@@ -36,6 +38,49 @@ class CodeReviewDB(Base):
     summary = Column(Text, nullable=True)
 
 
+class ReviewJobDB(Base):
+    """Database model for queued MR review jobs"""
+    __tablename__ = "review_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, index=True)
+    merge_request_id = Column(Integer, index=True)
+    head_sha = Column(String, nullable=True)
+    status = Column(String, index=True, default='queued')  # queued, running, done, failed, superseded
+    payload = Column(Text)  # JSON with job data
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    locked_by = Column(String, nullable=True)  # worker that holds the lease
+    lease_expires_at = Column(DateTime, nullable=True)
+    available_at = Column(DateTime, default=datetime.utcnow)  # retry backoff
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MRReviewStateDB(Base):
+    """Last reviewed head commit of each MR (idempotency key for reviews)"""
+    __tablename__ = "mr_review_state"
+    __table_args__ = (UniqueConstraint('project_id', 'merge_request_id', name='uq_mr_review_state'),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, index=True)
+    merge_request_id = Column(Integer, index=True)
+    head_sha = Column(String)
+    result = Column(Text, nullable=True)  # JSON of last analysis result (for incremental reviews)
+    reviewed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ReviewCacheDB(Base):
+    """Cached analysis of one file diff, keyed by content hash"""
+    __tablename__ = "review_cache"
+    
+    key = Column(String(64), primary_key=True)  # sha256 of diff + prompt version + rules + model
+    value = Column(Text)  # JSON with issues, score and summary
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
 # Database engine
 engine = None
 SessionLocal = None
@@ -63,6 +108,8 @@ def init_db():
     except Exception as e:
         logger.warning(f"⚠️ Database init failed: {str(e)}")
         logger.warning("Continuing without database...")
+        engine = None
+        SessionLocal = None
 
 
 def close_db():
@@ -240,3 +287,420 @@ def get_recent_reviews(limit: int = 10):
         return []
     finally:
         db.close()
+
+
+def is_db_available() -> bool:
+    """Check if database was initialized"""
+    return SessionLocal is not None
+
+
+def _job_to_dict(job: ReviewJobDB) -> Dict[str, Any]:
+    """Convert review job row to plain dict"""
+    return {
+        "id": job.id,
+        "project_id": job.project_id,
+        "mr_iid": job.merge_request_id,
+        "head_sha": job.head_sha,
+        "status": job.status,
+        "payload": json.loads(job.payload) if job.payload else {},
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "locked_by": job.locked_by,
+        "last_error": job.last_error
+    }
+
+
+def enqueue_review_job(
+    project_id: int,
+    mr_iid: int,
+    payload: Dict[str, Any],
+    head_sha: Optional[str] = None,
+    max_attempts: int = 3,
+    max_queued: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Enqueue review job with latest-wins coalescing per MR
+    
+    A queued job for the same MR is replaced in place with the new payload,
+    running jobs for the MR are marked 'superseded' so their workers abort.
+    An event with the same head SHA as a queued or running job is a duplicate
+    and leaves the queue untouched.
+    Returns {"id", "coalesced", "duplicate", "superseded", "full"}.
+    """
+    if not SessionLocal:
+        return {"id": None, "coalesced": False, "duplicate": False, "superseded": [], "full": False}
+    
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        same_mr = db.query(ReviewJobDB).filter(
+            ReviewJobDB.project_id == project_id,
+            ReviewJobDB.merge_request_id == mr_iid,
+            ReviewJobDB.status.in_(['queued', 'running'])
+        ).order_by(ReviewJobDB.id).with_for_update().all()
+        
+        if head_sha:
+            for job in same_mr:
+                if job.head_sha == head_sha:
+                    db.rollback()
+                    logger.info(f"⏭️ MR #{mr_iid} head {head_sha[:8]} already in review job {job.id}")
+                    return {"id": job.id, "coalesced": False, "duplicate": True, "superseded": [], "full": False}
+        
+        superseded = []
+        queued_job = None
+        for job in same_mr:
+            if job.status == 'running':
+                job.status = 'superseded'
+                job.updated_at = now
+                superseded.append(job.id)
+            elif queued_job is None:
+                queued_job = job
+            else:
+                # Leftover duplicate from a concurrent insert
+                job.status = 'superseded'
+                job.updated_at = now
+        
+        if queued_job:
+            queued_job.payload = json.dumps(payload, ensure_ascii=False, default=str)
+            queued_job.head_sha = head_sha
+            queued_job.available_at = now
+            queued_job.updated_at = now
+            db.commit()
+            logger.info(f"🔁 Review job {queued_job.id} for MR #{mr_iid} replaced with newer event")
+            return {"id": queued_job.id, "coalesced": True, "duplicate": False, "superseded": superseded, "full": False}
+        
+        if max_queued is not None:
+            queued = db.query(ReviewJobDB).filter(ReviewJobDB.status == 'queued').count()
+            if queued >= max_queued:
+                db.rollback()
+                return {"id": None, "coalesced": False, "duplicate": False, "superseded": [], "full": True}
+        
+        job = ReviewJobDB(
+            project_id=project_id,
+            merge_request_id=mr_iid,
+            head_sha=head_sha,
+            status='queued',
+            payload=json.dumps(payload, ensure_ascii=False, default=str),
+            attempts=0,
+            max_attempts=max_attempts,
+            available_at=now
+        )
+        db.add(job)
+        db.commit()
+        logger.info(f"📥 Review job {job.id} stored for MR #{mr_iid}")
+        return {"id": job.id, "coalesced": False, "duplicate": False, "superseded": superseded, "full": False}
+    except Exception as e:
+        logger.error(f"❌ Failed to enqueue review job: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def claim_review_job(worker_id: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+    """
+    Claim next available review job for a worker
+    
+    Picks queued jobs and running jobs whose lease has expired (crashed worker).
+    On PostgreSQL candidates are locked with FOR UPDATE SKIP LOCKED, so replicas
+    never wait on each other. SQLite ignores row locks, so the claim itself is a
+    conditional UPDATE that only succeeds if the row is still in the state we read.
+    """
+    if not SessionLocal:
+        return None
+    
+    from sqlalchemy import or_, and_, update
+    
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(ReviewJobDB.status == 'queued', ReviewJobDB.available_at <= now),
+            and_(ReviewJobDB.status == 'running', ReviewJobDB.lease_expires_at < now)
+        )
+        candidates = db.query(ReviewJobDB).filter(claimable).order_by(
+            ReviewJobDB.id
+        ).limit(5).with_for_update(skip_locked=True).all()
+        
+        for job in candidates:
+            # Job crashed too many times - give up on it
+            if job.attempts >= job.max_attempts:
+                job.status = 'failed'
+                job.locked_by = None
+                job.last_error = job.last_error or "Lease expired too many times"
+                job.updated_at = now
+                logger.warning(f"⚠️ Review job {job.id} failed after {job.attempts} attempts")
+                continue
+            
+            result = db.execute(
+                update(ReviewJobDB)
+                .where(ReviewJobDB.id == job.id)
+                .where(ReviewJobDB.status == job.status)
+                .where(ReviewJobDB.attempts == job.attempts)
+                .values(
+                    status='running',
+                    attempts=job.attempts + 1,
+                    locked_by=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    updated_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                db.commit()
+                db.refresh(job)
+                return _job_to_dict(job)
+        
+        db.commit()
+        return None
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to claim review job: {str(e)}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+
+def renew_review_job_lease(job_id: int, worker_id: str, lease_seconds: int) -> bool:
+    """
+    Extend lease of a running job
+    
+    Returns False if the job is no longer ours (superseded or reclaimed).
+    Database errors return True - we can't tell, so the worker keeps going.
+    """
+    if not SessionLocal:
+        return False
+    
+    from sqlalchemy import update
+    
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        result = db.execute(
+            update(ReviewJobDB)
+            .where(ReviewJobDB.id == job_id)
+            .where(ReviewJobDB.status == 'running')
+            .where(ReviewJobDB.locked_by == worker_id)
+            .values(lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+        )
+        db.commit()
+        return result.rowcount == 1
+    except Exception as e:
+        logger.error(f"❌ Failed to renew lease for job {job_id}: {str(e)}")
+        db.rollback()
+        return True
+    finally:
+        db.close()
+
+
+def _finish_review_job(job_id: int, worker_id: str, **values) -> bool:
+    """Update job owned by worker with final values"""
+    if not SessionLocal:
+        return False
+    
+    from sqlalchemy import update
+    
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(ReviewJobDB)
+            .where(ReviewJobDB.id == job_id)
+            .where(ReviewJobDB.status == 'running')
+            .where(ReviewJobDB.locked_by == worker_id)
+            .values(locked_by=None, lease_expires_at=None, updated_at=datetime.utcnow(), **values)
+        )
+        db.commit()
+        return result.rowcount == 1
+    except Exception as e:
+        logger.error(f"❌ Failed to update review job {job_id}: {str(e)}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+def complete_review_job(job_id: int, worker_id: str) -> bool:
+    """Mark job as done"""
+    return _finish_review_job(job_id, worker_id, status='done', last_error=None)
+
+
+def fail_review_job(job_id: int, worker_id: str, error: str, attempts: int, max_attempts: int, retry_delay: int = 30) -> bool:
+    """Put job back to queue with backoff, or mark it failed when attempts are exhausted"""
+    if attempts >= max_attempts:
+        return _finish_review_job(job_id, worker_id, status='failed', last_error=error[:2000])
+    
+    delay = retry_delay * (2 ** max(attempts - 1, 0))
+    return _finish_review_job(
+        job_id, worker_id,
+        status='queued',
+        last_error=error[:2000],
+        available_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+
+
+def release_review_job(job_id: int, worker_id: str) -> bool:
+    """Return interrupted job to queue without counting the attempt (graceful shutdown)"""
+    return _finish_review_job(
+        job_id, worker_id,
+        status='queued',
+        attempts=ReviewJobDB.attempts - 1,
+        available_at=datetime.utcnow()
+    )
+
+
+def get_review_job_stats() -> Dict[str, int]:
+    """Get number of review jobs per state"""
+    if not SessionLocal:
+        return {}
+    
+    db = SessionLocal()
+    try:
+        from sqlalchemy import func
+        
+        rows = db.query(ReviewJobDB.status, func.count(ReviewJobDB.id)).group_by(ReviewJobDB.status).all()
+        return {status: count for status, count in rows}
+    except Exception as e:
+        logger.error(f"Error getting review job stats: {str(e)}")
+        return {}
+    finally:
+        db.close()
+
+
+def get_mr_review_state(project_id: int, mr_iid: int) -> Optional[Dict[str, Any]]:
+    """Get head SHA and analysis result of the last completed review of MR"""
+    if not SessionLocal:
+        return None
+    
+    db = SessionLocal()
+    try:
+        state = db.query(MRReviewStateDB).filter(
+            MRReviewStateDB.project_id == project_id,
+            MRReviewStateDB.merge_request_id == mr_iid
+        ).first()
+        if not state:
+            return None
+        return {
+            "head_sha": state.head_sha,
+            "result": json.loads(state.result) if state.result else None,
+            "reviewed_at": state.reviewed_at.isoformat() if state.reviewed_at else None
+        }
+    except Exception as e:
+        logger.error(f"Error getting review state: {str(e)}")
+        return None
+    finally:
+        db.close()
+
+
+def get_reviewed_head_sha(project_id: int, mr_iid: int) -> Optional[str]:
+    """Get head SHA of the last completed review of MR"""
+    state = get_mr_review_state(project_id, mr_iid)
+    return state["head_sha"] if state else None
+
+
+def save_reviewed_head_sha(project_id: int, mr_iid: int, head_sha: str, analysis_result: Optional[Dict[str, Any]] = None):
+    """Remember that MR was reviewed at given head SHA (with its analysis result)"""
+    if not SessionLocal or not head_sha:
+        return
+    
+    db = SessionLocal()
+    try:
+        state = db.query(MRReviewStateDB).filter(
+            MRReviewStateDB.project_id == project_id,
+            MRReviewStateDB.merge_request_id == mr_iid
+        ).with_for_update().first()
+        
+        if state is None:
+            state = MRReviewStateDB(project_id=project_id, merge_request_id=mr_iid)
+            db.add(state)
+        
+        state.head_sha = head_sha
+        if analysis_result is not None:
+            state.result = json.dumps(analysis_result, ensure_ascii=False, default=str)
+        state.reviewed_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"📌 MR #{mr_iid} marked as reviewed at {head_sha[:8]}")
+    except Exception as e:
+        logger.error(f"❌ Failed to save review state: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def get_cached_review(key: str, max_age: int) -> Optional[Dict[str, Any]]:
+    """Get cached file analysis (None if missing or older than max_age seconds)"""
+    if not SessionLocal:
+        return None
+    
+    db = SessionLocal()
+    try:
+        entry = db.query(ReviewCacheDB).filter(
+            ReviewCacheDB.key == key,
+            ReviewCacheDB.created_at >= datetime.utcnow() - timedelta(seconds=max_age)
+        ).first()
+        if not entry:
+            return None
+        entry.last_used_at = datetime.utcnow()
+        db.commit()
+        return json.loads(entry.value)
+    except Exception as e:
+        logger.error(f"Error reading review cache: {str(e)}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+
+def save_cached_review(key: str, value: Dict[str, Any]):
+    """Store file analysis (rows over the limit are evicted by prune_review_cache)"""
+    if not SessionLocal:
+        return
+    
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        entry = db.get(ReviewCacheDB, key)
+        if entry is None:
+            entry = ReviewCacheDB(key=key)
+            db.add(entry)
+        entry.value = json.dumps(value, ensure_ascii=False, default=str)
+        entry.created_at = now
+        entry.last_used_at = now
+        db.commit()
+    except Exception as e:
+        logger.error(f"❌ Failed to save review cache entry: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def prune_review_cache(max_rows: int) -> int:
+    """
+    Evict least recently used rows over max_rows, return number of deleted rows
+    
+    The cutoff is the last_used_at of the max_rows-th newest row, found through the
+    index instead of counting the whole table.
+    """
+    if not SessionLocal:
+        return 0
+    
+    db = SessionLocal()
+    try:
+        cutoff = db.query(ReviewCacheDB.last_used_at).order_by(
+            ReviewCacheDB.last_used_at.desc()
+        ).offset(max_rows).limit(1).scalar()
+        if cutoff is None:
+            return 0
+        deleted = db.query(ReviewCacheDB).filter(
+            ReviewCacheDB.last_used_at <= cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            logger.info(f"🧹 Evicted {deleted} review cache row(s) over {max_rows}")
+        return deleted
+    except Exception as e:
+        logger.error(f"❌ Failed to prune review cache: {str(e)}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
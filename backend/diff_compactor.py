@@ -0,0 +1,322 @@
+"""
+Diff Compactor - Shrinks unified diffs before they are sent to the LLM
+Limits context lines, collapses whitespace-only changes and moved blocks and
+elides long deletion-only runs. Whenever lines are dropped a new `@@ -old +new @@`
+header is emitted, so line numbers in returned issues still match the file.
+Dropped content is replaced by `\\ [compacted] ...` notes (diff annotation syntax).
+"""
+
+import logging
+import re
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+HUNK_RE = re.compile(r'^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@(.*)$')
+# Quoted spans on one line - whitespace inside them is part of the value
+STRING_LITERAL_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Files where leading indentation changes meaning (blocks, nesting, recipe tabs)
+INDENT_SENSITIVE_EXTENSIONS = (".py", ".pyi", ".yaml", ".yml", ".mk")
+INDENT_SENSITIVE_NAMES = ("Makefile", "makefile", "GNUmakefile")
+
+
+class CompactionConfig(BaseModel):
+    """Diff compaction options (global defaults, overridable per project)"""
+    enabled: bool = True
+    context_lines: int = 2  # context lines kept around changes, -1 keeps all
+    collapse_whitespace: bool = True
+    collapse_moved: bool = True
+    min_moved_lines: int = 3  # shorter identical blocks are not treated as moves
+    max_deleted_lines: int = 20  # deletion-only runs are cut after this many lines
+
+    @classmethod
+    def for_project(cls, project_id: Optional[int] = None) -> "CompactionConfig":
+        """Settings defaults merged with DIFF_COMPACTION_PROJECTS[project_id]"""
+        config = {
+            "enabled": settings.DIFF_COMPACTION_ENABLED,
+            "context_lines": settings.DIFF_CONTEXT_LINES,
+            "collapse_whitespace": settings.DIFF_COLLAPSE_WHITESPACE,
+            "collapse_moved": settings.DIFF_COLLAPSE_MOVED,
+            "min_moved_lines": settings.DIFF_MIN_MOVED_LINES,
+            "max_deleted_lines": settings.DIFF_MAX_DELETED_LINES
+        }
+        if project_id is not None:
+            config.update(settings.DIFF_COMPACTION_PROJECTS.get(str(project_id), {}))
+        return cls(**config)
+
+
+class DiffLine:
+    """One line of a hunk with old/new line numbers of its position"""
+    __slots__ = ("kind", "text", "old", "new", "keep")
+
+    def __init__(self, kind: str, text: str, old: Optional[int], new: Optional[int]):
+        self.kind = kind  # ' ', '-', '+' or '\\' (note)
+        self.text = text
+        self.old = old
+        self.new = new
+        self.keep = True
+
+
+def _note(text: str) -> DiffLine:
+    return DiffLine("\\", f" [compacted] {text}", None, None)
+
+
+def _normalize(text: str, keep_indent: bool = False) -> str:
+    """
+    Line with whitespace runs collapsed outside string literals and line ends
+    stripped (indentation kept if significant)
+    """
+    body = text.strip()
+    pieces = []
+    position = 0
+    for literal in STRING_LITERAL_RE.finditer(body):
+        pieces.append(WHITESPACE_RE.sub(" ", body[position:literal.start()]))
+        pieces.append(literal.group())
+        position = literal.end()
+    pieces.append(WHITESPACE_RE.sub(" ", body[position:]))
+    collapsed = "".join(pieces)
+    if keep_indent and collapsed:
+        return text[:len(text) - len(text.lstrip())] + collapsed
+    return collapsed
+
+
+def is_indent_sensitive(file_path: str) -> bool:
+    name = file_path.rsplit("/", 1)[-1]
+    return name in INDENT_SENSITIVE_NAMES or name.endswith(INDENT_SENSITIVE_EXTENSIONS)
+
+
+class DiffCompactor:
+    """Compacts file diffs and counts bytes before/after"""
+
+    def __init__(self, config: Optional[CompactionConfig] = None):
+        self.config = config or CompactionConfig.for_project()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.files = 0
+
+    def _parse(self, diff: str):
+        """Split diff into preamble lines and hunks of DiffLine"""
+        preamble: List[str] = []
+        hunks: List[List[DiffLine]] = []
+        headers: List[str] = []
+        old = new = 0
+
+        lines = diff.split('\n')
+        if lines and lines[-1] == '':
+            lines.pop()  # diff ends with a newline
+        for raw in lines:
+            match = HUNK_RE.match(raw)
+            if match:
+                old, new = int(match.group(1)), int(match.group(2))
+                headers.append(match.group(3))
+                hunks.append([])
+                continue
+            if not hunks:
+                preamble.append(raw)
+                continue
+
+            kind, text = (raw[:1] or ' '), raw[1:]
+            if kind == '-':
+                hunks[-1].append(DiffLine('-', text, old, new))
+                old += 1
+            elif kind == '+':
+                hunks[-1].append(DiffLine('+', text, old, new))
+                new += 1
+            elif kind == '\\':
+                hunks[-1].append(DiffLine('\\', text, None, None))
+            else:
+                hunks[-1].append(DiffLine(' ', text, old, new))
+                old += 1
+                new += 1
+        return preamble, hunks, headers
+
+    @staticmethod
+    def _runs(hunk: List[DiffLine], kind: str) -> List[List[int]]:
+        """Indexes of consecutive lines of one kind"""
+        runs, current = [], []
+        for i, line in enumerate(hunk):
+            if line.kind == kind and line.keep:
+                current.append(i)
+            elif current:
+                runs.append(current)
+                current = []
+        if current:
+            runs.append(current)
+        return runs
+
+    def _collapse_whitespace(self, hunk: List[DiffLine], normalize=_normalize) -> List[DiffLine]:
+        """Turn '-'/'+' pairs that differ only in whitespace into context"""
+        result: List[DiffLine] = []
+        i = 0
+        while i < len(hunk):
+            removed_end = i
+            while removed_end < len(hunk) and hunk[removed_end].kind == '-':
+                removed_end += 1
+            added_end = removed_end
+            while added_end < len(hunk) and hunk[added_end].kind == '+':
+                added_end += 1
+
+            removed, added = hunk[i:removed_end], hunk[removed_end:added_end]
+            if removed and len(removed) == len(added) and all(
+                normalize(r.text) == normalize(a.text) for r, a in zip(removed, added)
+            ):
+                result.append(_note(f"{len(added)} line(s) changed only in whitespace"))
+                result.extend(DiffLine(' ', a.text, r.old, a.new) for r, a in zip(removed, added))
+                i = added_end
+            elif removed or added:
+                result.extend(hunk[i:added_end])
+                i = added_end
+            else:
+                result.append(hunk[i])
+                i += 1
+        return result
+
+    def _collapse_moved(self, hunks: List[List[DiffLine]], normalize=_normalize):
+        """Drop blocks removed in one place and added unchanged in another"""
+        added_at: Dict[str, List[Tuple[List[DiffLine], int]]] = {}
+        for hunk in hunks:
+            for i, line in enumerate(hunk):
+                if line.kind == '+' and normalize(line.text):
+                    added_at.setdefault(normalize(line.text), []).append((hunk, i))
+
+        def added_block(removed: List[DiffLine]) -> Optional[List[DiffLine]]:
+            wanted = [normalize(line.text) for line in removed]
+            for hunk, start in added_at.get(wanted[0], []):
+                block = hunk[start:start + len(wanted)]
+                if len(block) == len(wanted) and all(
+                    line.kind == '+' and line.keep and normalize(line.text) == text
+                    for line, text in zip(block, wanted)
+                ):
+                    return block
+            return None
+
+        for hunk in hunks:
+            for run in self._runs(hunk, '-'):
+                if len(run) < self.config.min_moved_lines:
+                    continue
+                removed = [hunk[i] for i in run]
+                added = added_block(removed)
+                if added is None:
+                    continue
+                for line in removed + added:
+                    line.keep = False
+                removed[0].kind, removed[0].keep = '\\', True
+                removed[0].text = f" [compacted] {len(removed)} line(s) moved unchanged to new line {added[0].new}"
+                added[0].kind, added[0].keep = '\\', True
+                added[0].text = f" [compacted] {len(added)} line(s) moved here unchanged from old line {removed[0].old}"
+
+    def _elide_deletions(self, hunk: List[DiffLine]):
+        """Cut deletion-only runs after max_deleted_lines"""
+        limit = self.config.max_deleted_lines
+        for run in self._runs(hunk, '-'):
+            after = run[-1] + 1
+            if len(run) <= limit or (after < len(hunk) and hunk[after].kind == '+'):
+                continue  # short, or a replacement rather than a pure deletion
+            for i in run[limit:]:
+                hunk[i].keep = False
+            last = hunk[run[-1]]
+            last.kind, last.keep = '\\', True
+            last.text = f" [compacted] {len(run) - limit} more deleted line(s) elided"
+
+    def _limit_context(self, hunk: List[DiffLine]):
+        """Keep only context lines close to a change"""
+        limit = self.config.context_lines
+        if limit < 0:
+            return
+        near = [False] * len(hunk)
+        for i, line in enumerate(hunk):
+            if line.keep and line.kind != ' ':
+                for j in range(max(0, i - limit), min(len(hunk), i + limit + 1)):
+                    near[j] = True
+        for i, line in enumerate(hunk):
+            if line.kind == ' ' and not near[i]:
+                line.keep = False
+
+    def _render(self, preamble: List[str], hunks: List[List[DiffLine]], headers: List[str]) -> str:
+        """Write kept lines, re-emitting @@ headers after every gap in numbering"""
+        out = list(preamble)
+        for hunk, section in zip(hunks, headers):
+            expected = None
+            first = True
+            for line in hunk:
+                if not line.keep:
+                    continue
+                if line.kind == '\\':
+                    if first and hunk[0].old is not None:
+                        # Note opens the hunk - keep the original hunk start in front of it
+                        expected = (hunk[0].old, hunk[0].new)
+                        out.append(f"@@ -{hunk[0].old} +{hunk[0].new} @@" + section)
+                        first = False
+                    out.append('\\' + line.text)
+                    continue
+                if (line.old, line.new) != expected:
+                    out.append(f"@@ -{line.old} +{line.new} @@" + (section if first else ""))
+                    first = False
+                out.append(line.kind + line.text)
+                expected = (line.old + (line.kind != '+'), line.new + (line.kind != '-'))
+        return "\n".join(out)
+
+    def compact(self, diff: str, file_path: str = "") -> str:
+        """Compacted diff (the original one if compaction does not make it smaller)"""
+        if not self.config.enabled or not diff:
+            return diff
+
+        preamble, hunks, headers = self._parse(diff)
+        if not hunks:
+            return diff
+
+        normalize = partial(_normalize, keep_indent=is_indent_sensitive(file_path))
+        if self.config.collapse_whitespace:
+            hunks = [self._collapse_whitespace(hunk, normalize) for hunk in hunks]
+        if self.config.collapse_moved:
+            self._collapse_moved(hunks, normalize)
+        for hunk in hunks:
+            self._elide_deletions(hunk)
+            self._limit_context(hunk)
+
+        compacted = self._render(preamble, hunks, headers) + ('\n' if diff.endswith('\n') else '')
+        return compacted if len(compacted) < len(diff) else diff
+
+    def compact_change(self, change: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a GitLab file change with compacted diff"""
+        diff = change.get('diff') or ''
+        compacted = self.compact(diff, change.get('new_path') or change.get('old_path') or '')
+        self.files += 1
+        bytes_in, bytes_out = len(diff.encode('utf-8')), len(compacted.encode('utf-8'))
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        _totals["files"] += 1
+        _totals["bytes_in"] += bytes_in
+        _totals["bytes_out"] += bytes_out
+        if compacted is diff:
+            return change
+        return {**change, 'diff': compacted}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Bytes in/out of this compactor"""
+        return _stats(self.files, self.bytes_in, self.bytes_out)
+
+
+def _stats(files: int, bytes_in: int, bytes_out: int) -> Dict[str, Any]:
+    return {
+        "files": files,
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "saved_percent": round((1 - bytes_out / bytes_in) * 100, 1) if bytes_in else 0
+    }
+
+
+# Process-wide counters of all compactors (for /api/metrics)
+_totals = {"files": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def get_compaction_stats() -> Dict[str, Any]:
+    """Bytes in/out of all compacted diffs since start"""
+    return _stats(_totals["files"], _totals["bytes_in"], _totals["bytes_out"])
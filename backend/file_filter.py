@@ -0,0 +1,185 @@
+"""
+File Filter - Classifies changed files that are not worth an LLM review
+Lock files, vendored and generated code, minified bundles, binaries and pure
+renames are dropped before prompt building. Sources of the verdict: path globs,
+`.gitattributes` linguist markers of the target repository and line-length /
+entropy heuristics on the added lines.
+"""
+
+import fnmatch
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SKIP_PATTERNS: Dict[str, List[str]] = {
+    "lock": [
+        "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+        "composer.lock", "Gemfile.lock", "Cargo.lock", "go.sum", "*.lock"
+    ],
+    "vendored": ["vendor/**", "node_modules/**", "third_party/**", "bower_components/**"],
+    "generated": [
+        "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.pb.cc", "*.pb.h", "*.g.dart", "*.generated.*",
+        "*ModelSnapshot.cs", "*.snap",
+        # Output directories only at the repository root - src/build/ may be real code.
+        # Nested ones can be excluded with ANALYSIS_SKIP_PATTERNS (e.g. "build/**")
+        "/dist/**", "/build/**"
+    ],
+    "minified": ["*.min.js", "*.min.css", "*.map"],
+    "binary": [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico", "*.pdf", "*.zip", "*.gz", "*.jar",
+        "*.woff", "*.woff2", "*.ttf", "*.eot", "*.so", "*.dll", "*.exe", "*.pyc"
+    ]
+}
+
+# Generator banners ("// Code generated by protoc-gen-go. DO NOT EDIT.", "@generated"),
+# looked for only in the first lines of the file
+GENERATED_BANNER_RE = re.compile(r'@generated\b|\bgenerated\b.*\bdo not edit\b', re.IGNORECASE)
+HEADER_LINES = 5
+HUNK_NEW_START_RE = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)')
+
+ENTROPY_MIN_LENGTH = 2000  # chars of added text before the entropy check applies
+
+
+def path_matches(path: str, pattern: str) -> bool:
+    """Match file path against a gitignore-style glob"""
+    pattern = pattern.strip()
+    anchored = pattern.startswith("/")
+    pattern = pattern.lstrip("/")
+
+    if pattern.endswith("/**") or pattern.endswith("/"):
+        directory = pattern.rstrip("*").rstrip("/")
+        if anchored or "/" in directory:
+            return path.startswith(directory + "/")
+        return path.startswith(directory + "/") or f"/{directory}/" in f"/{path}"
+
+    if "/" not in pattern and not anchored:
+        return fnmatch.fnmatch(path.rsplit("/", 1)[-1], pattern)
+    return fnmatch.fnmatch(path, pattern)
+
+
+def parse_gitattributes(content: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Extract linguist markers from .gitattributes
+
+    Returns (pattern, reason) in file order; reason None means the attribute
+    is explicitly unset and overrides earlier lines.
+    """
+    rules = []
+    for line in (content or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        pattern, *attributes = line.split()
+        for attribute in attributes:
+            name, _, value = attribute.partition("=")
+            unset = name.startswith("-") or value == "false"
+            name = name.lstrip("-!")
+            reason = {
+                "linguist-generated": "generated",
+                "linguist-vendored": "vendored",
+                "binary": "binary",
+                "diff": "binary"
+            }.get(name)
+            if reason is None:
+                continue
+            if name == "diff":
+                unset = not unset  # '-diff' marks a binary file
+            rules.append((pattern, None if unset else reason))
+    return rules
+
+
+def file_header(diff: str, max_lines: int = HEADER_LINES) -> str:
+    """First lines of the new file version if the diff shows them (empty otherwise)"""
+    header = []
+    for line in diff.split('\n'):
+        if line.startswith('@@'):
+            match = HUNK_NEW_START_RE.match(line)
+            if header or (match and int(match.group(1)) > 1):
+                break  # the rest of the diff is past the header
+            continue
+        if line.startswith(('+++', '---')):
+            continue
+        if line[:1] in (' ', '+'):
+            header.append(line[1:])
+            if len(header) == max_lines:
+                break
+    return "\n".join(header)
+
+
+def shannon_entropy(text: str) -> float:
+    """Bits per character"""
+    if not text:
+        return 0.0
+    length = len(text)
+    return -sum(count / length * math.log2(count / length) for count in Counter(text).values())
+
+
+class FileFilter:
+    """Decides per file change whether it should be sent to the LLM"""
+
+    def __init__(
+        self,
+        patterns: Optional[Dict[str, List[str]]] = None,
+        gitattributes: Optional[str] = None,
+        max_line_length: int = 500,
+        max_entropy: float = 5.8
+    ):
+        self.patterns = patterns if patterns is not None else DEFAULT_SKIP_PATTERNS
+        self.gitattributes = parse_gitattributes(gitattributes)
+        self.max_line_length = max_line_length
+        self.max_entropy = max_entropy
+
+    @classmethod
+    def from_settings(cls, gitattributes: Optional[str] = None) -> "FileFilter":
+        """Filter with default globs plus ANALYSIS_SKIP_PATTERNS"""
+        patterns = dict(DEFAULT_SKIP_PATTERNS)
+        extra = [p.strip() for p in settings.ANALYSIS_SKIP_PATTERNS.split(",") if p.strip()]
+        if extra:
+            patterns["excluded"] = extra
+        return cls(
+            patterns=patterns,
+            gitattributes=gitattributes,
+            max_line_length=settings.ANALYSIS_FILTER_MAX_LINE_LENGTH,
+            max_entropy=settings.ANALYSIS_FILTER_MAX_ENTROPY
+        )
+
+    def classify(self, change: Dict) -> Optional[str]:
+        """Reason to skip the change ('lock', 'generated', ...) or None to analyze it"""
+        path = change.get('new_path') or change.get('old_path') or ""
+        diff = change.get('diff') or ""
+
+        if not diff.strip():
+            return "renamed" if change.get('renamed_file') else "empty"
+        if diff.startswith("Binary files"):
+            return "binary"
+
+        for pattern, reason in reversed(self.gitattributes):
+            if path_matches(path, pattern):
+                if reason:
+                    return reason
+                break
+
+        for reason, patterns in self.patterns.items():
+            if any(path_matches(path, pattern) for pattern in patterns):
+                return reason
+
+        added = [line[1:] for line in diff.split('\n') if line.startswith('+') and not line.startswith('+++')]
+        if not added:
+            return None
+
+        if GENERATED_BANNER_RE.search(file_header(diff)):
+            return "generated"
+
+        added_text = "\n".join(added)
+        if len(added_text) / len(added) > self.max_line_length:
+            return "minified"
+        if len(added_text) >= ENTROPY_MIN_LENGTH and shannon_entropy(added_text[:20000]) > self.max_entropy:
+            return "high_entropy"
+
+        return None
@@ -1,122 +1,514 @@
 """
 GitLab API Client
 Handles all interactions with GitLab API
+
+Native asyncio client on top of httpx.AsyncClient: one shared keep-alive
+connection pool (HTTP/2 when the `h2` package is installed), so webhook
+handlers and the reaction poller never block the event loop on GitLab I/O.
+All requests go through one rate-limit-aware scheduler.
 """
 
-import gitlab
+import asyncio
+import copy
+import httpx
 import logging
-from typing import Dict, List, Any, Optional
+import random
+import time
+from enum import IntEnum
+from urllib.parse import quote
+from typing import Dict, List, Any, Optional, AsyncIterator
 
 from backend.config import settings
-from backend.models import AnalysisResult
+from backend.cache import TTLCache
+from backend.models import AnalysisResult, MRSnapshot, count_changed_lines
 
 logger = logging.getLogger(__name__)
 
+try:
+    import h2  # noqa: F401 - enables HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class Priority(IntEnum):
+    """Request priority in the GitLab scheduler"""
+    HIGH = 0  # user-facing review calls
+    LOW = 1   # background polling
+
+
+class GitLabRequestScheduler:
+    """
+    Central token bucket for all GitLab API calls
+    
+    Refills at a configured rate and follows GitLab's RateLimit-Remaining /
+    RateLimit-Reset headers: when the quota runs low background (LOW) calls
+    are held until the reset, when it is exhausted everything waits.
+    LOW requests also yield to any waiting HIGH request.
+    """
+    
+    def __init__(self, rate: float = 10.0, burst: int = 20, reserve: int = 5):
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.remaining: Optional[int] = None  # last RateLimit-Remaining from GitLab
+        self.blocked_until = 0.0  # monotonic time, all requests wait
+        self.low_blocked_until = 0.0  # monotonic time, LOW requests wait
+        self.waiting = {Priority.HIGH: 0, Priority.LOW: 0}
+        self.requests = {Priority.HIGH: 0, Priority.LOW: 0}
+        self.throttled = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.wait_time = 0.0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def _try_acquire(self, priority: Priority) -> float:
+        """Take a token if allowed, otherwise return seconds to wait"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if priority == Priority.LOW:
+            if now < self.low_blocked_until:
+                return self.low_blocked_until - now
+            if self.waiting[Priority.HIGH] > 0:
+                return 0.05
+        
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+    
+    async def acquire(self, priority: Priority = Priority.HIGH):
+        """Wait for permission to send one request"""
+        started = time.monotonic()
+        self.waiting[priority] += 1
+        try:
+            while True:
+                delay = self._try_acquire(priority)
+                if delay <= 0:
+                    break
+                self.throttled += 1
+                await asyncio.sleep(min(delay, 5.0))
+        finally:
+            self.waiting[priority] -= 1
+        self.requests[priority] += 1
+        self.wait_time += time.monotonic() - started
+    
+    def update_from_headers(self, headers: httpx.Headers):
+        """Adjust to the quota GitLab reports"""
+        remaining = headers.get("RateLimit-Remaining")
+        reset = headers.get("RateLimit-Reset")
+        if remaining is None:
+            return
+        
+        try:
+            self.remaining = int(remaining)
+            reset_in = max(float(reset) - time.time(), 0) if reset else 1.0
+        except ValueError:
+            return
+        
+        reset_at = time.monotonic() + reset_in
+        if self.remaining <= 0:
+            self.blocked_until = max(self.blocked_until, reset_at)
+        elif self.remaining <= self.reserve:
+            self.low_blocked_until = max(self.low_blocked_until, reset_at)
+    
+    def block_for(self, seconds: float):
+        """Stop all requests for a while (after 429)"""
+        self.rate_limited += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduler statistics"""
+        now = time.monotonic()
+        self._refill()
+        return {
+            "tokens": round(self.tokens, 1),
+            "rate": self.rate,
+            "burst": self.burst,
+            "gitlab_remaining": self.remaining,
+            "blocked_for": round(max(self.blocked_until - now, 0), 1),
+            "low_priority_blocked_for": round(max(self.low_blocked_until - now, 0), 1),
+            "requests_high": self.requests[Priority.HIGH],
+            "requests_low": self.requests[Priority.LOW],
+            "throttled": self.throttled,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "total_wait_seconds": round(self.wait_time, 1)
+        }
+
 
 class GitLabClient:
     """Client for interacting with GitLab API"""
     
     def __init__(self):
+        self.api_url = f"{settings.GITLAB_URL.rstrip('/')}/api/v4"
+        self.client = httpx.AsyncClient(
+            base_url=self.api_url,
+            headers={"PRIVATE-TOKEN": settings.GITLAB_TOKEN},
+            timeout=httpx.Timeout(settings.GITLAB_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.GITLAB_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GITLAB_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.GITLAB_KEEPALIVE_EXPIRY
+            ),
+            http2=settings.GITLAB_HTTP2 and HTTP2_AVAILABLE
+        )
+        # Project and MR metadata, revalidated with ETags once expired
+        self.cache = TTLCache(max_size=settings.GITLAB_CACHE_MAX_SIZE, ttl=settings.GITLAB_CACHE_TTL)
+        self.scheduler = GitLabRequestScheduler(
+            rate=settings.GITLAB_RATE_LIMIT_RPS,
+            burst=settings.GITLAB_RATE_LIMIT_BURST,
+            reserve=settings.GITLAB_RATE_LIMIT_RESERVE
+        )
+    
+    async def connect(self):
+        """Verify token and connectivity (replaces python-gitlab auth())"""
         try:
-            self.gl = gitlab.Gitlab(
-                url=settings.GITLAB_URL,
-                private_token=settings.GITLAB_TOKEN
-            )
-            self.gl.auth()
-            logger.info(f"✅ GitLab client connected to {settings.GITLAB_URL}")
+            user = await self._get_json("/user")
+            http_version = "HTTP/2" if settings.GITLAB_HTTP2 and HTTP2_AVAILABLE else "HTTP/1.1"
+            logger.info(f"✅ GitLab client connected to {settings.GITLAB_URL} as {user.get('username')} ({http_version})")
         except Exception as e:
             logger.error(f"❌ Failed to connect to GitLab: {str(e)}")
             raise
     
-    def get_project(self, project_id: int):
+    async def close(self):
+        """Close pooled connections"""
+        await self.client.aclose()
+    
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Retry-After if GitLab sent it, otherwise exponential backoff with full jitter"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return random.uniform(0, settings.GITLAB_RETRY_BACKOFF * (2 ** attempt))
+    
+    async def _send(self, method: str, path: str, priority: Priority = Priority.HIGH, **kwargs) -> httpx.Response:
+        """
+        Send request through the scheduler, retrying 429/5xx and network errors
+        
+        POST is retried only on 429 (GitLab rejected it before doing anything),
+        so a note is never posted twice.
+        """
+        max_retries = settings.GITLAB_MAX_RETRIES
+        
+        for attempt in range(max_retries + 1):
+            await self.scheduler.acquire(priority)
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"⚠️ GitLab {method} {path} failed ({type(e).__name__}), retry in {delay:.1f}s")
+                self.scheduler.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            
+            self.scheduler.update_from_headers(response.headers)
+            
+            retryable = response.status_code == 429 or (response.status_code >= 500 and method != "POST")
+            if not retryable or attempt >= max_retries:
+                return response
+            
+            delay = self._retry_delay(attempt, response)
+            if response.status_code == 429:
+                self.scheduler.block_for(delay)
+            logger.warning(f"⚠️ GitLab {method} {path} returned {response.status_code}, retry in {delay:.1f}s")
+            self.scheduler.retries += 1
+            await asyncio.sleep(delay)
+        
+        return response
+    
+    async def _request(self, method: str, path: str, priority: Priority = Priority.HIGH, **kwargs) -> httpx.Response:
+        """Send request to GitLab API and raise on HTTP errors"""
+        response = await self._send(method, path, priority=priority, **kwargs)
+        response.raise_for_status()
+        return response
+    
+    async def _get_json(self, path: str, params: Optional[Dict[str, Any]] = None, priority: Priority = Priority.HIGH) -> Any:
+        """GET request returning decoded JSON"""
+        response = await self._request("GET", path, priority=priority, params=params)
+        return response.json()
+    
+    async def _get_json_cached(self, path: str, max_age: Optional[float] = None, priority: Priority = Priority.HIGH) -> Any:
+        """
+        GET JSON through the metadata cache
+        
+        Fresh entries are served from memory. Expired entries are revalidated
+        with If-None-Match, an unchanged resource comes back as a cheap 304.
+        max_age=0 always revalidates (for data that must be current).
+        """
+        entry, fresh = self.cache.lookup(path, max_age=max_age)
+        if fresh:
+            return copy.deepcopy(entry.value)
+        
+        headers = {"If-None-Match": entry.etag} if entry and entry.etag else None
+        response = await self._send("GET", path, priority=priority, headers=headers)
+        
+        if response.status_code == 304 and entry:
+            self.cache.mark_revalidated(path)
+            return copy.deepcopy(entry.value)
+        
+        response.raise_for_status()
+        data = response.json()
+        self.cache.set(path, data, etag=response.headers.get("ETag"))
+        return copy.deepcopy(data)
+    
+    async def _iter_pages(self, path: str, params: Optional[Dict[str, Any]] = None, priority: Priority = Priority.HIGH) -> AsyncIterator[Any]:
+        """Yield items of a paginated list endpoint page by page"""
+        params = dict(params or {})
+        params.setdefault("per_page", 100)
+        page = 1
+        
+        while page:
+            params["page"] = page
+            response = await self._request("GET", path, priority=priority, params=params)
+            for item in response.json():
+                yield item
+            next_page = response.headers.get("X-Next-Page")
+            page = int(next_page) if next_page else None
+    
+    async def _get_all(self, path: str, params: Optional[Dict[str, Any]] = None, priority: Priority = Priority.HIGH) -> List[Any]:
+        """GET all pages of a paginated list endpoint"""
+        return [item async for item in self._iter_pages(path, params, priority=priority)]
+    
+    @staticmethod
+    def _mr_path(project_id: int, mr_iid: int) -> str:
+        return f"/projects/{project_id}/merge_requests/{mr_iid}"
+    
+    async def get_project(self, project_id: int) -> Dict[str, Any]:
         """Get GitLab project by ID"""
         try:
-            return self.gl.projects.get(project_id)
+            return await self._get_json_cached(f"/projects/{project_id}")
         except Exception as e:
             logger.error(f"❌ Failed to get project {project_id}: {str(e)}")
             raise
     
-    def get_merge_request(self, project_id: int, mr_iid: int):
+    async def get_merge_request(self, project_id: int, mr_iid: int, priority: Priority = Priority.HIGH) -> Dict[str, Any]:
         """Get Merge Request details"""
         try:
-            project = self.get_project(project_id)
-            mr = project.mergerequests.get(mr_iid)
-            logger.info(f"📋 Got MR #{mr_iid}: {mr.title}")
+            mr = await self._get_json_cached(self._mr_path(project_id, mr_iid), priority=priority)
+            logger.info(f"📋 Got MR #{mr_iid}: {mr.get('title')}")
             return mr
         except Exception as e:
             logger.error(f"❌ Failed to get MR {mr_iid}: {str(e)}")
             raise
     
-    def get_note_reactions(self, project_id: int, mr_iid: int, note_id: int) -> List[str]:
+    async def list_mr_notes(self, project_id: int, mr_iid: int, priority: Priority = Priority.HIGH) -> List[Dict[str, Any]]:
+        """Get all notes (comments) of a Merge Request"""
+        return await self._get_all(f"{self._mr_path(project_id, mr_iid)}/notes", priority=priority)
+    
+    async def get_note_reactions(self, project_id: int, mr_iid: int, note_id: int, priority: Priority = Priority.HIGH) -> List[str]:
         """Get reactions (emojis) on a MR note/comment"""
         try:
-            project = self.get_project(project_id)
-            mr = project.mergerequests.get(mr_iid)
-            note = mr.notes.get(note_id)
-            
-            # Get award emojis (reactions)
-            reactions = []
-            try:
-                awards = note.awardemojis.list(get_all=True)
-                reactions = [award.name for award in awards]
-                logger.info(f"📊 Note {note_id} has reactions: {reactions}")
-            except Exception as e:
-                logger.warning(f"⚠️ Could not get reactions for note {note_id}: {str(e)}")
-            
+            awards = await self._get_all(
+                f"{self._mr_path(project_id, mr_iid)}/notes/{note_id}/award_emoji",
+                priority=priority
+            )
+            reactions = [award['name'] for award in awards]
+            logger.info(f"📊 Note {note_id} has reactions: {reactions}")
             return reactions
         except Exception as e:
             logger.error(f"❌ Failed to get reactions for note {note_id}: {str(e)}")
             return []
     
-    def get_note_content(self, project_id: int, mr_iid: int, note_id: int) -> Optional[str]:
+    async def get_note_content(self, project_id: int, mr_iid: int, note_id: int) -> Optional[str]:
         """Get the content of a specific note/comment"""
         try:
-            project = self.get_project(project_id)
-            mr = project.mergerequests.get(mr_iid)
-            note = mr.notes.get(note_id)
-            return note.body
+            note = await self._get_json(f"{self._mr_path(project_id, mr_iid)}/notes/{note_id}")
+            return note.get('body')
         except Exception as e:
             logger.error(f"❌ Failed to get note {note_id}: {str(e)}")
             return None
     
-    def get_mr_changes(self, project_id: int, mr_iid: int) -> List[Dict]:
+    async def get_mr_changes(self, project_id: int, mr_iid: int) -> List[Dict]:
         """Get changes (diff) from Merge Request"""
+        snapshot = await self.get_mr_snapshot(project_id, mr_iid)
+        return snapshot.changes
+    
+    async def get_mr_snapshot(
+        self,
+        project_id: int,
+        mr_iid: int,
+        project: Optional[Dict[str, Any]] = None,
+        stream_changes: bool = False
+    ) -> MRSnapshot:
+        """
+        Fetch MR metadata (and changes) once and keep them for the whole review
+        
+        The /changes endpoint returns MR attributes together with the diff, so one
+        request replaces separate MR, changes and line-count lookups.
+        With stream_changes only metadata is fetched; the diff is read later
+        page by page through stream_changes().
+        """
         try:
-            project = self.get_project(project_id)
-            mr = project.mergerequests.get(mr_iid)
-            
-            # Debug: log MR state
-            logger.info(f"🔍 MR State: {mr.state}, Has conflicts: {mr.has_conflicts}, Mergeable: {getattr(mr, 'merge_status', 'unknown')}")
-            
-            # Get changes with retries
-            changes = mr.changes()
-            
-            # Debug: log what we got
-            logger.info(f"📦 Changes keys: {list(changes.keys())}")
-            logger.info(f"📦 Changes type: {type(changes)}")
+            if stream_changes:
+                # Head SHA must be current - always revalidate, unchanged MR costs a 304
+                data = await self._get_json_cached(self._mr_path(project_id, mr_iid), max_age=0)
+                file_changes = []
+            else:
+                data = await self._get_json(f"{self._mr_path(project_id, mr_iid)}/changes")
+                file_changes = data.pop('changes', None) or []
             
-            # Extract changes
-            file_changes = changes.get('changes', [])
+            logger.info(f"📋 Got MR #{mr_iid}: {data.get('title')}")
+            logger.info(f"🔍 MR State: {data.get('state')}, Has conflicts: {data.get('has_conflicts')}, Mergeable: {data.get('merge_status', 'unknown')}")
             
-            # If no changes, try diff
-            if not file_changes:
-                logger.warning("⚠️ No changes in mr.changes(), trying diffs...")
+            # If no changes, try diffs
+            if not file_changes and not stream_changes:
+                logger.warning("⚠️ No changes in MR changes, trying diffs...")
                 try:
-                    diffs = mr.diffs.list()
-                    if diffs:
-                        logger.info(f"📝 Found {len(diffs)} diffs")
-                        file_changes = [diff.attributes for diff in diffs]
+                    file_changes = await self._get_all(f"{self._mr_path(project_id, mr_iid)}/diffs")
                 except Exception as diff_err:
                     logger.warning(f"⚠️ Could not get diffs: {diff_err}")
             
-            logger.info(f"📝 Got {len(file_changes)} file changes")
+            if not stream_changes:
+                logger.info(f"📝 Got {len(file_changes)} file changes")
             
-            return file_changes
+            return MRSnapshot(
+                project_id=project_id,
+                mr_iid=mr_iid,
+                project=project or {},
+                mr=data,
+                changes=file_changes,
+                lines_changed=count_changed_lines(file_changes),
+                changes_streamed=stream_changes
+            )
             
         except Exception as e:
-            logger.error(f"❌ Failed to get MR changes: {str(e)}")
+            logger.error(f"❌ Failed to get MR snapshot: {str(e)}")
             raise
     
+    async def iter_mr_diffs(self, project_id: int, mr_iid: int, per_page: int = None) -> AsyncIterator[Dict]:
+        """
+        Stream file diffs of MR one by one over the paginated /diffs endpoint
+        
+        Unlike /changes it is not cut off on huge MRs and never holds the whole
+        change set in memory. Falls back to /changes on GitLab versions without it.
+        """
+        path = f"{self._mr_path(project_id, mr_iid)}/diffs"
+        params = {"per_page": per_page or settings.GITLAB_DIFFS_PER_PAGE}
+        
+        try:
+            async for diff in self._iter_pages(path, params):
+                yield diff
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+            logger.warning("⚠️ Paginated diffs not supported, falling back to /changes")
+            data = await self._get_json(f"{self._mr_path(project_id, mr_iid)}/changes")
+            for change in data.get('changes', []):
+                yield change
+    
+    async def stream_changes(self, snapshot: MRSnapshot) -> AsyncIterator[Dict]:
+        """Stream diffs of snapshot's MR, counting changed lines on the way"""
+        files = 0
+        async for change in self.iter_mr_diffs(snapshot.project_id, snapshot.mr_iid):
+            files += 1
+            snapshot.lines_changed += count_changed_lines([change])
+            yield change
+        logger.info(f"📝 Streamed {files} file changes ({snapshot.lines_changed} lines changed)")
+    
+    async def get_compare_changes(self, project_id: int, from_sha: str, to_sha: str) -> Optional[List[Dict]]:
+        """
+        Get changes between two commits via GitLab compare API
+        
+        Returns None when from_sha is not an ancestor of to_sha (force push / rebase),
+        in that case the delta is meaningless and a full review is needed.
+        """
+        try:
+            merge_base = await self._get_json(
+                f"/projects/{project_id}/repository/merge_base",
+                params=[("refs[]", from_sha), ("refs[]", to_sha)]
+            )
+            if merge_base.get('id') != from_sha:
+                logger.info(f"🔀 {from_sha[:8]} is not an ancestor of {to_sha[:8]}, incremental diff not possible")
+                return None
+            
+            compare = await self._get_json(
+                f"/projects/{project_id}/repository/compare",
+                params={"from": from_sha, "to": to_sha}
+            )
+            file_changes = compare.get('diffs', [])
+            logger.info(f"📝 Got {len(file_changes)} file changes between {from_sha[:8]} and {to_sha[:8]}")
+            return file_changes
+            
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to compare {from_sha[:8]}..{to_sha[:8]}: {str(e)}")
+            return None
+    
+    async def get_file_raw(self, project_id: int, file_path: str, ref: str) -> Optional[str]:
+        """
+        Get raw content of a repository file at given ref (None if it does not exist)
+        
+        File content at a commit SHA never changes, so results are kept in the cache.
+        """
+        cache_key = ("raw", project_id, file_path, ref)
+        entry, fresh = self.cache.lookup(cache_key)
+        if fresh:
+            return entry.value
+        
+        try:
+            response = await self._send(
+                "GET",
+                f"/projects/{project_id}/repository/files/{quote(file_path, safe='')}/raw",
+                params={"ref": ref}
+            )
+            if response.status_code == 404:
+                content = None
+            else:
+                response.raise_for_status()
+                content = response.text
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to get {file_path} at {ref[:8]}: {str(e)}")
+            return None
+        
+        self.cache.set(cache_key, content)
+        return content
+    
+    async def get_file_blob_id(self, project_id: int, file_path: str, ref: str) -> Optional[str]:
+        """Get blob SHA of a repository file at given ref without downloading it (None if missing)"""
+        try:
+            response = await self._send(
+                "HEAD",
+                f"/projects/{project_id}/repository/files/{quote(file_path, safe='')}",
+                params={"ref": ref}
+            )
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.headers.get("X-Gitlab-Blob-Id")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to get blob of {file_path} at {ref[:8]}: {str(e)}")
+            return None
+    
+    async def get_blob_raw(self, project_id: int, blob_id: str) -> Optional[str]:
+        """Get raw content of a blob (content addressed, cached)"""
+        cache_key = ("blob", project_id, blob_id)
+        entry, fresh = self.cache.lookup(cache_key)
+        if fresh:
+            return entry.value
+        
+        try:
+            response = await self._request("GET", f"/projects/{project_id}/repository/blobs/{blob_id}/raw")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to get blob {blob_id[:8]}: {str(e)}")
+            return None
+        
+        self.cache.set(cache_key, response.text)
+        return response.text
+    
     def _format_review_summary(self, analysis: Dict[str, Any]) -> str:
         """Format analysis result into markdown summary with ALL issues"""
         
@@ -294,30 +686,19 @@ class GitLabClient:
         
         return comment
     
-    def post_review_comments(
-        self,
-        project_id: int,
-        mr_iid: int,
-        analysis_result: Dict[str, Any]
-    ):
+    async def post_review_comments(self, snapshot: MRSnapshot, analysis_result: Dict[str, Any]):
         """Post ONE comprehensive review comment to GitLab MR"""
         try:
-            project = self.get_project(project_id)
-            mr = project.mergerequests.get(mr_iid)
-            
-            # Calculate lines changed for time estimation
-            changes = mr.changes()
-            lines_changed = 0
-            for change in changes.get('changes', []):
-                diff = change.get('diff', '')
-                # Count added/removed lines (lines starting with + or -)
-                lines_changed += len([l for l in diff.split('\n') if l.startswith('+') or l.startswith('-')])
-            
-            analysis_result['lines_changed'] = lines_changed
+            # Lines changed for time estimation were counted when the snapshot was taken
+            analysis_result['lines_changed'] = snapshot.lines_changed
             
             # Post ONE comprehensive comment with ALL issues
             summary_comment = self._format_review_summary(analysis_result)
-            mr.notes.create({'body': summary_comment})
+            await self._request(
+                "POST",
+                f"{self._mr_path(snapshot.project_id, snapshot.mr_iid)}/notes",
+                json={'body': summary_comment}
+            )
             
             total_issues = analysis_result.get('critical_count', 0) + analysis_result.get('medium_count', 0) + analysis_result.get('low_count', 0)
             logger.info(f"✅ Posted comprehensive review comment with {total_issues} issues")
@@ -326,14 +707,11 @@ class GitLabClient:
             logger.error(f"❌ Failed to post comments: {str(e)}")
             raise
     
-    def update_mr_labels(self, project_id: int, mr_iid: int, score: float):
+    async def update_mr_labels(self, snapshot: MRSnapshot, score: float):
         """Update MR labels based on analysis score"""
         try:
-            project = self.get_project(project_id)
-            mr = project.mergerequests.get(mr_iid)
-            
             # Remove old AI labels
-            current_labels = mr.labels
+            current_labels = snapshot.mr.get('labels', [])
             ai_labels = ['ai-approved', 'ai-needs-review', 'ai-needs-fixes']
             new_labels = [l for l in current_labels if l not in ai_labels]
             
@@ -346,8 +724,13 @@ class GitLabClient:
                 new_labels.append('ai-needs-fixes')
             
             # Update labels
-            mr.labels = new_labels
-            mr.save()
+            await self._request(
+                "PUT",
+                self._mr_path(snapshot.project_id, snapshot.mr_iid),
+                json={'labels': ",".join(new_labels)}
+            )
+            snapshot.mr['labels'] = new_labels
+            self.cache.invalidate(self._mr_path(snapshot.project_id, snapshot.mr_iid))
             
             logger.info(f"🏷️ Updated labels: {new_labels}")
             
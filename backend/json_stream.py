@@ -0,0 +1,98 @@
+"""
+JSON Stream - Incremental parser for streamed review responses
+Fed with response text as it arrives, it returns every element of the top-level
+`issues` array as soon as the element is complete, and raises on output that
+can no longer become the expected JSON object (so the request can be aborted
+long before max_tokens).
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+
+class MalformedResponseError(ValueError):
+    """Streamed response is not the expected JSON object"""
+    pass
+
+
+class IssueStreamParser:
+    """Scans streamed text once, tracking JSON nesting outside of strings"""
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.started = False  # '{' of the top-level object seen
+        self.fence = False  # inside the ```json line before the object
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.last_key: Optional[str] = None  # last string at the top level
+        self.issues_depth: Optional[int] = None  # depth inside the issues array
+        self.element_start: Optional[int] = None
+        self.issues_found = 0
+
+    def _element(self, end: int) -> Dict[str, Any]:
+        raw = self.text[self.element_start:end]
+        try:
+            issue = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise MalformedResponseError(f"Invalid issue #{self.issues_found + 1}: {str(e)}")
+        self.issues_found += 1
+        return issue
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Add streamed text, return issues completed by it"""
+        self.text += chunk
+        issues = []
+        text = self.text
+
+        while self.pos < len(text):
+            char = text[self.pos]
+            position = self.pos
+            self.pos += 1
+
+            if not self.started:
+                if self.fence:
+                    self.fence = char != "\n"
+                elif char == "`":
+                    self.fence = True  # ```json fence around the object
+                elif char == "{":
+                    self.started = True
+                    self.depth = 1
+                elif not char.isspace():
+                    raise MalformedResponseError(f"Response does not start with a JSON object: {text[:80]!r}")
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = text[self.string_start:position]
+                continue
+
+            if self.depth == 0:
+                continue  # trailing text after the object (closing fence)
+            if char == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif char in "{[":
+                if self.depth == self.issues_depth:
+                    if char != "{":
+                        raise MalformedResponseError("Element of 'issues' is not an object")
+                    self.element_start = position
+                self.depth += 1
+                if char == "[" and self.depth == 2 and self.last_key == "issues":
+                    self.issues_depth = 2
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == self.issues_depth and self.element_start is not None:
+                    issues.append(self._element(self.pos))
+                    self.element_start = None
+                elif self.issues_depth is not None and self.depth < self.issues_depth:
+                    self.issues_depth = None  # issues array closed
+        return issues
@@ -0,0 +1,129 @@
+"""
+LLM Hedging - Duplicate slow LLM requests to cut tail latency
+When a call has not returned by a percentile of recent latencies, the same
+prompt is sent again (to the same or an alternate provider). The first valid
+JSON answer wins and the other request is cancelled.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from backend.config import settings
+from backend.llm_provider import LLMProvider
+from backend.llm_resilience import get_resilient_provider
+
+logger = logging.getLogger(__name__)
+
+
+def is_valid_result(result: Any) -> bool:
+    """Answer that looks like a review (JSON object with a score or issues)"""
+    return isinstance(result, dict) and ("score" in result or "issues" in result)
+
+
+class HedgedProvider(LLMProvider):
+    """Provider that sends a backup request when the first one is slower than usual"""
+
+    def __init__(self, primary: LLMProvider, hedge: Optional[LLMProvider] = None, percentile: float = 95,
+                 min_samples: int = 20, initial_delay: float = 60.0, min_delay: float = 5.0):
+        self.primary = primary
+        self.hedge = hedge or primary
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.latencies = deque(maxlen=200)  # seconds of recent successful requests
+        self.name = primary.name
+        self.model_name = primary.model_name
+        self.context_window = min(primary.context_window, self.hedge.context_window)
+        self.max_output_limit = min(primary.max_output_limit, self.hedge.max_output_limit)
+        self.chars_per_token = min(primary.chars_per_token, self.hedge.chars_per_token)
+        self.requests = 0
+        self.hedged = 0
+        self.wins = {"primary": 0, "hedge": 0}
+
+    def estimate_tokens(self, text: str) -> int:
+        return self.primary.estimate_tokens(text)
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return self.primary.estimate_cost(input_tokens, output_tokens)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the first request before sending the backup"""
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(self.min_delay, latencies[index])
+
+    async def analyze_code(self, prompt: str) -> Dict[str, Any]:
+        """Analyze code, hedging the request if it is slow"""
+        self.requests += 1
+        started = time.monotonic()
+        delay = self.hedge_delay()
+        tasks = {asyncio.create_task(self.primary.analyze_code(prompt)): "primary"}
+
+        try:
+            done, _ = await asyncio.wait(set(tasks), timeout=delay)
+            if not done:
+                self.hedged += 1
+                logger.info(f"🪁 No answer from {self.primary.name} after {delay:.1f}s, sending hedged request to {self.hedge.name}")
+                tasks[asyncio.create_task(self.hedge.analyze_code(prompt))] = "hedge"
+
+            pending = set(tasks)
+            last_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None and is_valid_result(task.result()):
+                        self.wins[tasks[task]] += 1
+                        self.latencies.append(time.monotonic() - started)
+                        return task.result()
+                    last_error = error or ValueError(f"Invalid LLM response: {str(task.result())[:200]}")
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()  # the loser - stop paying for it
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hedge rate and which request won"""
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests * 100, 1) if self.requests else 0,
+            "primary_wins": self.wins["primary"],
+            "hedge_wins": self.wins["hedge"],
+            "hedge_delay_seconds": round(self.hedge_delay(), 2)
+        }
+
+
+# Hedged providers by "name:model" (for /api/metrics)
+_hedged: Dict[str, HedgedProvider] = {}
+
+
+def get_review_provider(provider_name: Optional[str] = None, model: Optional[str] = None) -> LLMProvider:
+    """Resilient provider (configured or given), hedged when LLM_HEDGING_ENABLED"""
+    provider = get_resilient_provider(provider_name, model)
+    if not settings.LLM_HEDGING_ENABLED:
+        return provider
+
+    hedge = get_resilient_provider(settings.LLM_HEDGE_PROVIDER) if settings.LLM_HEDGE_PROVIDER else None
+    hedged = HedgedProvider(
+        provider,
+        hedge,
+        percentile=settings.LLM_HEDGE_PERCENTILE,
+        min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+        initial_delay=settings.LLM_HEDGE_INITIAL_DELAY,
+        min_delay=settings.LLM_HEDGE_MIN_DELAY
+    )
+    _hedged[f"{hedged.name}:{hedged.model_name}"] = hedged
+    return hedged
+
+
+def get_hedging_stats() -> Dict[str, Any]:
+    """Stats of all hedged providers"""
+    return {name: provider.get_stats() for name, provider in _hedged.items()}
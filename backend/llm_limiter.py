@@ -0,0 +1,141 @@
+"""
+LLM Limiter - Per-provider concurrency, requests-per-minute and tokens-per-minute limits
+Requests wait in a FIFO queue until a slot is free and both minute quotas have
+room, so a burst of MRs is spread over time instead of failing together on 429s.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderLimiter:
+    """
+    Limits for all calls to one LLM provider (0 disables a limit)
+
+    RPM and TPM are token buckets refilled continuously over a minute. Prompt
+    tokens are taken before the call, response tokens after it (the bucket may
+    go into debt, delaying the next requests).
+    """
+
+    def __init__(self, name: str, max_in_flight: int = 0, rpm: int = 0, tpm: int = 0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.rpm = rpm
+        self.tpm = tpm
+        self.request_budget = float(rpm)
+        self.token_budget = float(tpm)
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        self._waiters: deque = deque()  # FIFO of futures, head may take the next slot
+        self.requests = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.waits = deque(maxlen=500)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.rpm:
+            self.request_budget = min(self.rpm, self.request_budget + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.token_budget = min(self.tpm, self.token_budget + elapsed * self.tpm / 60)
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a slot and quota if available, otherwise return seconds to wait"""
+        self._refill()
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return 0.05
+        if self.rpm and self.request_budget < 1:
+            return (1 - self.request_budget) * 60 / self.rpm
+        cost = min(tokens, self.tpm)  # a prompt larger than the quota waits for a full bucket
+        if self.tpm and self.token_budget < cost:
+            return (cost - self.token_budget) * 60 / self.tpm
+
+        self.request_budget -= 1
+        self.token_budget -= cost
+        self.in_flight += 1
+        return 0
+
+    async def acquire(self, tokens: int = 0):
+        """Wait (in arrival order) for permission to send a request of given prompt size"""
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            if self._waiters[0] is not waiter:
+                await waiter  # woken up when all earlier requests got their slot
+            while True:
+                delay = self._try_acquire(tokens)
+                if delay <= 0:
+                    break
+                self.throttled += 1
+                await asyncio.sleep(min(delay, 5.0))
+        finally:
+            self._waiters.remove(waiter)
+            if self._waiters and not self._waiters[0].done():
+                self._waiters[0].set_result(None)
+
+        waited = time.monotonic() - started
+        self.requests += 1
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.waits.append(waited)
+        if waited > 1:
+            logger.info(f"⏳ {self.name} request waited {waited:.1f}s in the provider queue")
+
+    def release(self, output_tokens: int = 0):
+        """Free the slot and account the response tokens"""
+        self.in_flight -= 1
+        if self.tpm:
+            self._refill()
+            self.token_budget -= output_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Limits, current load and queue wait times"""
+        self._refill()
+        waits = sorted(self.waits)
+        return {
+            "max_in_flight": self.max_in_flight,
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "tokens_available": round(self.token_budget) if self.tpm else None,
+            "total_wait_seconds": round(self.wait_time, 1),
+            "avg_wait_seconds": round(self.wait_time / self.requests, 2) if self.requests else 0,
+            "p95_wait_seconds": round(waits[int(len(waits) * 0.95)], 2) if waits else 0,
+            "max_wait_seconds": round(self.max_wait, 2)
+        }
+
+
+# One limiter per provider account, shared by all models (tiers) of the provider
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def get_provider_limiter(provider_name: str) -> ProviderLimiter:
+    """Limiter of a provider with settings defaults merged with LLM_PROVIDER_LIMITS[provider_name]"""
+    if provider_name not in _limiters:
+        limits = {
+            "max_in_flight": settings.LLM_MAX_IN_FLIGHT,
+            "rpm": settings.LLM_REQUESTS_PER_MINUTE,
+            "tpm": settings.LLM_TOKENS_PER_MINUTE
+        }
+        limits.update(settings.LLM_PROVIDER_LIMITS.get(provider_name, {}))
+        _limiters[provider_name] = ProviderLimiter(provider_name, **limits)
+    return _limiters[provider_name]
+
+
+def get_limiter_stats() -> Dict[str, Any]:
+    """Stats of all provider limiters"""
+    return {name: limiter.get_stats() for name, limiter in _limiters.items()}
@@ -4,60 +4,265 @@ Supports multiple AI providers: OpenAI, Gemini, Claude
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from collections import deque
+from contextlib import aclosing
+from datetime import timedelta
+from typing import Dict, Any, AsyncIterator, Optional, Tuple
+import asyncio
+import hashlib
 import json
 import logging
+import time
 
+from backend.cache import TTLCache
 from backend.config import settings
+from backend.json_stream import IssueStreamParser, MalformedResponseError
+from backend.llm_limiter import ProviderLimiter, get_provider_limiter
+from backend.models import review_response_schema
+from backend.tokens import estimate_tokens, get_tiktoken_encoding
 
 logger = logging.getLogger(__name__)
 
+# USD per 1M (input, output) tokens - used to estimate review cost
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "claude-sonnet-4-20250514": (3.00, 15.00),
+}
+
+# Streaming counters of all providers (for /api/metrics)
+_stream_stats = {"streams": 0, "aborted": 0, "issues": 0}
+_first_token_times = deque(maxlen=500)
+_first_issue_times = deque(maxlen=500)
+
+# Prompt tokens reported by providers and how many were served from their prompt cache
+_prompt_cache_stats: Dict[str, Dict[str, int]] = {}
+
+
+def record_prompt_usage(provider_name: str, prompt_tokens: int, cached_tokens: int):
+    """Account prompt tokens of one request as reported by the provider"""
+    stats = _prompt_cache_stats.setdefault(provider_name, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0})
+    stats["requests"] += 1
+    stats["prompt_tokens"] += prompt_tokens or 0
+    stats["cached_tokens"] += cached_tokens or 0
+
+
+def get_prompt_cache_stats() -> Dict[str, Any]:
+    """Cached prompt tokens per provider"""
+    return {
+        name: {
+            **stats,
+            "cached_percent": round(stats["cached_tokens"] / stats["prompt_tokens"] * 100, 1) if stats["prompt_tokens"] else 0
+        }
+        for name, stats in _prompt_cache_stats.items()
+    }
+
+
+# Schema of the review answer, enforced through each provider's structured output
+REVIEW_SCHEMA = review_response_schema()
+
+
+def to_json_schema(schema: Dict[str, Any], strict: bool = False) -> Dict[str, Any]:
+    """
+    Portable review schema -> standard JSON Schema (nullable becomes a "null" type)
+    
+    Strict mode (OpenAI) also forbids additional properties of objects.
+    """
+    result = {key: value for key, value in schema.items() if key not in ("nullable", "items", "properties")}
+    if schema.get("nullable"):
+        result["type"] = [schema["type"], "null"]
+    if "items" in schema:
+        result["items"] = to_json_schema(schema["items"], strict)
+    if "properties" in schema:
+        result["properties"] = {name: to_json_schema(value, strict) for name, value in schema["properties"].items()}
+        if strict:
+            result["additionalProperties"] = False
+    return result
+
+
+def extract_json_text(content: str) -> str:
+    """JSON text of an answer that may be wrapped in a ```json fence"""
+    if content.lstrip().startswith("{"):
+        return content  # fences inside code snippets must not be touched
+    if "```json" in content:
+        return content.split("```json")[1].split("```")[0].strip()
+    if "```" in content:
+        return content.split("```")[1].split("```")[0].strip()
+    return content
+
+
+def split_prompt(prompt: str) -> Tuple[str, str]:
+    """(stable prefix, variable rest) of a review prompt - empty prefix if unknown or caching is off"""
+    length = getattr(prompt, "prefix_length", 0) if settings.LLM_PROMPT_CACHING else 0
+    return str(prompt[:length]), str(prompt[length:])
+
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers"""
     
+    name: str = "llm"
+    model_name: str = ""
+    context_window: int = 128000  # input + output tokens
+    max_output_limit: int = 4096  # model's hard limit for response tokens
+    chars_per_token: float = 3.5  # heuristic calibration for code
+    supports_streaming: bool = False  # provider implements _stream_text
+    
+    @property
+    def streaming(self) -> bool:
+        """Whether responses are streamed (setting enabled and provider capable)"""
+        return settings.LLM_STREAMING and self.supports_streaming
+    
+    @property
+    def max_output_tokens(self) -> int:
+        """Tokens reserved for the response"""
+        return min(settings.LLM_MAX_OUTPUT_TOKENS, self.max_output_limit)
+    
+    def estimate_tokens(self, text: str) -> int:
+        """Estimate number of prompt tokens in text"""
+        return estimate_tokens(text, self.chars_per_token)
+    
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        """Estimated price of one request in USD (0 for unknown models)"""
+        input_price, output_price = MODEL_PRICES.get(self.model_name, (0.0, 0.0))
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+    
     @abstractmethod
     async def analyze_code(self, prompt: str) -> Dict[str, Any]:
         """Analyze code using LLM"""
         pass
+    
+    async def _read_stream(self, prompt: str) -> str:
+        """
+        Collect streamed response text (only for providers with supports_streaming,
+        which implement the _stream_text async generator)
+        
+        Issues are parsed as soon as they are complete (time to first issue is
+        recorded) and a response that cannot become the review JSON is aborted.
+        Without structured output the model may put prose around the JSON, so
+        such a response is buffered to the end and extracted instead.
+        """
+        parser: Optional[IssueStreamParser] = IssueStreamParser()
+        parts = []
+        started = time.monotonic()
+        _stream_stats["streams"] += 1
+        async with aclosing(self._stream_text(prompt)) as stream:
+            async for text in stream:
+                if not parts:
+                    _first_token_times.append(time.monotonic() - started)
+                parts.append(text)
+                if parser is None:
+                    continue
+                try:
+                    issues = parser.feed(text)
+                except MalformedResponseError as e:
+                    if settings.LLM_STRUCTURED_OUTPUT:
+                        _stream_stats["aborted"] += 1
+                        logger.warning(f"✂️ Aborted malformed {self.name} response after {sum(map(len, parts))} chars: {str(e)}")
+                        raise
+                    logger.info(f"📝 {self.name} response is not bare JSON, buffering it for extraction: {str(e)}")
+                    parser = None
+                    continue
+                if issues and parser.issues_found == len(issues):
+                    elapsed = time.monotonic() - started
+                    _first_issue_times.append(elapsed)
+                    logger.info(f"⚡ First issue streamed from {self.name} after {elapsed:.1f}s")
+                _stream_stats["issues"] += len(issues)
+        content = "".join(parts)
+        return content if parser else extract_json_text(content)
 
 
 class OpenAIProvider(LLMProvider):
     """OpenAI GPT provider"""
     
-    def __init__(self):
+    name = "openai"
+    context_window = 128000
+    max_output_limit = 16384
+    chars_per_token = 3.8
+    supports_streaming = True
+    
+    def __init__(self, model: Optional[str] = None):
         try:
             from openai import AsyncOpenAI
             self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            self.model = "gpt-4o-mini"  # Cost-effective model
+            self.model = model or "gpt-4o-mini"  # Cost-effective model
+            self.model_name = self.model
             logger.info(f"✅ OpenAI provider initialized with model: {self.model}")
         except Exception as e:
             logger.error(f"❌ Failed to initialize OpenAI: {str(e)}")
             raise
     
+    def estimate_tokens(self, text: str) -> int:
+        """Count tokens with tiktoken when available"""
+        encoding = get_tiktoken_encoding(self.model_name)
+        if encoding is None:
+            return super().estimate_tokens(text)
+        return len(encoding.encode(text, disallowed_special=()))
+    
+    def _request(self, prompt: str) -> Dict[str, Any]:
+        """Chat completion arguments"""
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "Ты опытный code reviewer. Отвечай ТОЛЬКО валидным JSON без дополнительного текста."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "temperature": 0.3,
+            "max_tokens": self.max_output_tokens,
+            "response_format": self._response_format()
+        }
+    
+    def _response_format(self) -> Dict[str, Any]:
+        """Structured output with the review schema (plain JSON mode if disabled)"""
+        if not settings.LLM_STRUCTURED_OUTPUT:
+            return {"type": "json_object"}
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "code_review", "strict": True, "schema": to_json_schema(REVIEW_SCHEMA, strict=True)}
+        }
+    
+    def _record_usage(self, usage):
+        """Prompt caching is automatic for the stable prompt prefix - count cached tokens"""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        record_prompt_usage(self.name, usage.prompt_tokens, getattr(details, "cached_tokens", 0))
+    
+    async def _stream_text(self, prompt: str) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            **self._request(prompt),
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    self._record_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+    
     async def analyze_code(self, prompt: str) -> Dict[str, Any]:
         """Analyze code using OpenAI GPT"""
         try:
             logger.info("🤖 Calling OpenAI API...")
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Ты опытный code reviewer. Отвечай ТОЛЬКО валидным JSON без дополнительного текста."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=4000,
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content
+            if self.streaming:
+                content = await self._read_stream(prompt)
+            else:
+                response = await self.client.chat.completions.create(**self._request(prompt))
+                self._record_usage(response.usage)
+                content = response.choices[0].message.content
             result = json.loads(content)
             
             logger.info(f"✅ OpenAI analysis complete. Score: {result.get('score', 'N/A')}")
@@ -71,33 +276,127 @@ class OpenAIProvider(LLMProvider):
 class GeminiProvider(LLMProvider):
     """Google Gemini provider"""
     
-    def __init__(self):
+    name = "gemini"
+    model_name = "gemini-2.5-flash"
+    context_window = 1048576
+    max_output_limit = 65536
+    chars_per_token = 4.0
+    supports_streaming = True
+    
+    def __init__(self, model: Optional[str] = None):
         try:
             import google.generativeai as genai
             genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-            logger.info("✅ Gemini provider initialized")
+            self.model_name = model or self.model_name
+            self.model = genai.GenerativeModel(self.model_name)
+            logger.info(f"✅ Gemini provider initialized with model: {self.model_name}")
         except Exception as e:
             logger.error(f"❌ Failed to initialize Gemini: {str(e)}")
             raise
     
+    _context_caches: Optional[TTLCache] = None  # prefix hash -> future of the cached model
+    
+    def _request(self) -> Dict[str, Any]:
+        """generate_content options (JSON constrained by the review schema)"""
+        generation_config = {"max_output_tokens": self.max_output_tokens}
+        if settings.LLM_STRUCTURED_OUTPUT:
+            generation_config["response_mime_type"] = "application/json"
+            generation_config["response_schema"] = REVIEW_SCHEMA
+        return {
+            "generation_config": generation_config,
+            "request_options": {"timeout": settings.ANALYSIS_TIMEOUT}
+        }
+    
+    async def _create_cached_model(self, prefix: str):
+        """Model bound to a new Gemini context cache holding the prompt prefix (None if not possible)"""
+        import google.generativeai as genai
+        from google.generativeai import caching
+        try:
+            cache = await asyncio.to_thread(
+                caching.CachedContent.create,
+                model=f"models/{self.model_name}",
+                contents=[prefix],
+                ttl=timedelta(seconds=settings.GEMINI_CONTEXT_CACHE_TTL)
+            )
+            logger.info(f"🧊 Created Gemini context cache for prompt prefix (~{self.estimate_tokens(prefix)} tokens)")
+            return genai.GenerativeModel.from_cached_content(cached_content=cache)
+        except Exception as e:
+            logger.warning(f"⚠️ Gemini context caching unavailable, sending full prompt: {str(e)}")
+            return None
+    
+    async def _model_for(self, prompt: str):
+        """
+        (model, contents) for a prompt - the stable prefix is served from an explicit
+        context cache when it is big enough, otherwise the full prompt is sent
+        (Gemini still caches repeated prefixes implicitly).
+        """
+        prefix, changes = split_prompt(prompt)
+        if not prefix or self.estimate_tokens(prefix) < settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+            return self.model, str(prompt)
+        
+        if self._context_caches is None:
+            # Entries expire a minute before the Gemini cache so requests never hit a deleted one
+            self._context_caches = TTLCache(
+                max_size=settings.GEMINI_CONTEXT_CACHE_MAX_SIZE,
+                ttl=max(settings.GEMINI_CONTEXT_CACHE_TTL - 60, 0)
+            )
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        creation = self._context_caches.get(key)
+        if creation is None:
+            # Concurrent chunks with the same prefix share one cache creation
+            creation = asyncio.ensure_future(self._create_cached_model(prefix))
+            self._context_caches.set(key, creation)
+        
+        try:
+            model = await asyncio.shield(creation)  # a cancelled request must not cancel the shared creation
+        except Exception as e:
+            logger.warning(f"⚠️ Gemini context cache creation failed: {str(e)}")
+            model = None
+        if model is None:
+            # Failed creation - forget it so a later request tries again
+            if self._context_caches.get(key) is creation:
+                self._context_caches.invalidate(key)
+            return self.model, str(prompt)
+        return model, changes
+    
+    def _record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            record_prompt_usage(self.name, usage.prompt_token_count, getattr(usage, "cached_content_token_count", 0))
+    
+    async def _stream_text(self, prompt: str) -> AsyncIterator[str]:
+        model, contents = await self._model_for(prompt)
+        response = await model.generate_content_async(contents, stream=True, **self._request())
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # chunk without text parts (e.g. finish reason only)
+            if text:
+                yield text
+        self._record_usage(response)
+    
     async def analyze_code(self, prompt: str) -> Dict[str, Any]:
         """Analyze code using Gemini"""
         try:
             logger.info("🤖 Calling Gemini API...")
             logger.info(f"📝 Prompt length: {len(prompt)} chars")
             
-            response = self.model.generate_content(prompt)
-            content = response.text
+            # Async API - the event loop keeps serving while Gemini answers and
+            # cancellation (asyncio.wait_for timeout) aborts the underlying request
+            if self.streaming:
+                content = await self._read_stream(prompt)
+            else:
+                model, contents = await self._model_for(prompt)
+                response = await model.generate_content_async(contents, **self._request())
+                self._record_usage(response)
+                content = response.text
             
             # Log raw response
             logger.info(f"📦 Raw Gemini response (first 500 chars): {content[:500]}")
             
             # Try to extract JSON from response
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
+            content = extract_json_text(content)
             
             logger.info(f"📦 Extracted JSON (first 300 chars): {content[:300]}")
             
@@ -116,18 +415,10 @@ class GeminiProvider(LLMProvider):
                     fixed_content = re.sub(r',(\s*[}\]])', r'\1', content)
                     result = json.loads(fixed_content)
                     logger.warning("⚠️ JSON fixed with regex, proceeding")
-                except:
-                    # If still fails, return minimal valid response
-                    logger.error("❌ Could not fix JSON, returning fallback")
-                    return {
-                        "summary": "Analysis failed due to invalid AI response format. Please try again.",
-                        "score": 5.0,
-                        "issues": [],
-                        "recommendation": "needs_review",
-                        "critical_count": 0,
-                        "medium_count": 0,
-                        "low_count": 0
-                    }
+                except json.JSONDecodeError:
+                    # Retried / sent to a fallback provider instead of caching a fake verdict
+                    logger.error("❌ Could not fix JSON")
+                    raise json_error
             
             logger.info(f"✅ Gemini analysis complete. Score: {result.get('score', 'N/A')}")
             return result
@@ -140,41 +431,90 @@ class GeminiProvider(LLMProvider):
 class ClaudeProvider(LLMProvider):
     """Anthropic Claude provider"""
     
-    def __init__(self):
+    name = "claude"
+    REVIEW_TOOL = "submit_review"
+    context_window = 200000
+    max_output_limit = 4096
+    chars_per_token = 3.3
+    supports_streaming = True
+    
+    def __init__(self, model: Optional[str] = None):
         try:
             from anthropic import AsyncAnthropic
             self.client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
-            self.model = "claude-3-haiku-20240307"  # Fast and cost-effective
+            self.model = model or "claude-3-haiku-20240307"  # Fast and cost-effective
+            self.model_name = self.model
             logger.info(f"✅ Claude provider initialized with model: {self.model}")
         except Exception as e:
             logger.error(f"❌ Failed to initialize Claude: {str(e)}")
             raise
     
+    def _request(self, prompt: str) -> Dict[str, Any]:
+        """Messages API arguments - the stable prompt prefix is marked as a cache breakpoint"""
+        prefix, changes = split_prompt(prompt)
+        content: Any = str(prompt)
+        if prefix:
+            content = [
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": changes}
+            ]
+        request = {
+            "model": self.model,
+            "max_tokens": self.max_output_tokens,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ]
+        }
+        if settings.LLM_STRUCTURED_OUTPUT:
+            # Structured output through a forced tool call with the review schema as input
+            request["tools"] = [{
+                "name": self.REVIEW_TOOL,
+                "description": "Submit the code review result",
+                "input_schema": to_json_schema(REVIEW_SCHEMA)
+            }]
+            request["tool_choice"] = {"type": "tool", "name": self.REVIEW_TOOL}
+        return request
+    
+    def _response_text(self, response) -> str:
+        """Review JSON of a response - input of the review tool call or the text answer"""
+        for block in response.content:
+            if block.type == "tool_use" and block.name == self.REVIEW_TOOL:
+                return json.dumps(block.input, ensure_ascii=False)
+        return "".join(block.text for block in response.content if block.type == "text")
+    
+    def _record_usage(self, usage):
+        if usage is None:
+            return
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        record_prompt_usage(self.name, usage.input_tokens + cache_read + cache_write, cache_read)
+    
+    async def _stream_text(self, prompt: str) -> AsyncIterator[str]:
+        async with self.client.messages.stream(**self._request(prompt)) as stream:
+            async for event in stream:
+                if event.type == "input_json":
+                    yield event.partial_json  # review tool input
+                elif event.type == "text":
+                    yield event.text
+            self._record_usage((await stream.get_final_message()).usage)
+    
     async def analyze_code(self, prompt: str) -> Dict[str, Any]:
         """Analyze code using Claude"""
         try:
             logger.info("🤖 Calling Claude API...")
             
-            response = await self.client.messages.create(
-                model=self.model,
-                max_tokens=4000,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
-            
-            content = response.content[0].text
+            if self.streaming:
+                content = await self._read_stream(prompt)
+            else:
+                response = await self.client.messages.create(**self._request(prompt))
+                self._record_usage(response.usage)
+                content = self._response_text(response)
             
             # Try to extract JSON from response
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            result = json.loads(content)
+            result = json.loads(extract_json_text(content))
             
             logger.info(f"✅ Claude analysis complete. Score: {result.get('score', 'N/A')}")
             return result
@@ -184,16 +524,62 @@ class ClaudeProvider(LLMProvider):
             raise
 
 
-def get_llm_provider() -> LLMProvider:
-    """Factory function to get the configured LLM provider"""
+def get_streaming_stats() -> Dict[str, Any]:
+    """Streamed responses, aborts and time to first token / issue"""
+    def percentiles(times) -> Dict[str, float]:
+        ordered = sorted(times)
+        if not ordered:
+            return {"avg": 0, "p95": 0}
+        return {
+            "avg": round(sum(ordered) / len(ordered), 2),
+            "p95": round(ordered[int(len(ordered) * 0.95)], 2)
+        }
+    
+    return {
+        **_stream_stats,
+        "time_to_first_token": percentiles(_first_token_times),
+        "time_to_first_issue": percentiles(_first_issue_times)
+    }
+
+
+class RateLimitedProvider(LLMProvider):
+    """Provider whose calls go through the provider's concurrency/RPM/TPM limiter"""
+    
+    def __init__(self, provider: LLMProvider, limiter: ProviderLimiter):
+        self.provider = provider
+        self.limiter = limiter
+        self.name = provider.name
+        self.model_name = provider.model_name
+        self.context_window = provider.context_window
+        self.max_output_limit = provider.max_output_limit
+        self.chars_per_token = provider.chars_per_token
+    
+    def estimate_tokens(self, text: str) -> int:
+        return self.provider.estimate_tokens(text)
+    
+    async def analyze_code(self, prompt: str) -> Dict[str, Any]:
+        """Wait for the limiter, then analyze code with the wrapped provider"""
+        await self.limiter.acquire(self.estimate_tokens(prompt))
+        output_tokens = 0
+        try:
+            result = await self.provider.analyze_code(prompt)
+            output_tokens = self.estimate_tokens(json.dumps(result, ensure_ascii=False))
+            return result
+        finally:
+            self.limiter.release(output_tokens)
+
+
+def get_llm_provider(provider_name: Optional[str] = None, model: Optional[str] = None) -> LLMProvider:
+    """Factory function to get the configured (or given) LLM provider, wrapped in its limiter"""
     
-    provider_name = settings.LLM_PROVIDER.lower()
+    provider_name = (provider_name or settings.LLM_PROVIDER).lower()
     
     if provider_name == "openai":
-        return OpenAIProvider()
+        provider = OpenAIProvider(model)
     elif provider_name == "gemini":
-        return GeminiProvider()
+        provider = GeminiProvider(model)
     elif provider_name == "claude":
-        return ClaudeProvider()
+        provider = ClaudeProvider(model)
     else:
         raise ValueError(f"Unsupported LLM provider: {provider_name}")
+    return RateLimitedProvider(provider, get_provider_limiter(provider_name))
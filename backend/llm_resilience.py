@@ -0,0 +1,282 @@
+"""
+LLM Resilience - Retries, circuit breakers and fallback providers for LLM calls
+Transient errors (429, 5xx, timeouts, broken responses) are retried with jittered
+exponential backoff. A provider that keeps failing is cut off by its circuit
+breaker for a while, and requests go down the fallback chain (e.g. gemini ->
+openai -> claude), so an outage costs seconds of latency instead of failed reviews.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.config import settings
+from backend.json_stream import MalformedResponseError
+from backend.llm_provider import LLMProvider, get_llm_provider
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = (
+    "Timeout", "Connection", "RateLimit", "ResourceExhausted", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "Overloaded", "TooManyRequests"
+)
+
+API_KEYS = {
+    "openai": lambda: settings.OPENAI_API_KEY,
+    "gemini": lambda: settings.GEMINI_API_KEY,
+    "claude": lambda: settings.ANTHROPIC_API_KEY,
+}
+MIN_ATTEMPT_TIME = 1.0  # seconds - a shorter attempt is not worth sending
+
+
+class LLMUnavailableError(Exception):
+    """Every provider of the chain failed or is cut off by its circuit breaker"""
+    pass
+
+
+class AttemptTimeoutError(asyncio.TimeoutError):
+    """Provider did not answer within the per-attempt deadline"""
+    pass
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status of an SDK error (OpenAI/Anthropic status_code, Google API code)"""
+    for attribute in ("status_code", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient error worth another attempt (rate limit, overload, timeout, broken JSON)"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, json.JSONDecodeError, MalformedResponseError)):
+        return True
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(name in type(error).__name__ for name in RETRYABLE_ERRORS)
+
+
+def retry_delay(attempt: int, error: Optional[Exception] = None) -> float:
+    """Retry-After sent by the provider, otherwise exponential backoff with full jitter"""
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.LLM_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(settings.LLM_RETRY_BACKOFF * (2 ** attempt), settings.LLM_RETRY_MAX_DELAY))
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing provider
+
+    Opens after `failure_threshold` consecutive failures, lets one trial call
+    through after `reset_timeout` (half-open) and closes again on its success.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial_running:
+                logger.warning(f"🔌 Circuit breaker of {self.name} opened after {self.failures} failure(s)")
+                self.opened += 1
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+    def release_trial(self):
+        """Trial call ended without a verdict on provider health - the next call may try again"""
+        self.trial_running = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "opened": self.opened}
+
+
+# One breaker per provider account, shared by all chains
+_breakers: Dict[str, CircuitBreaker] = {}
+_counters = {"requests": 0, "retries": 0, "fallbacks": 0, "failed": 0}
+
+
+def get_breaker(provider_name: str) -> CircuitBreaker:
+    if provider_name not in _breakers:
+        _breakers[provider_name] = CircuitBreaker(
+            provider_name,
+            failure_threshold=settings.LLM_BREAKER_FAILURES,
+            reset_timeout=settings.LLM_BREAKER_RESET
+        )
+    return _breakers[provider_name]
+
+
+class ResilientProvider(LLMProvider):
+    """Provider that retries transient errors and falls back to the next provider of the chain"""
+
+    def __init__(self, chain: List[LLMProvider], max_retries: int = 2, attempt_timeout: float = 0,
+                 total_timeout: float = 0):
+        self.chain = chain
+        self.max_retries = max_retries
+        self.attempt_timeout = attempt_timeout  # seconds, 0 - no deadline per attempt
+        self.total_timeout = total_timeout  # seconds for the whole chain, 0 - unlimited
+        primary = chain[0]
+        self.name = primary.name
+        self.model_name = ">".join(f"{p.name}:{p.model_name}" for p in chain) if len(chain) > 1 else primary.model_name
+        # A chunk must fit every provider it may fall back to
+        self.context_window = min(p.context_window for p in chain)
+        self.max_output_limit = min(p.max_output_limit for p in chain)
+        self.chars_per_token = min(p.chars_per_token for p in chain)
+
+    def estimate_tokens(self, text: str) -> int:
+        return self.chain[0].estimate_tokens(text)
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return self.chain[0].estimate_cost(input_tokens, output_tokens)
+
+    def _provider_deadline(self, deadline: Optional[float], position: int) -> Optional[float]:
+        """Deadline of a provider - an equal share of the time left, so fallbacks still get their turn"""
+        if deadline is None:
+            return None
+        providers_left = sum(1 for p in self.chain[position:] if get_breaker(p.name).state != "open")
+        now = time.monotonic()
+        return now + (deadline - now) / max(providers_left, 1)
+
+    def _attempt_timeout(self, provider_deadline: Optional[float]) -> Optional[float]:
+        """Seconds the next attempt may take (None - no limit)"""
+        limits = [self.attempt_timeout] if self.attempt_timeout else []
+        if provider_deadline is not None:
+            limits.append(provider_deadline - time.monotonic())
+        return min(limits) if limits else None
+
+    async def _attempt(self, provider: LLMProvider, prompt: str, timeout: Optional[float]) -> Dict[str, Any]:
+        """One call, cut off after timeout so a hanging provider leaves time for retries and fallbacks"""
+        if timeout is None:
+            return await provider.analyze_code(prompt)
+        try:
+            return await asyncio.wait_for(provider.analyze_code(prompt), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise AttemptTimeoutError(f"{provider.name} did not answer within {timeout:.0f}s")
+
+    async def analyze_code(self, prompt: str) -> Dict[str, Any]:
+        """Analyze code with the first provider of the chain that answers"""
+        _counters["requests"] += 1
+        last_error: Optional[Exception] = None
+        deadline = time.monotonic() + self.total_timeout if self.total_timeout else None
+
+        for position, provider in enumerate(self.chain):
+            breaker = get_breaker(provider.name)
+            if deadline is not None and deadline - time.monotonic() < MIN_ATTEMPT_TIME:
+                logger.warning(f"⏱️ No time left for {provider.name} within {self.total_timeout:.0f}s")
+                break
+            if not breaker.allow():
+                logger.info(f"🔌 Skipping {provider.name}: circuit breaker is {breaker.state}")
+                continue
+            if position > 0:
+                _counters["fallbacks"] += 1
+                logger.warning(f"↪️ Falling back to {provider.name}:{provider.model_name}")
+
+            has_fallback = position < len(self.chain) - 1
+            provider_deadline = self._provider_deadline(deadline, position)
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = await self._attempt(provider, prompt, self._attempt_timeout(provider_deadline))
+                    breaker.record_success()
+                    return result
+                except asyncio.CancelledError:
+                    breaker.release_trial()
+                    raise
+                except Exception as e:
+                    last_error = e
+                    retryable = is_retryable(e)
+                    if retryable or error_status(e) in (401, 403):
+                        breaker.record_failure()
+                    else:
+                        breaker.release_trial()  # a bad request says nothing about provider health
+                    # A hanging provider is not retried while another one may answer in time
+                    hung = isinstance(e, AttemptTimeoutError) and has_fallback
+                    if not retryable or hung or attempt == self.max_retries or not breaker.allow():
+                        logger.warning(f"⚠️ {provider.name} failed ({'transient' if retryable else 'permanent'}): {e!r}")
+                        break
+                    delay = retry_delay(attempt, e)
+                    if provider_deadline is not None and time.monotonic() + delay + MIN_ATTEMPT_TIME > provider_deadline:
+                        logger.warning(f"⚠️ {provider.name} failed, no time left to retry: {e!r}")
+                        breaker.release_trial()
+                        break
+                    _counters["retries"] += 1
+                    logger.warning(f"🔄 {provider.name} error {e!r}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+        _counters["failed"] += 1
+        raise LLMUnavailableError(f"All LLM providers failed, last error: {last_error!r}") from last_error
+
+
+def get_resilient_provider(provider_name: Optional[str] = None, model: Optional[str] = None) -> ResilientProvider:
+    """Provider (configured or given) followed by LLM_FALLBACK_PROVIDERS that have an API key"""
+    provider_name = (provider_name or settings.LLM_PROVIDER).lower()
+    chain = [get_llm_provider(provider_name, model)]
+
+    for fallback in (p.strip().lower() for p in settings.LLM_FALLBACK_PROVIDERS.split(",")):
+        if not fallback or fallback == provider_name or not API_KEYS.get(fallback, lambda: None)():
+            continue
+        try:
+            chain.append(_fallback_provider(fallback))
+        except Exception as e:
+            logger.warning(f"⚠️ Fallback provider {fallback} unavailable: {str(e)}")
+
+    return ResilientProvider(
+        chain,
+        max_retries=settings.LLM_MAX_RETRIES,
+        attempt_timeout=settings.LLM_ATTEMPT_TIMEOUT,
+        total_timeout=settings.ANALYSIS_TIMEOUT
+    )
+
+
+_fallbacks: Dict[str, LLMProvider] = {}
+
+
+def _fallback_provider(provider_name: str) -> LLMProvider:
+    """Default model of a fallback provider (shared by all chains)"""
+    if provider_name not in _fallbacks:
+        _fallbacks[provider_name] = get_llm_provider(provider_name)
+    return _fallbacks[provider_name]
+
+
+def get_resilience_stats() -> Dict[str, Any]:
+    """Retry/fallback counters and circuit breaker states"""
+    return {**_counters, "breakers": {name: breaker.get_stats() for name, breaker in _breakers.items()}}
@@ -5,21 +5,33 @@ ForteBank Hackathon 2025
 
 from fastapi import FastAPI, Request, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 from typing import Optional
 
 from backend.config import settings
-from backend.models import WebhookPayload, HealthResponse, AISettings
+from backend.models import WebhookPayload, HealthResponse, AISettings, count_changed_lines, mr_head_sha
 from backend.gitlab_client import GitLabClient
 from backend.code_analyzer import CodeAnalyzer
+from backend.model_router import ModelRouter
+from backend.llm_limiter import get_limiter_stats
+from backend.llm_resilience import get_resilience_stats
+from backend.llm_hedging import get_hedging_stats
+from backend.llm_provider import get_streaming_stats, get_prompt_cache_stats
+from backend.file_filter import FileFilter
+from backend.diff_compactor import CompactionConfig, DiffCompactor, get_compaction_stats
+from backend.repo_rules import load_repo_rules, get_rules_cache_stats
 from backend.feedback import learning_system, Feedback
-from backend.database import init_db, close_db, save_review, get_stats as get_db_stats, clear_all_reviews
+from backend.database import (
+    init_db, close_db, save_review, get_stats as get_db_stats, clear_all_reviews, is_db_available,
+    get_reviewed_head_sha, get_mr_review_state, save_reviewed_head_sha
+)
 from backend.reaction_poller import start_reaction_poller, stop_reaction_poller
+from backend.review_queue import ReviewJob, QueueFullError, start_review_queue, stop_review_queue, get_review_queue
 import json
 from pathlib import Path
-import time
-from collections import defaultdict
 
 # Configure logging
 logging.basicConfig(
@@ -28,11 +40,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Cache for preventing duplicate processing
-# Format: {(project_id, mr_iid): last_processed_timestamp}
-processed_mrs_cache = defaultdict(float)
-DUPLICATE_THRESHOLD = 60  # seconds - don't process same MR within 60 seconds
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -45,12 +52,26 @@ async def lifespan(app: FastAPI):
     
     # Initialize GitLab client
     app.state.gitlab_client = GitLabClient()
+    await app.state.gitlab_client.connect()
     logger.info("✅ GitLab client initialized")
     
     # Initialize Code Analyzer
     app.state.code_analyzer = CodeAnalyzer()
     logger.info("✅ Code Analyzer initialized")
     
+    # Start review workers
+    start_review_queue(
+        run_review,
+        workers=settings.REVIEW_WORKERS,
+        max_size=settings.REVIEW_QUEUE_MAX_SIZE,
+        durable=is_db_available(),
+        lease_seconds=settings.REVIEW_JOB_LEASE_SECONDS,
+        max_attempts=settings.REVIEW_JOB_MAX_ATTEMPTS,
+        poll_interval=settings.REVIEW_QUEUE_POLL_INTERVAL,
+        retry_delay=settings.REVIEW_JOB_RETRY_DELAY
+    )
+    logger.info(f"✅ Review queue started ({settings.REVIEW_WORKERS} workers)")
+    
     # Start reaction poller (проверяет reactions каждые 60 секунд)
     start_reaction_poller(app.state.gitlab_client, check_interval=60)
     logger.info("✅ Reaction poller started (checking every 60s)")
@@ -63,6 +84,10 @@ async def lifespan(app: FastAPI):
     # Cleanup
     logger.info("👋 Shutting down...")
     stop_reaction_poller()
+    await stop_review_queue()
+    if app.state.code_analyzer.static_analyzer:
+        app.state.code_analyzer.static_analyzer.shutdown()
+    await app.state.gitlab_client.close()
     close_db()
 
 
@@ -112,6 +137,7 @@ async def gitlab_webhook(
     """
     GitLab webhook endpoint
     Receives notifications about Merge Request events
+    Validates the event and enqueues a review job, analysis runs in background workers
     """
     logger.info("📨 Received GitLab webhook")
     
@@ -144,73 +170,191 @@ async def gitlab_webhook(
         mr_data['project_id'] = project_id
         logger.info(f"✅ Added project_id to mr_data: {project_id}")
         
-        # Check for duplicate processing
-        mr_key = (project_id, mr_iid)
-        current_time = time.time()
-        last_processed = processed_mrs_cache.get(mr_key, 0)
+        # Idempotency: the same head commit is never reviewed twice.
+        # Title/label/assignee updates keep the head SHA, so they stop here
+        head_sha = mr_head_sha(mr_data)
+        if head_sha and await asyncio.to_thread(get_reviewed_head_sha, project_id, mr_iid) == head_sha:
+            logger.info(f"⏭️ MR #{mr_iid} already reviewed at {head_sha[:8]}, skipping")
+            return {"status": "skipped", "reason": "Head commit already reviewed", "head_sha": head_sha}
         
-        if current_time - last_processed < DUPLICATE_THRESHOLD:
-            logger.info(f"⏭️ Skipping duplicate webhook for MR #{mr_iid} (processed {int(current_time - last_processed)}s ago)")
-            return {"status": "skipped", "reason": "Duplicate webhook within threshold"}
+        queue = get_review_queue()
+        if queue is None:
+            raise HTTPException(status_code=503, detail="Review queue is not running")
         
-        # Mark as processing
-        processed_mrs_cache[mr_key] = current_time
-        
-        logger.info(f"🔍 Processing MR #{mr_iid} in project {project_id}")
-        
-        # Get clients from app state
-        gitlab_client: GitLabClient = request.app.state.gitlab_client
-        code_analyzer: CodeAnalyzer = request.app.state.code_analyzer
-        
-        # Fetch MR details and changes
-        mr = gitlab_client.get_merge_request(project_id, mr_iid)
-        changes = gitlab_client.get_mr_changes(project_id, mr_iid)
-        
-        if not changes:
-            logger.info("ℹ️ No changes to analyze")
-            return {"status": "success", "message": "No changes to analyze"}
-        
-        # Analyze code with custom rules from settings
-        logger.info("🤖 Starting AI analysis...")
-        custom_rules = current_settings.get("custom_rules", "")
-        if custom_rules:
-            logger.info(f"📋 Using custom rules ({len(custom_rules)} chars)")
-        analysis_result = await code_analyzer.analyze_changes(changes, mr_data, custom_rules=custom_rules)
-        
-        # Post results to GitLab
-        logger.info("💬 Posting analysis results to GitLab...")
-        gitlab_client.post_review_comments(
+        # Enqueue review job with custom rules from current settings.
+        # A newer event for the same MR replaces the pending job and cancels the running one
+        job = ReviewJob(
             project_id=project_id,
             mr_iid=mr_iid,
-            analysis_result=analysis_result
+            mr_data=mr_data,
+            project=payload.get('project', {}),
+            head_sha=head_sha,
+            custom_rules=current_settings.get("custom_rules", "")
         )
-        
-        # Update MR labels based on analysis
-        if settings.AUTO_LABEL_MR:
-            gitlab_client.update_mr_labels(
-                project_id=project_id,
-                mr_iid=mr_iid,
-                score=analysis_result['score']
-            )
-        
-        # Save to database
-        logger.info(f"💾 Saving to DB - project_id in mr_data: {mr_data.get('project_id')}, mr_iid: {mr_iid}")
-        save_review(mr_data, analysis_result)
-        
-        logger.info(f"✅ Analysis complete! Score: {analysis_result['score']}/10")
-        
-        return {
-            "status": "success",
-            "message": "Code review completed",
-            "score": analysis_result['score'],
-            "issues_found": len(analysis_result['issues'])
-        }
-        
+        try:
+            queue_status = await queue.enqueue(job)
+        except QueueFullError as e:
+            logger.warning(f"⚠️ {str(e)}")
+            raise HTTPException(status_code=503, detail=str(e))
+        
+        if queue_status == "duplicate":
+            return {"status": "skipped", "reason": "Head commit is already being reviewed", "head_sha": head_sha}
+        
+        return JSONResponse(status_code=202, content={
+            "status": "accepted",
+            "message": "Code review queued",
+            "queue_status": queue_status,
+            "project_id": project_id,
+            "mr_iid": mr_iid,
+            "head_sha": head_sha,
+            "job_id": job.job_id
+        })
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error processing webhook: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def run_review(job: ReviewJob):
+    """Run full review of one MR: fetch changes, analyze, post results and save"""
+    project_id = job.project_id
+    mr_iid = job.mr_iid
+    mr_data = job.mr_data
+    
+    logger.info(f"🔍 Processing MR #{mr_iid} in project {project_id}")
+    
+    # Get clients from app state
+    gitlab_client: GitLabClient = app.state.gitlab_client
+    code_analyzer: CodeAnalyzer = app.state.code_analyzer
+    
+    # Job may have been queued before an earlier job finished reviewing the same commit
+    review_state = await asyncio.to_thread(get_mr_review_state, project_id, mr_iid)
+    if job.head_sha and review_state and review_state['head_sha'] == job.head_sha:
+        logger.info(f"⏭️ MR #{mr_iid} already reviewed at {job.head_sha[:8]}, skipping")
+        return
+    
+    # Fetch MR metadata and changes once, every later step reuses this snapshot
+    snapshot = await gitlab_client.get_mr_snapshot(
+        project_id,
+        mr_iid,
+        project=job.project,
+        stream_changes=settings.GITLAB_STREAM_DIFFS
+    )
+    head_sha = snapshot.head_sha or job.head_sha
+    
+    # Incremental mode: review only commits pushed since the last review
+    changes = None
+    previous_result = None
+    if settings.INCREMENTAL_REVIEW and review_state and review_state.get('result') and head_sha:
+        changes = await gitlab_client.get_compare_changes(project_id, review_state['head_sha'], head_sha)
+        if changes is not None:
+            previous_result = review_state['result']
+            if snapshot.changes_streamed:
+                # Full diff is not downloaded - estimate MR size from previous review plus the delta
+                snapshot.lines_changed = previous_result.get('lines_changed', 0) + count_changed_lines(changes)
+            logger.info(f"➕ Incremental review {review_state['head_sha'][:8]}..{head_sha[:8]} ({len(changes)} files)")
+    
+    if changes is None:
+        changes = gitlab_client.stream_changes(snapshot) if snapshot.changes_streamed else snapshot.changes
+    
+    # Lock, generated and vendored files (incl. linguist markers of the repository) are not analyzed
+    file_filter = None
+    if settings.ANALYSIS_FILTER_ENABLED and head_sha:
+        gitattributes = await gitlab_client.get_file_raw(project_id, ".gitattributes", head_sha)
+        file_filter = FileFilter.from_settings(gitattributes)
+    
+    # Analyze code with custom rules captured when the job was queued
+    logger.info("🤖 Starting AI analysis...")
+    custom_rules = job.custom_rules
+    
+    # Rules file of the repository: machine-checkable rules run locally, the rest goes to the prompt
+    repo_checks = None
+    project_rules = None
+    if settings.REPO_RULES_ENABLED and head_sha:
+        repo_rules = await load_repo_rules(gitlab_client, project_id, head_sha)
+        if repo_rules:
+            checked_locally = code_analyzer.static_analyzer is not None
+            if checked_locally and not repo_rules.checks.is_empty():
+                repo_checks = repo_rules.checks.model_dump(mode="json")
+            project_rules = repo_rules.prompt(include_checked=not checked_locally) or None
+    
+    if custom_rules:
+        logger.info(f"📋 Using custom rules ({len(custom_rules)} chars)")
+    if project_rules:
+        logger.info(f"📋 Using rules of the repository ({len(project_rules)} chars)")
+    analysis_result = await code_analyzer.analyze_changes(
+        changes,
+        mr_data,
+        custom_rules=custom_rules,
+        previous_result=previous_result,
+        file_filter=file_filter,
+        compactor=DiffCompactor(CompactionConfig.for_project(project_id)),
+        repo_checks=repo_checks,
+        project_rules=project_rules
+    )
+    
+    if analysis_result is None:
+        logger.info("ℹ️ No changes to analyze")
+        if previous_result is not None:
+            await asyncio.to_thread(save_reviewed_head_sha, project_id, mr_iid, head_sha, previous_result)
+        return
+    
+    # Post results to GitLab
+    logger.info("💬 Posting analysis results to GitLab...")
+    await gitlab_client.post_review_comments(snapshot, analysis_result)
+    
+    # Update MR labels based on analysis
+    if settings.AUTO_LABEL_MR:
+        await gitlab_client.update_mr_labels(snapshot, score=analysis_result['score'])
+    
+    # Save to database
+    logger.info(f"💾 Saving to DB - project_id in mr_data: {mr_data.get('project_id')}, mr_iid: {mr_iid}")
+    await asyncio.to_thread(save_review, mr_data, analysis_result)
+    await asyncio.to_thread(save_reviewed_head_sha, project_id, mr_iid, head_sha, analysis_result)
+    
+    logger.info(f"✅ Analysis complete! Score: {analysis_result['score']}/10")
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Get internal performance counters (for monitoring)"""
+    metrics = {}
+    
+    gitlab_client: Optional[GitLabClient] = getattr(app.state, "gitlab_client", None)
+    if gitlab_client:
+        metrics["gitlab_cache"] = gitlab_client.cache.get_stats()
+        metrics["gitlab_scheduler"] = gitlab_client.scheduler.get_stats()
+    
+    metrics["diff_compaction"] = get_compaction_stats()
+    metrics["repo_rules_cache"] = get_rules_cache_stats()
+    
+    code_analyzer = getattr(app.state, "code_analyzer", None)
+    if code_analyzer and code_analyzer.cache:
+        metrics["review_cache"] = code_analyzer.cache.get_stats()
+    if code_analyzer and code_analyzer.static_analyzer:
+        metrics["static_analysis"] = code_analyzer.static_analyzer.get_stats()
+    if code_analyzer and isinstance(code_analyzer.llm_provider, ModelRouter):
+        metrics["model_routing"] = code_analyzer.llm_provider.get_stats()
+    metrics["llm_limits"] = get_limiter_stats()
+    metrics["llm_resilience"] = get_resilience_stats()
+    metrics["llm_hedging"] = get_hedging_stats()
+    metrics["llm_streaming"] = get_streaming_stats()
+    metrics["llm_prompt_cache"] = get_prompt_cache_stats()
+    
+    return metrics
+
+
+@app.get("/api/queue")
+async def get_queue_stats():
+    """Get review queue statistics"""
+    queue = get_review_queue()
+    if queue is None:
+        return {"running": False}
+    return {"running": True, **await queue.get_stats()}
+
+
 @app.post("/webhook/gitlab/note")
 async def gitlab_note_webhook(
     request: Request,
@@ -253,7 +397,7 @@ async def gitlab_note_webhook(
         
         # Get reactions on this comment
         gitlab_client: GitLabClient = request.app.state.gitlab_client
-        reactions = gitlab_client.get_note_reactions(project_id, mr_iid, note_id)
+        reactions = await gitlab_client.get_note_reactions(project_id, mr_iid, note_id)
         
         if not reactions:
             return {"status": "ignored", "reason": "No reactions yet"}
@@ -397,10 +541,12 @@ async def get_learning_patterns():
 async def get_current_prompt():
     """Get the actual prompt that AI uses (base + learning patterns)"""
     try:
-        from backend.prompts import CODE_REVIEW_PROMPT
+        from backend.prompts import get_review_prompt
+        
+        placeholder = "[код из MR будет здесь]"
         
         # Get base prompt
-        base_prompt = CODE_REVIEW_PROMPT.replace("{code_changes}", "[код из MR будет здесь]")
+        base_prompt = str(get_review_prompt(placeholder))
         
         # Get custom rules if any
         custom_rules = current_settings.get("custom_rules", "")
@@ -408,21 +554,16 @@ async def get_current_prompt():
         # Get learning patterns
         learned_context = learning_system.get_feedback_for_prompt()
         
-        # Construct full prompt as it's sent to AI
-        full_prompt = base_prompt
-        
-        if custom_rules:
-            full_prompt += f"\n\n## CUSTOM RULES:\n{custom_rules}"
-        
-        if learned_context:
-            full_prompt += learned_context
+        # Construct full prompt as it's sent to AI (stable prefix, then the diff)
+        full_prompt = get_review_prompt(placeholder, custom_rules=custom_rules or None, learned_patterns=learned_context)
         
         return {
             "base_prompt": base_prompt,
             "custom_rules": custom_rules,
             "learned_patterns": learned_context,
-            "full_prompt": full_prompt,
+            "full_prompt": str(full_prompt),
             "prompt_length": len(full_prompt),
+            "cacheable_prefix_length": full_prompt.prefix_length,
             "has_learning_patterns": bool(learned_context)
         }
         
@@ -0,0 +1,164 @@
+"""
+Model Router - Tiered model selection by size and risk of the reviewed code
+Every LLM request (chunk) gets a risk score from its size, touched paths
+(auth, payment, migrations...) and local static-check hits. Low-risk work goes
+to a cheap fast model, high-risk work to a stronger one. Latency, tokens and
+estimated cost are recorded per tier.
+"""
+
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.config import settings
+from backend.file_filter import path_matches
+from backend.llm_provider import LLMProvider
+from backend.llm_hedging import get_review_provider
+
+logger = logging.getLogger(__name__)
+
+TIERS = ("fast", "standard", "strong")
+
+# Model of every tier when MODEL_TIER_* is not set
+DEFAULT_TIER_MODELS: Dict[str, Dict[str, str]] = {
+    "openai": {"fast": "gpt-4o-mini", "standard": "gpt-4o-mini", "strong": "gpt-4o"},
+    "gemini": {"fast": "gemini-2.5-flash-lite", "standard": "gemini-2.5-flash", "strong": "gemini-2.5-pro"},
+    "claude": {"fast": "claude-3-haiku-20240307", "standard": "claude-3-haiku-20240307", "strong": "claude-sonnet-4-20250514"},
+}
+
+SIZE_UNIT_TOKENS = 10000  # prompt tokens worth one risk point
+RISKY_PATH_WEIGHT = 3.0
+STATIC_HIT_WEIGHTS = {"critical": 3.0, "medium": 1.0, "low": 0.25}
+
+
+def parse_tier_model(value: str, default_provider: str) -> Tuple[str, Optional[str]]:
+    """'provider:model', 'model' or '' -> (provider, model or None for provider default)"""
+    value = value.strip()
+    if ":" in value:
+        provider, model = value.split(":", 1)
+        return provider.strip().lower(), model.strip() or None
+    return default_provider, value or None
+
+
+def risk_score(tokens: int, paths: Iterable[str], static_issues: List[Dict[str, Any]], risky_paths: List[str]) -> float:
+    """Risk of one LLM request: size + sensitive paths + static-check findings"""
+    score = tokens / SIZE_UNIT_TOKENS
+    if any(path_matches(path, pattern) for path in paths for pattern in risky_paths):
+        score += RISKY_PATH_WEIGHT
+    score += sum(STATIC_HIT_WEIGHTS.get(issue.get("severity"), 0.0) for issue in static_issues)
+    return round(score, 2)
+
+
+class TierStats:
+    """Latency, tokens and cost of requests of one tier"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.requests = 0
+        self.failures = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.latencies = deque(maxlen=500)  # seconds of recent requests
+
+    def get_stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "model": self.model,
+            "requests": self.requests,
+            "failures": self.failures,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost, 4),
+            "avg_latency": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+            "p95_latency": round(latencies[int(len(latencies) * 0.95)], 2) if latencies else 0
+        }
+
+
+class ModelRouter(LLMProvider):
+    """LLM provider that dispatches every request to the model of its risk tier"""
+
+    name = "router"
+
+    def __init__(self, tiers: Dict[str, LLMProvider], risky_paths: Optional[List[str]] = None,
+                 fast_max_risk: float = 1.0, strong_min_risk: float = 3.0):
+        self.tiers = tiers
+        self.risky_paths = risky_paths or []
+        self.fast_max_risk = fast_max_risk
+        self.strong_min_risk = strong_min_risk
+        self.stats = {tier: TierStats(provider.model_name) for tier, provider in tiers.items()}
+
+        # Chunks must fit every tier - use the most restrictive model limits
+        standard = tiers["standard"]
+        self.model_name = "|".join(f"{p.name}:{p.model_name}" for p in tiers.values())
+        self.context_window = min(p.context_window for p in tiers.values())
+        self.max_output_limit = min(p.max_output_limit for p in tiers.values())
+        self.chars_per_token = min(p.chars_per_token for p in tiers.values())
+        self._estimate = standard.estimate_tokens
+
+    @classmethod
+    def from_settings(cls) -> "ModelRouter":
+        """Router with tier models from MODEL_TIER_* (providers of equal models are shared)"""
+        default_provider = settings.LLM_PROVIDER.lower()
+        created: Dict[Tuple[str, Optional[str]], LLMProvider] = {}
+        tiers: Dict[str, LLMProvider] = {}
+
+        for tier in ("standard", "fast", "strong"):
+            provider_name, model = parse_tier_model(getattr(settings, f"MODEL_TIER_{tier.upper()}"), default_provider)
+            model = model or DEFAULT_TIER_MODELS.get(provider_name, {}).get(tier)
+            if (provider_name, model) not in created:
+                try:
+                    created[(provider_name, model)] = get_review_provider(provider_name, model)
+                except Exception as e:
+                    if tier == "standard":
+                        raise
+                    logger.warning(f"⚠️ {tier} tier model {provider_name}:{model} unavailable, using standard: {str(e)}")
+                    created[(provider_name, model)] = tiers["standard"]
+            tiers[tier] = created[(provider_name, model)]
+
+        logger.info("🧭 Model routing: " + ", ".join(f"{tier}={tiers[tier].name}:{tiers[tier].model_name}" for tier in TIERS))
+        return cls(
+            {tier: tiers[tier] for tier in TIERS},
+            risky_paths=[p.strip() for p in settings.ROUTING_RISKY_PATHS.split(",") if p.strip()],
+            fast_max_risk=settings.ROUTING_FAST_MAX_RISK,
+            strong_min_risk=settings.ROUTING_STRONG_MIN_RISK
+        )
+
+    def estimate_tokens(self, text: str) -> int:
+        return self._estimate(text)
+
+    def route(self, tokens: int, paths: Iterable[str], static_issues: List[Dict[str, Any]]) -> str:
+        """Tier for a request of given size, files and static findings"""
+        score = risk_score(tokens, list(paths), static_issues, self.risky_paths)
+        if score >= self.strong_min_risk:
+            return "strong"
+        if score < self.fast_max_risk:
+            return "fast"
+        return "standard"
+
+    async def analyze_code(self, prompt: str, tier: str = "standard") -> Dict[str, Any]:
+        """Analyze code with the model of given tier"""
+        provider = self.tiers[tier]
+        stats = self.stats[tier]
+        stats.requests += 1
+        started = time.monotonic()
+        try:
+            result = await provider.analyze_code(prompt)
+        except Exception:
+            stats.failures += 1
+            raise
+        finally:
+            stats.latencies.append(time.monotonic() - started)
+
+        input_tokens = provider.estimate_tokens(prompt)
+        output_tokens = provider.estimate_tokens(json.dumps(result, ensure_ascii=False))
+        stats.input_tokens += input_tokens
+        stats.output_tokens += output_tokens
+        stats.cost += provider.estimate_cost(input_tokens, output_tokens)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-tier latency and cost counters"""
+        return {tier: stats.get_stats() for tier, stats in self.stats.items()}
@@ -36,6 +36,7 @@ class CodeIssue(BaseModel):
     description: str
     suggestion: str
     code_snippet: Optional[str] = None
+    rule_id: Optional[str] = None  # set for findings of local static checks
 
 
 class AnalysisResult(BaseModel):
@@ -48,6 +49,96 @@ class AnalysisResult(BaseModel):
     medium_count: int = 0
     low_count: int = 0
     estimated_time_saved: int = 0  # minutes
+    estimated_tokens: int = 0  # prompt tokens sent to LLM (estimate)
+    llm_requests: int = 0
+    filtered_files: int = 0  # lock/generated/vendored/binary files not sent to LLM
+    filtered_bytes: int = 0
+    filtered_tokens: int = 0
+    diff_bytes_in: int = 0  # diff size before/after compaction
+    diff_bytes_out: int = 0
+    static_issues: int = 0  # issues found by local static checks
+    llm_skipped: bool = False  # trivial change reviewed by static checks only
+    model_tiers: Dict[str, int] = {}  # routing tier -> LLM requests
+
+
+# Fields the LLM fills in - counters and stats of AnalysisResult are computed locally
+LLM_RESULT_FIELDS = ("summary", "score", "issues", "recommendation", "estimated_time_saved")
+LLM_ISSUE_FIELDS = ("file_path", "line", "severity", "issue_type", "description", "suggestion", "code_snippet")
+RECOMMENDATIONS = ["merge", "needs_fixes", "reject"]
+
+
+def _portable_schema(schema: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    """Pydantic JSON schema -> subset every provider understands (type, enum, items, properties, nullable)"""
+    if "$ref" in schema:
+        schema = defs[schema["$ref"].rsplit("/", 1)[-1]]
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        result = _portable_schema(options[0], defs)
+        if len(options) < len(schema["anyOf"]):
+            result["nullable"] = True
+        return result
+
+    result = {"type": schema["type"]}
+    if "enum" in schema:
+        result["enum"] = list(schema["enum"])
+    if "items" in schema:
+        result["items"] = _portable_schema(schema["items"], defs)
+    return result
+
+
+def _object_schema(model: type, fields: tuple, overrides: Dict[str, Any]) -> Dict[str, Any]:
+    schema = model.model_json_schema()
+    defs = schema.get("$defs", {})
+    return {
+        "type": "object",
+        "properties": {
+            field: overrides.get(field) or _portable_schema(schema["properties"][field], defs)
+            for field in fields
+        },
+        "required": list(fields)
+    }
+
+
+def review_response_schema() -> Dict[str, Any]:
+    """JSON schema of the LLM review answer, derived from AnalysisResult and CodeIssue"""
+    issue = _object_schema(CodeIssue, LLM_ISSUE_FIELDS, {})
+    return _object_schema(AnalysisResult, LLM_RESULT_FIELDS, {
+        "issues": {"type": "array", "items": issue},
+        "recommendation": {"type": "string", "enum": RECOMMENDATIONS}
+    })
+
+
+def count_changed_lines(changes: List[Dict[str, Any]]) -> int:
+    """Count added/removed lines in GitLab file changes"""
+    lines_changed = 0
+    for change in changes:
+        diff = change.get('diff', '')
+        lines_changed += len([l for l in diff.split('\n') if l.startswith('+') or l.startswith('-')])
+    return lines_changed
+
+
+def mr_head_sha(mr: Dict[str, Any]) -> Optional[str]:
+    """Head commit of an MR (API object or webhook object_attributes)"""
+    return (
+        (mr.get('diff_refs') or {}).get('head_sha')
+        or (mr.get('last_commit') or {}).get('id')
+        or mr.get('sha')
+    )
+
+
+class MRSnapshot(BaseModel):
+    """MR state fetched once per review and reused by every later step"""
+    project_id: int
+    mr_iid: int
+    project: Dict[str, Any] = {}
+    mr: Dict[str, Any]  # MR metadata (title, labels, diff_refs, ...)
+    changes: List[Dict[str, Any]] = []  # empty when changes are streamed
+    lines_changed: int = 0
+    changes_streamed: bool = False
+    
+    @property
+    def head_sha(self) -> Optional[str]:
+        return mr_head_sha(self.mr)
 
 
 class WebhookPayload(BaseModel):
@@ -1,7 +1,12 @@
 """
 Prompts for LLM code analysis
+Prompts are built as a stable prefix (instructions, project rules, learned
+patterns) followed by the variable diff, so provider-side prompt caches can
+reuse the prefix across requests.
 """
 
+import hashlib
+
 CODE_REVIEW_PROMPT = """
 Ты опытный senior разработчик в банке ForteBank с 10+ годами опыта. 
 Твоя задача - провести детальный code review для Merge Request.
@@ -91,7 +96,9 @@ ESTIMATED_TIME_SAVED:
 - Приоритизируй безопасность для банковского приложения
 - Давай конкретные примеры кода для исправлений
 - Учитывай контекст банковской разработки
+"""
 
+REVIEW_CHANGES_PROMPT = """
 ИЗМЕНЕНИЯ В КОДЕ:
 {code_changes}
 
@@ -108,9 +115,6 @@ RULES_BASED_PROMPT = """
 ЯЗЫК ПРОГРАММИРОВАНИЯ: {language}
 ФРЕЙМВОРК: {framework}
 
-ИЗМЕНЕНИЯ:
-{code_changes}
-
 Верни результат в формате JSON:
 {{
   "summary": "краткое резюме",
@@ -122,6 +126,12 @@ RULES_BASED_PROMPT = """
 """
 
 
+PROJECT_RULES_PROMPT = """
+ПРАВИЛА РЕПОЗИТОРИЯ (проверяй их вместе с критериями выше):
+{project_rules}
+"""
+
+
 QUICK_SECURITY_CHECK_PROMPT = """
 Быстрая проверка безопасности кода.
 
@@ -139,15 +149,55 @@ QUICK_SECURITY_CHECK_PROMPT = """
 """
 
 
-def get_review_prompt(code_changes: str, custom_rules: str = None, language: str = None, framework: str = None) -> str:
-    """Generate review prompt based on context"""
+# Changes whenever a template is edited - part of the review cache key
+PROMPT_VERSION = hashlib.sha256(
+    (CODE_REVIEW_PROMPT + RULES_BASED_PROMPT + PROJECT_RULES_PROMPT + REVIEW_CHANGES_PROMPT).encode("utf-8")
+).hexdigest()[:16]
+
+
+class ReviewPrompt(str):
+    """Prompt text that remembers where its stable (cacheable) prefix ends"""
+    
+    prefix_length: int = 0
+    
+    def __new__(cls, prefix: str, changes: str):
+        prompt = super().__new__(cls, prefix + changes)
+        prompt.prefix_length = len(prefix)
+        return prompt
+    
+    @property
+    def prefix(self) -> str:
+        return str(self[:self.prefix_length])
+    
+    @property
+    def changes(self) -> str:
+        return str(self[self.prefix_length:])
+
+
+def get_review_prompt(
+    code_changes: str,
+    custom_rules: str = None,
+    language: str = None,
+    framework: str = None,
+    learned_patterns: str = "",
+    project_rules: str = None
+) -> ReviewPrompt:
+    """
+    Generate review prompt based on context: instructions, rules and learned patterns first, diff last
+    
+    Custom rules from settings replace the default review instructions, rules of the
+    repository (`project_rules`) are added to them as an extra section.
+    """
     
     if custom_rules:
-        return RULES_BASED_PROMPT.format(
+        prefix = RULES_BASED_PROMPT.format(
             custom_rules=custom_rules,
             language=language or "не указан",
-            framework=framework or "не указан",
-            code_changes=code_changes
+            framework=framework or "не указан"
         )
+    else:
+        prefix = CODE_REVIEW_PROMPT.format()
+    if project_rules:
+        prefix += PROJECT_RULES_PROMPT.format(project_rules=project_rules)
     
-    return CODE_REVIEW_PROMPT.format(code_changes=code_changes)
+    return ReviewPrompt(prefix + learned_patterns, REVIEW_CHANGES_PROMPT.format(code_changes=code_changes))
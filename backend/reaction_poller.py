@@ -8,7 +8,7 @@ import logging
 from typing import List, Dict, Set
 from datetime import datetime, timedelta
 
-from backend.gitlab_client import GitLabClient
+from backend.gitlab_client import GitLabClient, Priority
 from backend.feedback import learning_system, Feedback
 from backend.database import get_recent_reviews
 
@@ -80,16 +80,15 @@ class ReactionPoller:
         """Проверить reactions на комментариях в конкретном MR"""
         try:
             # Получить MR
-            project = self.gitlab_client.get_project(project_id)
-            mr = project.mergerequests.get(mr_iid)
+            mr = await self.gitlab_client.get_merge_request(project_id, mr_iid, priority=Priority.LOW)
             
             # Получить все комментарии
-            notes = mr.notes.list(get_all=True)
+            notes = await self.gitlab_client.list_mr_notes(project_id, mr_iid, priority=Priority.LOW)
             
             # Фильтровать только AI комментарии
             ai_notes = [
                 note for note in notes 
-                if "🤖" in note.body or "AI Review" in note.body or "AI Code Review" in note.body
+                if "🤖" in note['body'] or "AI Review" in note['body'] or "AI Code Review" in note['body']
             ]
             
             if not ai_notes:
@@ -103,9 +102,9 @@ class ReactionPoller:
                 await self.process_note_reactions(
                     project_id=project_id,
                     mr_iid=mr_iid,
-                    note_id=note.id,
-                    note_body=note.body,
-                    author_name=mr.author.get('name', 'Unknown')
+                    note_id=note['id'],
+                    note_body=note['body'],
+                    author_name=(mr.get('author') or {}).get('name', 'Unknown')
                 )
                 
         except Exception as e:
@@ -122,7 +121,9 @@ class ReactionPoller:
         """Обработать reactions на конкретном комментарии"""
         try:
             # Получить reactions
-            reactions = self.gitlab_client.get_note_reactions(project_id, mr_iid, note_id)
+            reactions = await self.gitlab_client.get_note_reactions(
+                project_id, mr_iid, note_id, priority=Priority.LOW
+            )
             
             if not reactions:
                 logger.info(f"💭 No reactions on note {note_id}")
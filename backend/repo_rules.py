@@ -0,0 +1,196 @@
+"""
+Repository Rules - `.codereview-rules.yaml` of the reviewed repository
+The file is fetched at the MR head and compiled once per blob SHA: machine-checkable
+rules (line length, forbidden patterns, type hints) become local matchers run by the
+static checks, all other rules are formatted for the review prompt.
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+import yaml
+from pydantic import BaseModel, ValidationError
+
+from backend.cache import TTLCache
+from backend.config import settings
+from backend.models import Severity
+
+logger = logging.getLogger(__name__)
+
+LINE_LENGTH_RULE = re.compile(r"(?i)(?:длин\w*\s+строк\w*|line\s+length)\D*(\d+)")
+TYPE_HINTS_RULE = re.compile(r"(?i)type\s+hints|аннотаци\w*\s+тип")
+
+IGNORED_SECTIONS = {"auto_actions", "checks"}
+
+# Patterns come from the reviewed repository - long ones are refused before compiling
+MAX_PATTERN_LENGTH = 200
+
+# Severity names of other tools -> our levels
+SEVERITY_ALIASES = {
+    "high": Severity.CRITICAL, "blocker": Severity.CRITICAL, "error": Severity.CRITICAL,
+    "major": Severity.MEDIUM, "warning": Severity.MEDIUM,
+    "minor": Severity.LOW,
+}
+
+
+class ForbiddenPattern(BaseModel):
+    """Regex that must not appear in added lines"""
+    pattern: str
+    message: str
+    severity: Severity = Severity.MEDIUM
+
+
+class RepoChecks(BaseModel):
+    """Machine-checkable rules, run locally without LLM tokens"""
+    max_line_length: Optional[int] = None
+    require_type_hints: bool = False
+    forbidden_patterns: List[ForbiddenPattern] = []
+    rule_errors: List[str] = []  # rejected forbidden patterns, reported as findings
+
+    def is_empty(self) -> bool:
+        return not (self.max_line_length or self.require_type_hints or self.forbidden_patterns or self.rule_errors)
+
+
+class RepoRules(BaseModel):
+    """Compiled rules of one version of the rules file"""
+    blob_id: Optional[str] = None
+    checks: RepoChecks = RepoChecks()
+    prompt_rules: str = ""  # rules only an LLM can check
+    checked_rules: List[str] = []  # free-text rules replaced by local matchers
+
+    def prompt(self, include_checked: bool = False) -> str:
+        """Rules text for the review prompt"""
+        if not include_checked or not self.checked_rules:
+            return self.prompt_rules
+        checked = "\n".join(f"- {rule}" for rule in self.checked_rules)
+        return f"{self.prompt_rules}\n\nCODE STYLE (CHECKED LOCALLY):\n{checked}".strip()
+
+
+def _format_context(context: Dict[str, Any]) -> str:
+    parts = [f"{key}: {', '.join(map(str, value)) if isinstance(value, list) else value}" for key, value in context.items()]
+    return "PROJECT CONTEXT:\n" + "\n".join(f"- {part}" for part in parts)
+
+
+def _normalize_severity(forbidden: Any) -> Any:
+    """Map severity of a forbidden pattern to a known level (unknown values become medium)"""
+    if not isinstance(forbidden, dict) or "severity" not in forbidden:
+        return forbidden
+    value = str(forbidden["severity"]).strip().lower()
+    if value in {level.value for level in Severity}:
+        severity = Severity(value)
+    elif value in SEVERITY_ALIASES:
+        severity = SEVERITY_ALIASES[value]
+    else:
+        severity = Severity.MEDIUM
+        logger.warning(f"⚠️ Unknown severity {forbidden['severity']!r} of forbidden pattern {forbidden.get('pattern')!r}, using medium")
+    return {**forbidden, "severity": severity}
+
+
+def compile_rules(content: str, blob_id: Optional[str] = None) -> Optional[RepoRules]:
+    """Parse rules file and split it into local matchers and prompt rules (None if invalid)"""
+    try:
+        data = yaml.safe_load(content) or {}
+    except yaml.YAMLError as e:
+        logger.warning(f"⚠️ Invalid {settings.REPO_RULES_FILE}: {str(e)}")
+        return None
+    if not isinstance(data, dict):
+        logger.warning(f"⚠️ {settings.REPO_RULES_FILE} must be a mapping of sections")
+        return None
+
+    raw_checks = data.get("checks") or {}
+    if isinstance(raw_checks, dict):
+        raw_checks = {key: value for key, value in raw_checks.items() if key != "rule_errors"}
+        if isinstance(raw_checks.get("forbidden_patterns"), list):
+            raw_checks["forbidden_patterns"] = [_normalize_severity(p) for p in raw_checks["forbidden_patterns"]]
+
+    try:
+        checks = RepoChecks(**raw_checks)
+    except (ValidationError, TypeError) as e:
+        logger.warning(f"⚠️ Invalid 'checks' section in {settings.REPO_RULES_FILE}: {str(e)}")
+        checks = RepoChecks()
+
+    valid_patterns = []
+    for forbidden in checks.forbidden_patterns:
+        if len(forbidden.pattern) > MAX_PATTERN_LENGTH:
+            error = f"pattern longer than {MAX_PATTERN_LENGTH} chars"
+        else:
+            try:
+                re.compile(forbidden.pattern)
+                valid_patterns.append(forbidden)
+                continue
+            except re.error as e:
+                error = str(e)
+        logger.warning(f"⚠️ Skipping invalid forbidden pattern {forbidden.pattern[:80]!r}: {error}")
+        checks.rule_errors.append(f"{forbidden.pattern[:80]!r}: {error}")
+    checks.forbidden_patterns = valid_patterns
+
+    sections = []
+    checked_rules = []
+    for name, value in data.items():
+        if name in IGNORED_SECTIONS:
+            continue
+        if isinstance(value, dict):
+            sections.append(_format_context(value))
+            continue
+
+        prompt_items = []
+        for rule in value if isinstance(value, list) else [value]:
+            rule = str(rule)
+            line_length = LINE_LENGTH_RULE.search(rule)
+            if line_length:
+                checks.max_line_length = checks.max_line_length or int(line_length.group(1))
+                checked_rules.append(rule)
+            elif TYPE_HINTS_RULE.search(rule):
+                checks.require_type_hints = True
+                checked_rules.append(rule)
+            else:
+                prompt_items.append(rule)
+        if prompt_items:
+            title = name.replace("_", " ").upper()
+            sections.append(f"{title}:\n" + "\n".join(f"- {item}" for item in prompt_items))
+
+    return RepoRules(
+        blob_id=blob_id,
+        checks=checks,
+        prompt_rules="\n\n".join(sections),
+        checked_rules=checked_rules
+    )
+
+
+# Compiled rules by blob SHA - the same file content is parsed only once
+_compiled = TTLCache(max_size=200, ttl=86400)
+
+
+async def load_repo_rules(gitlab_client, project_id: int, ref: str) -> Optional[RepoRules]:
+    """
+    Get compiled rules file of the repository at given commit
+
+    Only the blob SHA is requested on every review; content is downloaded
+    and compiled when the file has changed.
+    """
+    blob_id = await gitlab_client.get_file_blob_id(project_id, settings.REPO_RULES_FILE, ref)
+    if not blob_id:
+        return None
+
+    rules = _compiled.get(blob_id)
+    if rules is not None:
+        return rules
+
+    content = await gitlab_client.get_blob_raw(project_id, blob_id)
+    if content is None:
+        return None
+
+    rules = compile_rules(content, blob_id)
+    if rules is not None:
+        _compiled.set(blob_id, rules)
+        logger.info(
+            f"📏 Compiled {settings.REPO_RULES_FILE} ({blob_id[:8]}): "
+            f"{len(rules.checked_rules)} rule(s) checked locally"
+        )
+    return rules
+
+
+def get_rules_cache_stats() -> Dict[str, Any]:
+    """Counters of the compiled rules cache"""
+    return _compiled.get_stats()
@@ -0,0 +1,73 @@
+"""
+Review Cache - Content-addressed cache of per-file analysis results
+Key is a hash of the formatted file diff together with everything else that shapes
+the LLM answer (prompt template version, custom rules, learned patterns, provider/model).
+A rebased or re-pushed MR reuses findings of byte-identical files without a provider call.
+
+Lookups go to an in-memory LRU first and then to the `review_cache` table when the
+database is available, so cached results survive restarts and are shared by replicas.
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from backend import database
+from backend.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DB_PRUNE_INTERVAL = 200  # stores between evictions from the review_cache table
+
+
+def make_cache_key(*parts: Optional[str]) -> str:
+    """Stable sha256 key of the given text parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """In-memory LRU in front of the persistent review_cache table"""
+
+    def __init__(self, max_size: int = 2000, ttl: int = 604800, db_max_rows: int = 50000):
+        self.memory = TTLCache(max_size=max_size, ttl=ttl)
+        self.ttl = ttl
+        self.db_max_rows = db_max_rows
+        self.db_hits = 0
+        self.stores = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get cached file analysis or None"""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if not database.is_db_available():
+            return None
+
+        value = await asyncio.to_thread(database.get_cached_review, key, self.ttl)
+        if value is not None:
+            self.db_hits += 1
+            self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        """Store file analysis in memory and in the database"""
+        self.memory.set(key, value)
+        self.stores += 1
+        if database.is_db_available():
+            await asyncio.to_thread(database.save_cached_review, key, value)
+            if self.stores % DB_PRUNE_INTERVAL == 1:
+                await asyncio.to_thread(database.prune_review_cache, self.db_max_rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache counters"""
+        stats = self.memory.get_stats()
+        stats["db_hits"] = self.db_hits
+        stats["stores"] = self.stores
+        stats["persistent"] = database.is_db_available()
+        return stats
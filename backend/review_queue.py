@@ -0,0 +1,329 @@
+"""
+Review Queue - Asynchronous queue of MR review jobs
+Webhook handler only validates and enqueues a job, a bounded pool of workers runs the analysis.
+When the database is available jobs are persisted in `review_jobs`, so accepted webhooks
+survive restarts and several replicas can drain the same queue.
+
+Jobs are coalesced per MR (latest wins): a newer event replaces a queued job
+and cancels a running review of the same MR, so only the newest head SHA is reviewed.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field
+
+from backend import database
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewJob(BaseModel):
+    """Single MR review job waiting in the queue"""
+    project_id: int
+    mr_iid: int
+    mr_data: Dict[str, Any]
+    project: Dict[str, Any] = {}  # project attributes from the webhook payload
+    head_sha: Optional[str] = None
+    custom_rules: str = ""
+    enqueued_at: float = Field(default_factory=time.time)
+    job_id: Optional[int] = None  # review_jobs.id in durable mode
+    attempts: int = 0
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        """Coalescing key - one pending review per MR"""
+        return (self.project_id, self.mr_iid)
+
+
+class QueueFullError(Exception):
+    """Raised when the review queue has reached its maximum depth"""
+    pass
+
+
+ReviewHandler = Callable[[ReviewJob], Awaitable[None]]
+
+
+class ReviewQueue:
+    """
+    Bounded queue drained by a fixed pool of analysis workers
+
+    In-memory mode keeps the latest pending job per MR and queues MR keys.
+    In durable mode the local asyncio queue only carries wake-up signals,
+    the jobs themselves are claimed from the database with a lease.
+    """
+
+    def __init__(
+        self,
+        handler: ReviewHandler,
+        workers: int = 2,
+        max_size: int = 100,
+        durable: bool = False,
+        lease_seconds: int = 600,
+        max_attempts: int = 3,
+        poll_interval: float = 5.0,
+        retry_delay: int = 30
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_size = max_size
+        self.durable = durable
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._pending: Dict[Tuple[int, int], ReviewJob] = {}  # in-memory mode only
+        self._running: Dict[Tuple[int, int], Tuple[ReviewJob, asyncio.Task]] = {}
+        self._superseded: Set[int] = set()  # id() of jobs cancelled by a newer event
+        self._stopping = False
+        self.active_jobs = 0
+        self.completed_jobs = 0
+        self.failed_jobs = 0
+        self.coalesced_jobs = 0
+        self.cancelled_jobs = 0
+
+    def start(self):
+        """Start worker tasks"""
+        for worker_id in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(worker_id)))
+        mode = "durable" if self.durable else "in-memory"
+        logger.info(f"🧵 Review queue started ({self.workers} workers, max depth {self.max_size}, {mode})")
+
+    async def stop(self):
+        """Cancel worker tasks and wait for them to finish"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._stopping = False
+        logger.info("🛑 Review queue stopped")
+
+    async def enqueue(self, job: ReviewJob) -> str:
+        """
+        Add job to the queue, replacing any pending job for the same MR
+
+        Returns 'queued', 'coalesced' (replaced a pending job) or
+        'duplicate' (same head SHA is already queued or running).
+        """
+        if self._is_in_flight(job):
+            logger.info(f"⏭️ MR #{job.mr_iid} head {job.head_sha} is already being reviewed")
+            return "duplicate"
+
+        if self.durable:
+            result = await asyncio.to_thread(
+                database.enqueue_review_job,
+                job.project_id,
+                job.mr_iid,
+                job.model_dump(exclude={'job_id', 'attempts'}),
+                job.head_sha,
+                self.max_attempts,
+                self.max_size
+            )
+            if result["full"]:
+                raise QueueFullError(f"Review queue is full ({self.max_size} jobs)")
+
+            job.job_id = result["id"]
+            if result["duplicate"]:
+                return "duplicate"
+            status = "coalesced" if result["coalesced"] else "queued"
+            if status == "queued":
+                self._wake_worker()
+        else:
+            if job.key in self._pending:
+                status = "coalesced"
+            else:
+                try:
+                    self.queue.put_nowait(job.key)
+                except asyncio.QueueFull:
+                    raise QueueFullError(f"Review queue is full ({self.max_size} jobs)")
+                status = "queued"
+            self._pending[job.key] = job
+
+        if status == "coalesced":
+            self.coalesced_jobs += 1
+        self._cancel_running(job.key, newer_job_id=job.job_id)
+        logger.info(f"📥 Queued review for MR #{job.mr_iid} in project {job.project_id} (head: {job.head_sha})")
+        return status
+
+    def _is_in_flight(self, job: ReviewJob) -> bool:
+        """Check if the same head SHA is already pending or running in this process"""
+        if not job.head_sha:
+            return False
+        pending = self._pending.get(job.key)
+        running = self._running.get(job.key)
+        return any(
+            other is not None and other.head_sha == job.head_sha and id(other) not in self._superseded
+            for other in (pending, running[0] if running else None)
+        )
+
+    def _cancel_running(self, key: Tuple[int, int], newer_job_id: Optional[int] = None):
+        """Cancel review of an older head SHA that is running in this process"""
+        running = self._running.get(key)
+        if running and not running[1].done():
+            old_job, task = running
+            if newer_job_id is not None and old_job.job_id == newer_job_id:
+                return  # a worker already claimed the job we just stored
+            self._superseded.add(id(old_job))
+            task.cancel()
+            logger.info(f"✂️ Cancelling superseded review of MR #{old_job.mr_iid} (head: {old_job.head_sha})")
+
+    def _wake_worker(self):
+        """Signal one idle worker that a new job is available"""
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass  # all workers will poll the database anyway
+
+    async def _next_job(self, worker_name: str) -> ReviewJob:
+        """Wait for the next job to process"""
+        if not self.durable:
+            while True:
+                key = await self.queue.get()
+                self.queue.task_done()
+                job = self._pending.pop(key, None)
+                if job:
+                    return job
+
+        while True:
+            row = await asyncio.to_thread(database.claim_review_job, worker_name, self.lease_seconds)
+            if row:
+                job = ReviewJob(**row['payload'])
+                job.job_id = row['id']
+                job.attempts = row['attempts']
+                return job
+
+            # Nothing claimable - sleep until woken up or poll interval passes.
+            # asyncio.wait, unlike wait_for before Python 3.12, never swallows a
+            # cancellation that races the wake-up, so stop() cannot hang here
+            wake_up = asyncio.ensure_future(self.queue.get())
+            try:
+                done, _ = await asyncio.wait({wake_up}, timeout=self.poll_interval)
+            finally:
+                if not wake_up.done():
+                    wake_up.cancel()
+            if done:
+                self.queue.task_done()
+
+    async def _keep_lease(self, job: ReviewJob, worker_name: str):
+        """Extend lease of a running durable job, cancel it if another event superseded it"""
+        interval = max(min(self.lease_seconds / 3, self.poll_interval), 0.05)
+        while True:
+            await asyncio.sleep(interval)
+            still_ours = await asyncio.to_thread(
+                database.renew_review_job_lease, job.job_id, worker_name, self.lease_seconds
+            )
+            if not still_ours:
+                self._cancel_running(job.key)
+                return
+
+    async def _complete(self, job: ReviewJob, worker_name: str):
+        """Mark durable job done - shutdown waits for the update instead of leaving the row running"""
+        update = asyncio.ensure_future(asyncio.to_thread(database.complete_review_job, job.job_id, worker_name))
+        try:
+            await asyncio.shield(update)
+        except asyncio.CancelledError:
+            await update
+            raise
+
+    async def _worker(self, worker_id: int):
+        """Take jobs one by one and run the handler"""
+        worker_name = f"{self.worker_prefix}-{worker_id}"
+
+        while True:
+            job = await self._next_job(worker_name)
+            self.active_jobs += 1
+            started = time.time()
+            handler_task = asyncio.create_task(self.handler(job))
+            self._running[job.key] = (job, handler_task)
+            lease_task = asyncio.create_task(self._keep_lease(job, worker_name)) if self.durable else None
+
+            try:
+                logger.info(f"⚙️ Worker {worker_id} picked MR #{job.mr_iid} (waited {started - job.enqueued_at:.1f}s)")
+                await handler_task
+                self.completed_jobs += 1
+                if self.durable:
+                    await self._complete(job, worker_name)
+            except asyncio.CancelledError:
+                if handler_task.done() and not handler_task.cancelled() and not handler_task.exception():
+                    # Shutdown landed right after the review finished - record it, don't run it again
+                    self.completed_jobs += 1
+                    if self.durable:
+                        await self._complete(job, worker_name)
+                    raise
+                if self._stopping or id(job) not in self._superseded:
+                    # Shutdown - hand the job back so another worker or replica picks it up
+                    if self.durable:
+                        await asyncio.shield(asyncio.to_thread(database.release_review_job, job.job_id, worker_name))
+                    raise
+                self.cancelled_jobs += 1
+                logger.info(f"⏭️ Review of MR #{job.mr_iid} superseded by a newer push")
+            except Exception as e:
+                self.failed_jobs += 1
+                logger.error(f"❌ Worker {worker_id} failed on MR #{job.mr_iid}: {str(e)}")
+                if self.durable:
+                    await asyncio.to_thread(
+                        database.fail_review_job,
+                        job.job_id, worker_name, str(e),
+                        job.attempts, self.max_attempts, self.retry_delay
+                    )
+            finally:
+                if lease_task:
+                    lease_task.cancel()
+                if self._running.get(job.key, (None,))[0] is job:
+                    del self._running[job.key]
+                self._superseded.discard(id(job))
+                self.active_jobs -= 1
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get queue statistics"""
+        stats = {
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "durable": self.durable,
+            "active": self.active_jobs,
+            "completed": self.completed_jobs,
+            "failed": self.failed_jobs,
+            "coalesced": self.coalesced_jobs,
+            "cancelled": self.cancelled_jobs
+        }
+        if self.durable:
+            stats["jobs"] = await asyncio.to_thread(database.get_review_job_stats)
+            stats["queued"] = stats["jobs"].get('queued', 0)
+        else:
+            stats["queued"] = len(self._pending)
+        return stats
+
+
+# Global instance
+review_queue: Optional[ReviewQueue] = None
+
+
+def start_review_queue(handler: ReviewHandler, workers: int = 2, max_size: int = 100, **options) -> ReviewQueue:
+    """Create the global review queue and start its workers"""
+    global review_queue
+
+    review_queue = ReviewQueue(handler, workers=workers, max_size=max_size, **options)
+    review_queue.start()
+    return review_queue
+
+
+async def stop_review_queue():
+    """Stop the global review queue"""
+    global review_queue
+
+    if review_queue:
+        await review_queue.stop()
+        review_queue = None
+
+
+def get_review_queue() -> Optional[ReviewQueue]:
+    """Get the global review queue (None if not started)"""
+    return review_queue
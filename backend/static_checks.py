@@ -0,0 +1,468 @@
+"""
+Static Checks - Fast local detectors that run before the LLM
+Mechanical findings (hard-coded secrets, SQL built from strings, eval, weak hashes...)
+are found on the added lines of a diff with one combined multi-pattern regex,
+an entropy check of string literals and AST checks for Python, plus the matchers
+compiled from the repository's .codereview-rules.yaml. Scans run in a
+process pool so large MRs do not block the event loop.
+"""
+
+import ast
+import asyncio
+import logging
+import math
+import re
+import signal
+import textwrap
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_CHECKED_LINE_LENGTH = 1000  # chars of a line searched by repository patterns
+
+HUNK_RE = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@')
+
+# rule_id -> (regex, severity, issue_type, description, suggestion)
+PATTERN_RULES: Dict[str, Tuple[str, str, str, str, str]] = {
+    "hardcoded-secret": (
+        r"""(?i:\b\w*(?:password|passwd|pwd|secret|api_?key|apikey|token|private_?key|access_?key)\w*\s*[:=]\s*["'](?P<secret>[^"'\s]{4,})["'])""",
+        "critical", "security",
+        "Секрет (пароль, ключ или токен) записан прямо в коде",
+        "Вынесите значение в переменные окружения или хранилище секретов"
+    ),
+    "aws-access-key": (
+        r"\bAKIA[0-9A-Z]{16}\b",
+        "critical", "security",
+        "В коде найден AWS access key",
+        "Отзовите ключ и храните его в хранилище секретов"
+    ),
+    "private-key": (
+        r"-----BEGIN (?:RSA |EC |DSA |OPENSSH )?PRIVATE KEY-----",
+        "critical", "security",
+        "В коде найден приватный ключ",
+        "Удалите ключ из репозитория и перевыпустите его"
+    ),
+    "sql-concatenation": (
+        r"""(?i:["'][^"']*\b(?:select\b[^"']*\bfrom|insert\s+into|update\s+\w+\s+set|delete\s+from)\b[^"']*["']\s*(?:\+|%\s*[\w(])|\bf["'][^"']*\b(?:select\b[^"']*\bfrom|insert\s+into|update\s+\w+\s+set|delete\s+from)\b[^"']*\{)""",
+        "critical", "security",
+        "SQL-запрос собирается из строк - возможна SQL injection",
+        "Используйте параметризованные запросы (placeholders) вместо подстановки значений"
+    ),
+    "eval": (
+        r"(?<![\w.])(?:eval|exec)\s*\(",
+        "critical", "security",
+        "Вызов eval/exec выполняет произвольный код",
+        "Замените eval/exec на явный разбор данных (json, ast.literal_eval)"
+    ),
+    "weak-hash": (
+        r"""(?i:\b(?:hashlib\.)?(?:md5|sha1)\s*\(|MessageDigest\.getInstance\(\s*"(?:MD5|SHA-?1)")""",
+        "medium", "security",
+        "Слабая хеш-функция (MD5/SHA-1)",
+        "Используйте SHA-256 и выше, для паролей - bcrypt/argon2"
+    ),
+    "tls-verify-disabled": (
+        r"\bverify\s*=\s*False\b",
+        "medium", "security",
+        "Отключена проверка TLS-сертификата",
+        "Не отключайте verify, укажите корректный CA bundle"
+    ),
+    "shell-true": (
+        r"\bshell\s*=\s*True\b",
+        "medium", "security",
+        "Запуск команды через shell=True - возможна инъекция команд",
+        "Передавайте аргументы списком без shell=True"
+    ),
+    "unsafe-deserialization": (
+        r"\bpickle\.loads?\s*\(|\byaml\.load\s*\((?![^)]*Loader)",
+        "medium", "security",
+        "Небезопасная десериализация недоверенных данных",
+        "Используйте json или yaml.safe_load"
+    ),
+}
+
+COMBINED_PATTERN = re.compile("|".join(f"(?P<r{i}>{rule[0]})" for i, rule in enumerate(PATTERN_RULES.values())))
+RULE_IDS = list(PATTERN_RULES)
+
+STRING_LITERAL = re.compile(r"""["']([A-Za-z0-9+/=_\-]{20,})["']""")
+SECRET_ENTROPY = 4.0  # bits per char of a random token
+SECRET_MIN_LENGTH = 8  # shorter values of secret-named variables are labels ("bearer"), not secrets
+SECRET_VALUE_ENTROPY = 3.0  # bits per char of a plain word ("password" ~2.75)
+
+# Line comment prefixes by language ("* " also matches a lone "*" of a block comment)
+HASH_COMMENTS = ("#",)
+C_COMMENTS = ("//", "/*", "*/", "* ")
+BLOCK_COMMENTS = ("/*", "*/", "* ")
+COMMENT_SYNTAX: Dict[str, Tuple[str, ...]] = {
+    **dict.fromkeys((".py", ".pyi", ".rb", ".sh", ".bash", ".zsh", ".yaml", ".yml", ".toml", ".cfg",
+                     ".r", ".pl", ".ex", ".exs", ".cmake", ".dockerfile", "Dockerfile", "Makefile"), HASH_COMMENTS),
+    **dict.fromkeys((".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".java", ".kt", ".kts", ".scala", ".go", ".rs",
+                     ".swift", ".cs", ".c", ".h", ".cc", ".cpp", ".hpp", ".dart", ".groovy", ".gradle", ".scss",
+                     ".less"), C_COMMENTS),
+    ".php": C_COMMENTS + HASH_COMMENTS,
+    ".tf": C_COMMENTS + HASH_COMMENTS,
+    ".css": BLOCK_COMMENTS,
+    ".sql": ("--",) + BLOCK_COMMENTS,
+    ".lua": ("--",),
+    ".html": ("<!--", "-->"),
+    ".xml": ("<!--", "-->"),
+}
+DOC_EXTENSIONS = (".md", ".rst", ".txt", ".adoc")
+
+
+def comment_prefixes(file_path: str) -> Optional[Tuple[str, ...]]:
+    """Comment syntax of the file's language, None if the language is unknown"""
+    name = file_path.rsplit("/", 1)[-1]
+    if name in COMMENT_SYNTAX:
+        return COMMENT_SYNTAX[name]
+    _, dot, extension = name.rpartition(".")
+    return COMMENT_SYNTAX.get(f".{extension.lower()}") if dot else None
+
+
+def is_comment(stripped: str, prefixes: Optional[Tuple[str, ...]]) -> bool:
+    return bool(prefixes) and (stripped + " ").startswith(prefixes)
+
+
+def added_lines(diff: str) -> List[Tuple[int, str]]:
+    """(new line number, text) of every added line"""
+    result = []
+    new = 0
+    for line in diff.split('\n'):
+        match = HUNK_RE.match(line)
+        if match:
+            new = int(match.group(1))
+        elif line.startswith('+') and not line.startswith('+++'):
+            result.append((new, line[1:]))
+            new += 1
+        elif line.startswith(' '):
+            new += 1
+    return result
+
+
+def post_image_blocks(diff: str) -> List[Tuple[int, str]]:
+    """(first line number, text) of the new version of every hunk"""
+    blocks = []
+    for line in diff.split('\n'):
+        match = HUNK_RE.match(line)
+        if match:
+            blocks.append((int(match.group(1)), []))
+        elif blocks and line[:1] in ('+', ' ') and not line.startswith('+++'):
+            blocks[-1][1].append(line[1:])
+    return [(start, "\n".join(lines)) for start, lines in blocks if lines]
+
+
+def shannon_entropy(text: str) -> float:
+    """Bits per character"""
+    length = len(text)
+    return -sum(count / length * math.log2(count / length) for count in Counter(text).values())
+
+
+def looks_like_secret(value: str) -> bool:
+    """Value of a secret-named variable that is long and random enough to be a real credential"""
+    if len(value) < SECRET_MIN_LENGTH:
+        return False
+    mixed = any(c.isdigit() for c in value) and any(c.isalpha() for c in value)
+    return mixed or shannon_entropy(value) >= SECRET_VALUE_ENTROPY
+
+
+def make_issue(rule_id: str, file_path: str, line: int, snippet: str,
+               severity: str, issue_type: str, description: str, suggestion: str) -> Dict[str, Any]:
+    return {
+        "rule_id": rule_id,
+        "file_path": file_path,
+        "line": line,
+        "severity": severity,
+        "issue_type": issue_type,
+        "description": description,
+        "suggestion": suggestion,
+        "code_snippet": snippet.strip()[:200]
+    }
+
+
+def scan_lines(file_path: str, lines: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+    """Multi-pattern and entropy checks of added lines"""
+    issues = []
+    prefixes = comment_prefixes(file_path)
+    for number, text in lines:
+        stripped = text.strip()
+        if not stripped or is_comment(stripped, prefixes):
+            continue
+
+        for match in COMBINED_PATTERN.finditer(text):
+            rule_id = RULE_IDS[int(match.lastgroup[1:])]
+            if rule_id == "hardcoded-secret" and not looks_like_secret(match.group("secret")):
+                continue
+            _, severity, issue_type, description, suggestion = PATTERN_RULES[rule_id]
+            issues.append(make_issue(rule_id, file_path, number, text, severity, issue_type, description, suggestion))
+
+        for literal in STRING_LITERAL.findall(text):
+            if shannon_entropy(literal) > SECRET_ENTROPY and any(c.isdigit() for c in literal):
+                issues.append(make_issue(
+                    "high-entropy-string", file_path, number, text, "critical", "security",
+                    "Строка похожа на секретный ключ или токен (высокая энтропия)",
+                    "Если это секрет - вынесите его в хранилище секретов"
+                ))
+                break
+    return issues
+
+
+class PythonChecker(ast.NodeVisitor):
+    """AST checks of Python code"""
+
+    def __init__(self, file_path: str, first_line: int, added: Dict[int, str]):
+        self.file_path = file_path
+        self.offset = first_line - 1
+        self.added = added  # text of lines added by the MR by line number
+        self.issues: List[Dict[str, Any]] = []
+
+    def report(self, node: ast.AST, rule_id: str, severity: str, issue_type: str, description: str, suggestion: str):
+        line = node.lineno + self.offset
+        if line in self.added:
+            self.issues.append(make_issue(rule_id, self.file_path, line, self.added[line], severity, issue_type, description, suggestion))
+
+    def visit_Call(self, node: ast.Call):
+        name = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, 'id', '')
+        if name in ("execute", "executemany", "raw") and node.args and isinstance(node.args[0], (ast.JoinedStr, ast.BinOp)):
+            self.report(node, "sql-concatenation", "critical", "security",
+                        "В SQL-запрос подставляются значения через форматирование строки - возможна SQL injection",
+                        "Передайте значения параметрами: cursor.execute(sql, params)")
+        for keyword in node.keywords:
+            if keyword.arg == "shell" and isinstance(keyword.value, ast.Constant) and keyword.value.value is True:
+                self.report(node, "shell-true", "medium", "security",
+                            "Запуск команды через shell=True - возможна инъекция команд",
+                            "Передавайте аргументы списком без shell=True")
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler):
+        if node.type is None:
+            self.report(node, "bare-except", "low", "bug",
+                        "Голый except перехватывает все исключения, включая KeyboardInterrupt",
+                        "Перехватывайте конкретные исключения")
+        self.generic_visit(node)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        for default in node.args.defaults + node.args.kw_defaults:
+            if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                self.report(default, "mutable-default", "low", "bug",
+                            "Изменяемое значение по умолчанию разделяется между вызовами функции",
+                            "Используйте None и создавайте объект внутри функции")
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+def scan_python(file_path: str, diff: str, added: Dict[int, str]) -> List[Dict[str, Any]]:
+    """AST checks of hunks that parse as Python on their own"""
+    issues = []
+    for first_line, text in post_image_blocks(diff):
+        try:
+            tree = ast.parse(textwrap.dedent(text))
+        except (SyntaxError, ValueError):
+            continue  # hunk is not a complete statement block
+        checker = PythonChecker(file_path, first_line, added)
+        checker.visit(tree)
+        issues.extend(checker.issues)
+    return issues
+
+
+def meaningful_lines(file_path: str, diff: str) -> int:
+    """
+    Changed lines that are code (not blank, comments or documentation)
+
+    Comments are only recognized in known languages, every other non-blank line counts as code.
+    """
+    if file_path.lower().endswith(DOC_EXTENSIONS):
+        return 0
+    prefixes = comment_prefixes(file_path)
+    count = 0
+    for line in diff.split('\n'):
+        if line[:1] in ('+', '-') and not line.startswith(('+++', '---')):
+            stripped = line[1:].strip()
+            if stripped and not is_comment(stripped, prefixes):
+                count += 1
+    return count
+
+
+class RuleTimeout(Exception):
+    """Repository pattern ran out of its time budget"""
+    pass
+
+
+@contextmanager
+def time_limit(seconds: float):
+    """
+    Raise RuleTimeout in the block after `seconds`
+
+    Uses SIGALRM, which also interrupts a backtracking regex; without it
+    (Windows, non-main thread) the block runs unlimited.
+    """
+    if not seconds or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise RuleTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+@lru_cache(maxsize=256)
+def _compile(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def match_forbidden(file_path: str, lines: List[Tuple[int, str]], rule: Dict[str, Any],
+                    timeout: float = 0) -> List[Dict[str, Any]]:
+    """Lines matching a forbidden pattern of the repository, cut off after timeout"""
+    pattern = _compile(rule["pattern"])
+    try:
+        with time_limit(timeout):
+            hits = [(number, text) for number, text in lines if pattern.search(text, 0, MAX_CHECKED_LINE_LENGTH)]
+    except RuleTimeout:
+        return [rule_timeout_issue(file_path, rule["pattern"], timeout)]
+    return [
+        make_issue(
+            f"forbidden:{rule['pattern']}", file_path, number, text,
+            rule.get("severity", "medium"), "best_practice",
+            rule["message"], "Исправьте согласно правилам проекта (.codereview-rules.yaml)"
+        )
+        for number, text in hits
+    ]
+
+
+def scan_repo_checks(file_path: str, diff: str, lines: List[Tuple[int, str]], checks: Dict[str, Any],
+                     timeout: float = 0) -> List[Dict[str, Any]]:
+    """Matchers compiled from the repository's .codereview-rules.yaml (timeout per forbidden pattern)"""
+    issues = []
+    max_length = checks.get("max_line_length")
+
+    for number, text in lines:
+        if max_length and len(text) > max_length:
+            issues.append(make_issue(
+                "line-length", file_path, number, text, "low", "code_style",
+                f"Длина строки {len(text)} превышает лимит проекта ({max_length})",
+                "Разбейте строку на несколько"
+            ))
+    for rule in checks.get("forbidden_patterns", []):
+        issues.extend(match_forbidden(file_path, lines, rule, timeout))
+
+    if checks.get("require_type_hints") and file_path.endswith(".py"):
+        added = dict(lines)
+        for first_line, text in post_image_blocks(diff):
+            try:
+                tree = ast.parse(textwrap.dedent(text))
+            except (SyntaxError, ValueError):
+                continue
+            for node in ast.walk(tree):
+                if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    continue
+                line = node.lineno + first_line - 1
+                args = node.args.posonlyargs + node.args.args + node.args.kwonlyargs
+                missing_args = [a.arg for a in args if a.annotation is None and a.arg not in ("self", "cls")]
+                missing_return = node.returns is None and node.name != "__init__"
+                if line in added and (missing_args or missing_return):
+                    issues.append(make_issue(
+                        "type-hints", file_path, line, added[line], "low", "code_style",
+                        f"Функция {node.name} без аннотаций типов",
+                        "Добавьте type hints для аргументов и возвращаемого значения"
+                    ))
+    return issues
+
+
+def rule_error_issues(checks: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Finding for forbidden patterns of the rules file that were rejected when compiling"""
+    errors = checks.get("rule_errors") or []
+    if not errors:
+        return []
+    rules_file = settings.REPO_RULES_FILE
+    return [make_issue(
+        "invalid-rule", rules_file, None, errors[0], "low", "best_practice",
+        "Правила forbidden_patterns не применяются: " + "; ".join(errors),
+        f"Исправьте регулярные выражения в {rules_file}"
+    )]
+
+
+def rule_timeout_issue(file_path: str, pattern: str, timeout: float) -> Dict[str, Any]:
+    rules_file = settings.REPO_RULES_FILE
+    return make_issue(
+        f"rule-timeout:{pattern}", file_path, None, pattern, "low", "best_practice",
+        f"Правило {pattern[:80]!r} из {rules_file} не уложилось в {timeout:g} с на этом файле и пропущено",
+        f"Упростите регулярное выражение в {rules_file} (вложенные квантификаторы вызывают экспоненциальный перебор)"
+    )
+
+
+def scan_diff(file_path: str, diff: str, checks: Optional[Dict[str, Any]] = None, rules_timeout: float = 0) -> Dict[str, Any]:
+    """
+    Run all detectors on one file diff (executed in a worker process)
+
+    `checks` are machine-checkable rules of the repository (RepoChecks dict),
+    each forbidden pattern gets `rules_timeout` seconds per file.
+    Returns found issues (CodeIssue dicts) and the number of meaningful changed lines.
+    """
+    lines = added_lines(diff)
+    issues = scan_lines(file_path, lines)
+    if file_path.endswith(".py"):
+        issues.extend(scan_python(file_path, diff, dict(lines)))
+    if checks:
+        issues.extend(scan_repo_checks(file_path, diff, lines, checks, rules_timeout))
+
+    unique, seen = [], set()
+    for issue in issues:
+        key = (issue["line"], issue["rule_id"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(issue)
+    return {"issues": unique, "meaningful_lines": meaningful_lines(file_path, diff)}
+
+
+class StaticAnalyzer:
+    """Runs scan_diff in a process pool (inline when workers is 0)"""
+
+    def __init__(self, workers: int = 2, rules_timeout: float = 0):
+        self.workers = workers
+        self.rules_timeout = rules_timeout  # seconds per repository pattern and file, 0 - unlimited
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.files_scanned = 0
+        self.issues_found = 0
+        self.llm_skipped = 0
+
+    async def scan(self, file_path: str, diff: str, checks: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Scan one file diff"""
+        if self.workers > 0:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._pool, scan_diff, file_path, diff, checks, self.rules_timeout
+            )
+        else:
+            result = scan_diff(file_path, diff, checks, self.rules_timeout)
+        self.files_scanned += 1
+        self.issues_found += len(result["issues"])
+        return result
+
+    def shutdown(self):
+        """Stop worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scan counters"""
+        return {
+            "workers": self.workers,
+            "files_scanned": self.files_scanned,
+            "issues_found": self.issues_found,
+            "llm_skipped": self.llm_skipped
+        }
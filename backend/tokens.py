@@ -0,0 +1,47 @@
+"""
+Token estimation for LLM requests
+Uses tiktoken when it is installed, otherwise a heuristic calibrated on
+code diffs: ASCII text and Cyrillic (prompts, comments) are counted separately.
+"""
+
+import logging
+import math
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+DEFAULT_CHARS_PER_TOKEN = 3.5  # ASCII code
+NON_ASCII_CHARS_PER_TOKEN = 1.5  # Cyrillic and other multi-byte text
+SAFETY_MARGIN = 1.1  # heuristic errs on the side of more tokens
+
+
+def estimate_tokens(text: str, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> int:
+    """Estimate number of tokens in text without a tokenizer"""
+    if not text:
+        return 0
+    # Every non-ASCII character takes 2+ bytes in UTF-8
+    non_ascii = min(len(text.encode("utf-8")) - len(text), len(text))
+    ascii_chars = len(text) - non_ascii
+    return math.ceil((ascii_chars / chars_per_token + non_ascii / NON_ASCII_CHARS_PER_TOKEN) * SAFETY_MARGIN)
+
+
+@lru_cache(maxsize=8)
+def get_tiktoken_encoding(model: str):
+    """tiktoken encoding for an OpenAI model (None if tiktoken is not installed)"""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"⚠️ tiktoken encoding unavailable, using heuristic: {str(e)}")
+            return None
@@ -0,0 +1,19 @@
+"""
+Shared test fixtures
+"""
+
+import pytest
+
+from backend import database
+from backend.config import settings
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """Temporary SQLite database (durable queue, review cache)"""
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite:///{tmp_path}/jobs.db")
+    monkeypatch.setattr(database, "engine", None)
+    monkeypatch.setattr(database, "SessionLocal", None)
+    database.init_db()
+    yield
+    database.close_db()
@@ -0,0 +1,215 @@
+"""
+Tests for code analyzer helpers
+"""
+
+from backend.code_analyzer import CodeAnalyzer, count_changed_lines
+from backend.models import AnalysisResult, CodeIssue
+
+
+def make_analyzer() -> CodeAnalyzer:
+    """Analyzer without LLM provider (helpers only)"""
+    return CodeAnalyzer.__new__(CodeAnalyzer)
+
+
+def make_issue(file_path: str, severity: str = "medium", line: int = 1) -> dict:
+    return {
+        "file_path": file_path,
+        "line": line,
+        "severity": severity,
+        "issue_type": "bug",
+        "description": f"Issue in {file_path}",
+        "suggestion": "Fix it"
+    }
+
+
+def test_count_changed_lines():
+    changes = [{"diff": "@@ -1,2 +1,2 @@\n-a\n+b\n c\n"}, {"diff": "+x\n+y\n"}]
+    assert count_changed_lines(changes) == 4
+
+
+def test_incremental_merge_keeps_issues_of_untouched_files():
+    """Issues of files changed by new commits are replaced, others are carried over"""
+    previous = {
+        "score": 6.0,
+        "lines_changed": 10,
+        "issues": [make_issue("a.py", "critical"), make_issue("b.py")]
+    }
+    delta = AnalysisResult(
+        summary="Fixed a.py",
+        score=9.0,
+        issues=[CodeIssue(**make_issue("a.py", "low"))],
+        recommendation="merge"
+    )
+    delta_changes = [{"old_path": "a.py", "new_path": "a.py", "diff": "-bad\n+good\n"}]
+
+    merged = make_analyzer()._merge_incremental(previous, delta, delta_changes)
+
+    assert sorted((i.file_path, i.severity.value) for i in merged.issues) == [("a.py", "low"), ("b.py", "medium")]
+    assert merged.critical_count == 0
+    assert merged.score == 6.5
+    assert merged.recommendation == "needs_fixes"
+
+
+def test_incremental_merge_keeps_issues_outside_changed_hunks():
+    """Only previous issues on lines the new commits changed are dropped, the rest move with the code"""
+    previous = {
+        "score": 5.0,
+        "lines_changed": 10,
+        "issues": [
+            make_issue("a.py", "critical", line=3),
+            make_issue("a.py", "critical", line=20),
+            make_issue("a.py", "low", line=40),
+        ]
+    }
+    delta = AnalysisResult(summary="Fixed line 20", score=9.0, issues=[], recommendation="merge")
+    # Lines 19-21 replaced by 4 lines, line 30 deleted
+    diff = "@@ -19,3 +19,4 @@\n a\n-bad\n+good\n+more\n b\n@@ -30 +30,0 @@\n-gone\n"
+    delta_changes = [{"old_path": "a.py", "new_path": "a.py", "diff": diff}]
+
+    merged = make_analyzer()._merge_incremental(previous, delta, delta_changes)
+
+    assert sorted((i.line, i.severity.value) for i in merged.issues) == [(3, "critical"), (40, "low")]
+    assert merged.critical_count == 1
+
+
+def test_remap_line():
+    from backend.code_analyzer import hunk_ranges, remap_line
+
+    hunks = hunk_ranges("@@ -5,0 +6,2 @@\n+x\n+y\n@@ -10,2 +12 @@\n-a\n-b\n+c\n")
+    assert [remap_line(line, hunks) for line in (5, 6, 9, 10, 11, 12)] == [5, 8, 11, None, None, 13]
+
+
+def test_analyze_stream_splits_changes_into_chunks(monkeypatch):
+    """Changes beyond one prompt budget are analyzed in several chunks and merged"""
+    import asyncio
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "MAX_CODE_LENGTH", 300)
+    monkeypatch.setattr(settings, "ANALYSIS_FANOUT", 2)
+    prompts = []
+
+    async def fake_analyze_text(code_text, custom_rules=None, tier=None, project_rules=None):
+        prompts.append(code_text)
+        issues = [CodeIssue(**make_issue("file0.py"))] if "file0.py" in code_text else []
+        score = 6.0 if issues else 9.0
+        return AnalysisResult(summary=f"part {len(prompts)}", score=score, issues=issues, recommendation="merge")
+
+    async def stream():
+        for i in range(5):
+            yield {"new_path": f"file{i}.py", "diff": "+" + "x" * 100}
+
+    analyzer = make_analyzer()
+    monkeypatch.setattr(analyzer, "_analyze_text", fake_analyze_text)
+    result = asyncio.run(analyzer.analyze_changes(stream(), {}))
+
+    assert len(prompts) > 1
+    assert all(len(p) <= 300 for p in prompts)
+    assert all(any(f"file{i}.py" in p for p in prompts) for i in range(5))
+    assert len(result["issues"]) == 1
+    assert 6.0 < result["score"] < 9.0
+    assert asyncio.run(analyzer.analyze_changes([], {})) is None
+
+
+def test_big_file_is_split_along_hunks():
+    diff = "\n".join(f"@@ -{i},1 +{i},1 @@\n-old{i}\n+new{i}" + "y" * 40 for i in range(10))
+    pieces = make_analyzer()._split_change({"new_path": "big.py", "diff": diff}, 250)
+
+    assert len(pieces) > 1
+    assert all(len(p) <= 250 for p in pieces)
+    assert all(p.split("=" * 60)[2].lstrip("\n").startswith("@@") for p in pieces)
+    assert "(часть 1/" in pieces[0]
+
+
+def test_failed_chunks_are_reported(monkeypatch):
+    import asyncio
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "MAX_CODE_LENGTH", 150)
+    calls = []
+
+    async def flaky_analyze_text(code_text, custom_rules=None, tier=None, project_rules=None):
+        calls.append(code_text)
+        if len(calls) == 1:
+            raise ValueError("bad json")
+        return AnalysisResult(summary="ok", score=8.0, issues=[], recommendation="merge")
+
+    analyzer = make_analyzer()
+    monkeypatch.setattr(analyzer, "_analyze_text", flaky_analyze_text)
+    changes = [{"new_path": f"f{i}.py", "diff": "+" + "x" * 60} for i in range(3)]
+    result = asyncio.run(analyzer.analyze_changes(changes, {}))
+
+    assert result["score"] == 8.0
+    assert "не удалось проанализировать" in result["summary"]
+
+
+def test_unchanged_files_reuse_cached_analysis(monkeypatch):
+    """Second run over byte-identical diffs does not call the provider"""
+    import asyncio
+    from backend import database
+    from backend.review_cache import ReviewCache
+
+    monkeypatch.setattr(database, "SessionLocal", None)
+    calls = []
+
+    async def fake_analyze_text(code_text, custom_rules=None, tier=None, project_rules=None):
+        calls.append(code_text)
+        issues = [CodeIssue(**make_issue("a.py", "critical"))] if "a.py" in code_text else []
+        return AnalysisResult(summary="ok", score=5.0, issues=issues, recommendation="reject")
+
+    analyzer = make_analyzer()
+    analyzer.cache = ReviewCache(max_size=10)
+    monkeypatch.setattr(analyzer, "_analyze_text", fake_analyze_text)
+    changes = [{"new_path": "a.py", "diff": "+bad"}, {"new_path": "b.py", "diff": "+ok"}]
+
+    first = asyncio.run(analyzer.analyze_changes(changes, {}))
+    second = asyncio.run(analyzer.analyze_changes(changes, {}))
+    assert len(calls) == 1
+    assert second["score"] == first["score"] == 5.0
+    assert [i["file_path"] for i in second["issues"]] == ["a.py"]
+    assert second["critical_count"] == 1
+
+    changes[1]["diff"] = "+changed"
+    asyncio.run(analyzer.analyze_changes(changes, {}))
+    assert len(calls) == 2 and "b.py" in calls[1] and "a.py" not in calls[1]
+
+    asyncio.run(analyzer.analyze_changes(changes, {}, custom_rules="No print()"))
+    assert len(calls) == 3
+
+
+def test_packer_fills_gaps_with_small_files():
+    """First-fit packing needs fewer requests than sending files in arrival order"""
+    from backend.code_analyzer import ChunkPacker
+
+    packer = ChunkPacker(max_tokens=100, max_chars=10_000, max_open=2)
+    closed = []
+    for i, tokens in enumerate([60, 50, 40, 30]):
+        closed += packer.add(f"piece{i}", tokens, (None, f"f{i}.py"))
+    closed += packer.flush()
+
+    # Next-fit would need three requests: 60 | 50+40 | 30
+    assert sorted(c.tokens for c in closed) == [80, 100]
+    assert sum(len(c.parts) for c in closed) == 4
+
+
+def test_estimate_tokens_counts_cyrillic_denser():
+    from backend.tokens import estimate_tokens
+
+    assert estimate_tokens("") == 0
+    assert 100 <= estimate_tokens("x" * 350) <= 111
+    assert estimate_tokens("я" * 350) > estimate_tokens("x" * 350) * 2
+
+
+def test_analysis_reports_estimated_tokens(monkeypatch):
+    import asyncio
+
+    async def fake_analyze_text(code_text, custom_rules=None, tier=None, project_rules=None):
+        return AnalysisResult(summary="ok", score=9.0, issues=[], recommendation="merge")
+
+    analyzer = make_analyzer()
+    monkeypatch.setattr(analyzer, "_analyze_text", fake_analyze_text)
+    changes = [{"new_path": f"f{i}.py", "diff": "+" + "x" * 100} for i in range(3)]
+    result = asyncio.run(analyzer.analyze_changes(changes, {}))
+
+    overhead, _ = analyzer._token_budget()
+    assert result["llm_requests"] == 1
+    assert result["estimated_tokens"] > overhead
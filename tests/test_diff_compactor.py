@@ -0,0 +1,86 @@
+"""
+Tests for diff compaction
+"""
+
+from backend.diff_compactor import CompactionConfig, DiffCompactor
+
+
+def numbered_lines(diff: str):
+    """(new line number, text) of every added/context line, as the LLM would count them"""
+    result = []
+    new = None
+    for line in diff.split("\n"):
+        if line.startswith("@@"):
+            new = int(line.split("+")[1].split(",")[0].split(" ")[0])
+        elif line.startswith(("+", " ")) and new is not None:
+            result.append((new, line[1:]))
+            new += 1
+    return result
+
+
+def test_context_is_limited_and_line_numbers_stay_mappable():
+    context = "\n".join(f" line{i}" for i in range(1, 11))
+    diff = f"@@ -1,20 +1,21 @@ def main():\n{context}\n+added\n{context.replace('line', 'tail')}\n"
+    compacted = DiffCompactor(CompactionConfig(context_lines=1)).compact(diff)
+
+    assert "line1\n" not in compacted
+    assert compacted.startswith("@@ -10 +10 @@ def main():")
+    assert (11, "added") in numbered_lines(compacted)
+    assert set(numbered_lines(compacted)) <= set(numbered_lines(diff))
+
+
+def test_whitespace_moved_and_deleted_blocks_are_collapsed():
+    moved = ["def helper():", "    x = 1", "    return x"]
+    diff = "\n".join(
+        ["@@ -1,40 +1,8 @@"]
+        + ["-" + line for line in moved]
+        + [" keep"]
+        + ["-if a:", "+if  a:  "]
+        + [" keep2"]
+        + ["-old%d = 1" % i for i in range(30)]
+        + [" keep3"]
+        + ["+" + line for line in moved]
+        + ["+new = 2"]
+    ) + "\n"
+    compactor = DiffCompactor(CompactionConfig(context_lines=-1, max_deleted_lines=5))
+    compacted = compactor.compact(diff)
+
+    assert "3 line(s) moved unchanged to new line 5" in compacted
+    assert "moved here unchanged from old line 1" in compacted
+    assert "only in whitespace" in compacted and "-if a:" not in compacted
+    assert "25 more deleted line(s) elided" in compacted
+    assert "-old4 = 1" in compacted and "-old5 = 1" not in compacted
+    assert (8, "new = 2") in numbered_lines(compacted)
+
+    compactor.compact_change({"new_path": "a.py", "diff": diff})
+    stats = compactor.get_stats()
+    assert stats["bytes_out"] < stats["bytes_in"]
+
+
+def test_semantic_whitespace_edits_are_kept():
+    compactor = DiffCompactor(CompactionConfig(context_lines=0, collapse_moved=False))
+    context = "\n".join(f" line{i}" for i in range(10))
+
+    def collapsed(removed: str, added: str, file_path: str = "a.js") -> bool:
+        diff = f"@@ -1,21 +1,21 @@\n{context}\n-{removed}\n+{added}\n{context}\n"
+        return "only in whitespace" in compactor.compact(diff, file_path)
+
+    assert not collapsed("return x", "returnx")
+    assert not collapsed("a = b", "ab =")
+    assert collapsed("a = b", "a  =  b  ")
+    # Re-indentation moves code between blocks where indentation is syntax
+    assert collapsed("    x = 1", "x = 1", "app.js")
+    assert not collapsed("    x = 1", "x = 1", "src/app.py")
+    assert not collapsed("  key: 1", "key: 1", "deploy/values.yaml")
+    assert not collapsed("\tgo build", "go build", "Makefile")
+    assert collapsed("    x = 1", "    x  =  1", "src/app.py")
+    # Whitespace inside string literals is part of the value
+    assert not collapsed('msg = "a b"', 'msg = "a  b"')
+    assert not collapsed("sep = ' '", "sep = '  '", "src/app.py")
+    assert collapsed('msg  =  "a  b"', 'msg = "a  b"')
+
+
+def test_disabled_or_unparsable_diff_is_unchanged():
+    diff = "@@ -1,2 +1,2 @@\n a\n-b\n+c\n"
+    assert DiffCompactor(CompactionConfig(enabled=False)).compact(diff) == diff
+    assert DiffCompactor(CompactionConfig()).compact("+just text") == "+just text"
@@ -0,0 +1,66 @@
+"""
+Tests for generated/vendored/lock file filter
+"""
+
+import asyncio
+
+from backend.code_analyzer import CodeAnalyzer
+from backend.file_filter import FileFilter, path_matches
+from backend.models import AnalysisResult
+
+
+def change(path: str, diff: str = "+x = 1\n", **extra) -> dict:
+    return {"new_path": path, "old_path": path, "diff": diff, **extra}
+
+
+def test_path_globs():
+    assert path_matches("web/package-lock.json", "package-lock.json")
+    assert path_matches("src/vendor/lib/a.go", "vendor/**")
+    assert path_matches("vendor/a.go", "/vendor/**")
+    assert not path_matches("src/vendor/a.go", "/vendor/**")
+    assert path_matches("api/user_pb2.py", "*_pb2.py")
+    assert not path_matches("src/app.py", "*.min.js")
+
+
+def test_classify_by_path_attributes_and_content():
+    file_filter = FileFilter(gitattributes="api/** linguist-generated\napi/handwritten.py -linguist-generated\n")
+
+    assert file_filter.classify(change("yarn.lock")) == "lock"
+    assert file_filter.classify(change("static/app.min.js")) == "minified"
+    assert file_filter.classify(change("logo.png", "Binary files /dev/null and b/logo.png differ\n")) == "binary"
+    assert file_filter.classify(change("new_name.py", "", renamed_file=True)) == "renamed"
+    assert file_filter.classify(change("api/client.py")) == "generated"
+    assert file_filter.classify(change("api/handwritten.py")) is None
+    assert file_filter.classify(change("gen.go", "+// Code generated by protoc. DO NOT EDIT.\n+package x\n")) == "generated"
+    assert file_filter.classify(change("gen.py", "@@ -0,0 +1,2 @@\n+# @generated by tool\n+x = 1\n")) == "generated"
+    # Hand-written warnings and banners below the file header are reviewed
+    assert file_filter.classify(change("cfg.py", "+# do not edit this without talking to ops\n+X = 1\n")) is None
+    assert file_filter.classify(change("a.go", "@@ -40,2 +40,3 @@\n x\n+// Code generated by hand. DO NOT EDIT.\n y\n")) is None
+    assert file_filter.classify(change("bundle.js", "+" + "a=1;" * 300 + "\n")) == "minified"
+    assert file_filter.classify(change("src/app.py", "+def f():\n+    return 1\n")) is None
+    assert file_filter.classify(change("dist/app.js")) == "generated"
+    assert file_filter.classify(change("src/build/config.py")) is None
+    assert file_filter.classify(change("tools/dist/release.py")) is None
+
+
+def test_filtered_files_are_not_sent_and_savings_are_reported(monkeypatch):
+    prompts = []
+
+    async def fake_analyze_text(code_text, custom_rules=None, tier=None, project_rules=None):
+        prompts.append(code_text)
+        return AnalysisResult(summary="ok", score=9.0, issues=[], recommendation="merge")
+
+    analyzer = CodeAnalyzer.__new__(CodeAnalyzer)
+    monkeypatch.setattr(analyzer, "_analyze_text", fake_analyze_text)
+    lock_diff = "+" + '"dependency": "1.0.0",\n+' * 200
+    changes = [change("package-lock.json", lock_diff), change("src/app.py")]
+    result = asyncio.run(analyzer.analyze_changes(changes, {}))
+
+    assert len(prompts) == 1 and "package-lock.json" not in prompts[0]
+    assert result["filtered_files"] == 1
+    assert result["filtered_bytes"] == len(lock_diff)
+    assert result["filtered_tokens"] > 0
+
+    only_lock = asyncio.run(analyzer.analyze_changes([change("yarn.lock")], {}))
+    assert len(prompts) == 1
+    assert only_lock["score"] == 10.0 and only_lock["recommendation"] == "merge"
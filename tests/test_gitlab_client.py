@@ -0,0 +1,187 @@
+"""
+Tests for async GitLab client
+"""
+
+import asyncio
+import json
+import httpx
+
+from backend.gitlab_client import GitLabClient
+from backend.models import MRSnapshot
+
+
+def make_client(handler) -> GitLabClient:
+    """GitLab client with mocked HTTP transport"""
+    client = GitLabClient()
+    client.client = httpx.AsyncClient(base_url=client.api_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_get_all_follows_pagination():
+    """Paginated endpoints are read until X-Next-Page is empty"""
+    def handler(request):
+        page = int(request.url.params["page"])
+        headers = {"X-Next-Page": str(page + 1) if page < 3 else ""}
+        return httpx.Response(200, json=[{"id": page}], headers=headers)
+
+    client = make_client(handler)
+    notes = asyncio.run(client.list_mr_notes(1, 2))
+    assert [n["id"] for n in notes] == [1, 2, 3]
+
+
+def test_update_mr_labels_replaces_ai_labels():
+    """Old AI labels are removed and the new one is set in a single PUT"""
+    requests = []
+
+    def handler(request):
+        requests.append((request.method, json.loads(request.content)))
+        return httpx.Response(200, json={})
+
+    client = make_client(handler)
+    snapshot = MRSnapshot(project_id=1, mr_iid=2, mr={"labels": ["backend", "ai-needs-fixes"]})
+    asyncio.run(client.update_mr_labels(snapshot, score=8.5))
+    assert requests == [("PUT", {"labels": "backend,ai-approved"})]
+
+
+def test_snapshot_is_fetched_with_one_request():
+    """MR metadata, changes and changed-lines count come from a single /changes call"""
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.path)
+        return httpx.Response(200, json={
+            "title": "Fix",
+            "labels": [],
+            "diff_refs": {"head_sha": "abc"},
+            "changes": [{"new_path": "a.py", "diff": "-x\n+y\n+z\n"}]
+        })
+
+    client = make_client(handler)
+    snapshot = asyncio.run(client.get_mr_snapshot(1, 2))
+    assert paths == ["/api/v4/projects/1/merge_requests/2/changes"]
+    assert snapshot.head_sha == "abc"
+    assert snapshot.lines_changed == 3
+    assert "changes" not in snapshot.mr
+
+
+def test_stream_changes_reads_diffs_page_by_page():
+    """Diffs are yielded per file across pages and changed lines are counted"""
+    def handler(request):
+        page = int(request.url.params["page"])
+        headers = {"X-Next-Page": "2" if page == 1 else ""}
+        return httpx.Response(200, json=[{"new_path": f"f{page}.py", "diff": "+a\n-b\n"}], headers=headers)
+
+    async def scenario():
+        client = make_client(handler)
+        snapshot = MRSnapshot(project_id=1, mr_iid=2, mr={}, changes_streamed=True)
+        paths = [change["new_path"] async for change in client.stream_changes(snapshot)]
+        return paths, snapshot.lines_changed
+
+    assert asyncio.run(scenario()) == (["f1.py", "f2.py"], 4)
+
+
+def test_metadata_cache_revalidates_with_etag():
+    """Fresh entries skip the network, expired ones are revalidated with If-None-Match"""
+    requests = []
+
+    def handler(request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == 'W/"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"id": 1, "name": "demo"}, headers={"ETag": 'W/"v1"'})
+
+    async def scenario():
+        client = make_client(handler)
+        first = await client.get_project(1)
+        second = await client.get_project(1)
+        client.cache.ttl = 0
+        third = await client.get_project(1)
+        return first, second, third, client.cache.get_stats()
+
+    first, second, third, stats = asyncio.run(scenario())
+    assert first == second == third == {"id": 1, "name": "demo"}
+    assert requests == [None, 'W/"v1"']
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["revalidated"] == 1
+
+
+def test_metadata_cache_evicts_least_recently_used():
+    from backend.cache import TTLCache
+
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_retries_429_and_5xx_then_succeeds(monkeypatch):
+    """Rate-limited and failed GETs are retried with backoff"""
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "GITLAB_RETRY_BACKOFF", 0)
+    statuses = iter([429, 502, 200])
+
+    def handler(request):
+        status = next(statuses)
+        headers = {"Retry-After": "0"} if status == 429 else {}
+        return httpx.Response(status, json={"id": 1} if status == 200 else {}, headers=headers)
+
+    client = make_client(handler)
+    assert asyncio.run(client.get_project(1)) == {"id": 1}
+    stats = client.scheduler.get_stats()
+    assert stats["retries"] == 2 and stats["rate_limited"] == 1
+
+
+def test_post_is_not_retried_on_server_error(monkeypatch):
+    """A note is never posted twice after an ambiguous 5xx"""
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "GITLAB_RETRY_BACKOFF", 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(500, json={})
+
+    client = make_client(handler)
+    response = asyncio.run(client._send("POST", "/projects/1/merge_requests/2/notes", json={"body": "x"}))
+    assert response.status_code == 500
+    assert calls == ["POST"]
+
+
+def test_scheduler_holds_background_calls_when_quota_is_low():
+    """Low RateLimit-Remaining blocks polling until reset, review calls still pass"""
+    import time
+    from backend.gitlab_client import GitLabRequestScheduler, Priority
+
+    scheduler = GitLabRequestScheduler(rate=100, burst=10, reserve=5)
+    scheduler.update_from_headers(httpx.Headers({
+        "RateLimit-Remaining": "3",
+        "RateLimit-Reset": str(int(time.time()) + 30)
+    }))
+    assert scheduler._try_acquire(Priority.HIGH) == 0
+    assert scheduler._try_acquire(Priority.LOW) > 20
+
+    scheduler.update_from_headers(httpx.Headers({"RateLimit-Remaining": "0", "RateLimit-Reset": str(int(time.time()) + 30)}))
+    assert scheduler._try_acquire(Priority.HIGH) > 20
+
+
+def test_raw_file_is_cached_per_ref():
+    """File content at a commit is fetched once; a missing file is None"""
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.raw_path.decode())
+        if "missing" in request.url.path:
+            return httpx.Response(404)
+        return httpx.Response(200, text="*.pb.go linguist-generated")
+
+    client = make_client(handler)
+    assert asyncio.run(client.get_file_raw(1, ".gitattributes", "abc")) == "*.pb.go linguist-generated"
+    assert asyncio.run(client.get_file_raw(1, ".gitattributes", "abc")) == "*.pb.go linguist-generated"
+    assert asyncio.run(client.get_file_raw(1, "docs/missing.txt", "abc")) is None
+    assert len(paths) == 2
+    assert paths[1].startswith("/api/v4/projects/1/repository/files/docs%2Fmissing.txt/raw")
@@ -0,0 +1,56 @@
+"""
+Tests for incremental parsing of streamed review JSON
+"""
+
+import json
+
+import pytest
+
+from backend.json_stream import IssueStreamParser, MalformedResponseError
+
+RESPONSE = json.dumps({
+    "summary": "Found \"issues\" [here] {x}",
+    "score": 6.5,
+    "issues": [
+        {"file_path": "a.py", "line": 1, "description": 'Braces } and ] in "strings" \\', "tags": ["x"]},
+        {"file_path": "b.py", "line": 2, "description": "Nested", "extra": {"k": [1, 2]}}
+    ],
+    "recommendation": "needs_fixes"
+}, ensure_ascii=False)
+
+
+def test_issues_are_emitted_as_soon_as_they_complete():
+    parser = IssueStreamParser()
+    emitted = []
+    first_complete_at = None
+    for i in range(0, len(RESPONSE), 7):
+        issues = parser.feed(RESPONSE[i:i + 7])
+        if issues and first_complete_at is None:
+            first_complete_at = i + 7
+        emitted.extend(issues)
+
+    assert [issue["file_path"] for issue in emitted] == ["a.py", "b.py"]
+    assert emitted[1]["extra"] == {"k": [1, 2]}
+    assert first_complete_at < RESPONSE.index("b.py") + 7
+
+
+def test_fenced_response_is_accepted():
+    parser = IssueStreamParser()
+
+    issues = parser.feed("```json\n" + RESPONSE + "\n```")
+
+    assert len(issues) == 2
+
+
+def test_prose_instead_of_json_is_rejected_early():
+    parser = IssueStreamParser()
+
+    with pytest.raises(MalformedResponseError):
+        parser.feed("Sure! Here is the review")
+
+
+def test_non_object_issue_is_rejected():
+    parser = IssueStreamParser()
+
+    with pytest.raises(MalformedResponseError):
+        parser.feed('{"summary": "x", "issues": [["a.py", 1]')
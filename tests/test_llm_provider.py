@@ -0,0 +1,474 @@
+"""
+Tests for LLM providers
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from backend.llm_limiter import ProviderLimiter
+from backend.llm_provider import GeminiProvider, LLMProvider
+
+
+class FakeGeminiModel:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.cancelled = False
+
+    def generate_content(self, *args, **kwargs):
+        raise AssertionError("blocking API must not be used")
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        text = '{"summary": "ok", "score": 9, "issues": []}'
+        if stream:
+            return FakeGeminiStream([text[:10], text[10:]])
+        return type("Response", (), {"text": text})()
+
+
+class FakeGeminiStream:
+    def __init__(self, texts: list):
+        self.texts = texts
+
+    async def __aiter__(self):
+        for text in self.texts:
+            yield type("Chunk", (), {"text": text})()
+
+
+def make_gemini(delay: float) -> GeminiProvider:
+    provider = GeminiProvider.__new__(GeminiProvider)
+    provider.model = FakeGeminiModel(delay)
+    return provider
+
+
+def test_gemini_does_not_block_event_loop():
+    provider = make_gemini(0.05)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        task = asyncio.create_task(ticker())
+        result = await provider.analyze_code("prompt")
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(run())
+
+    assert result["score"] == 9
+    assert ticks > 3
+
+
+def test_gemini_call_is_cancelled_on_timeout():
+    provider = make_gemini(10)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(provider.analyze_code("prompt"), timeout=0.05))
+
+    assert provider.model.cancelled
+
+
+def test_limiter_caps_in_flight_requests_in_arrival_order():
+    limiter = ProviderLimiter("test", max_in_flight=1)
+    order = []
+
+    async def request(i: int):
+        await limiter.acquire(10)
+        order.append(i)
+        await asyncio.sleep(0.01)
+        assert limiter.in_flight == 1
+        limiter.release()
+
+    async def run():
+        await asyncio.gather(*(request(i) for i in range(4)))
+
+    asyncio.run(run())
+
+    assert order == [0, 1, 2, 3]
+    stats = limiter.get_stats()
+    assert stats["requests"] == 4
+    assert stats["in_flight"] == 0
+    assert stats["max_wait_seconds"] > 0
+
+
+def test_limiter_waits_for_tokens_per_minute_quota():
+    limiter = ProviderLimiter("test", tpm=600)  # 10 tokens per second
+
+    async def run():
+        await limiter.acquire(500)
+        limiter.release(100)  # response tokens drain the rest of the bucket
+        started = time.monotonic()
+        await limiter.acquire(3)
+        limiter.release()
+        return time.monotonic() - started
+
+    waited = asyncio.run(run())
+
+    assert waited >= 0.2
+    assert limiter.get_stats()["throttled"] >= 1
+
+
+class FlakyProvider(LLMProvider):
+    def __init__(self, name: str, errors: list):
+        self.name = name
+        self.model_name = f"{name}-model"
+        self.errors = errors
+        self.calls = 0
+
+    async def analyze_code(self, prompt: str):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"summary": self.name, "score": 8.0, "issues": []}
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def resilience(monkeypatch):
+    from backend import llm_resilience
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "LLM_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(settings, "LLM_BREAKER_FAILURES", 3)
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    return llm_resilience
+
+
+def test_transient_errors_are_retried(resilience):
+    primary = FlakyProvider("gemini", [StatusError(503), asyncio.TimeoutError()])
+    provider = resilience.ResilientProvider([primary], max_retries=2)
+
+    result = asyncio.run(provider.analyze_code("prompt"))
+
+    assert result["summary"] == "gemini"
+    assert primary.calls == 3
+
+
+def test_permanent_error_falls_back_without_retry(resilience):
+    primary = FlakyProvider("gemini", [StatusError(400)])
+    fallback = FlakyProvider("openai", [])
+    provider = resilience.ResilientProvider([primary, fallback], max_retries=2)
+
+    result = asyncio.run(provider.analyze_code("prompt"))
+
+    assert result["summary"] == "openai"
+    assert primary.calls == 1
+    assert resilience.get_breaker("gemini").state == "closed"
+
+
+def test_open_circuit_breaker_skips_provider(resilience):
+    primary = FlakyProvider("gemini", [StatusError(429)] * 10)
+    fallback = FlakyProvider("openai", [])
+    provider = resilience.ResilientProvider([primary, fallback], max_retries=5)
+
+    asyncio.run(provider.analyze_code("prompt"))  # 3 failures open the breaker
+    asyncio.run(provider.analyze_code("prompt"))
+
+    assert primary.calls == 3
+    assert fallback.calls == 2
+    assert resilience.get_breaker("gemini").state == "open"
+
+
+def test_half_open_trial_with_bad_request_releases_breaker(resilience, monkeypatch):
+    monkeypatch.setattr(resilience.settings, "LLM_BREAKER_RESET", 0.01)
+    primary = FlakyProvider("gemini", [StatusError(503)] * 3 + [StatusError(400)])
+    provider = resilience.ResilientProvider([primary], max_retries=0)
+
+    for _ in range(4):  # 3 failures open the breaker, the trial gets a 400
+        time.sleep(0.02)
+        with pytest.raises(resilience.LLMUnavailableError):
+            asyncio.run(provider.analyze_code("prompt"))
+    time.sleep(0.02)
+    result = asyncio.run(provider.analyze_code("prompt"))
+
+    assert result["summary"] == "gemini"
+    assert primary.calls == 5
+    assert resilience.get_breaker("gemini").state == "closed"
+
+
+def test_all_providers_failing_raises(resilience):
+    provider = resilience.ResilientProvider([FlakyProvider("gemini", [StatusError(401)])], max_retries=2)
+
+    with pytest.raises(resilience.LLMUnavailableError):
+        asyncio.run(provider.analyze_code("prompt"))
+
+
+class HangingProvider(FlakyProvider):
+    async def analyze_code(self, prompt: str):
+        self.calls += 1
+        await asyncio.sleep(3600)
+
+
+def test_hanging_provider_times_out_and_falls_back(resilience):
+    primary = HangingProvider("gemini", [])
+    fallback = FlakyProvider("openai", [])
+    provider = resilience.ResilientProvider([primary, fallback], max_retries=2, attempt_timeout=0.05)
+
+    started = time.monotonic()
+    result = asyncio.run(provider.analyze_code("prompt"))
+
+    assert result["summary"] == "openai"
+    assert primary.calls == 1
+    assert time.monotonic() - started < 1
+
+
+def test_hanging_last_provider_is_retried(resilience):
+    primary = HangingProvider("gemini", [])
+    provider = resilience.ResilientProvider([primary], max_retries=2, attempt_timeout=0.05)
+
+    with pytest.raises(resilience.LLMUnavailableError):
+        asyncio.run(provider.analyze_code("prompt"))
+
+    assert primary.calls == 3
+
+
+def test_fallback_gets_share_of_total_timeout(resilience, monkeypatch):
+    monkeypatch.setattr(resilience, "MIN_ATTEMPT_TIME", 0.01)
+    primary = HangingProvider("gemini", [])
+    fallback = FlakyProvider("openai", [])
+    provider = resilience.ResilientProvider([primary, fallback], max_retries=2, total_timeout=0.4)
+
+    started = time.monotonic()
+    result = asyncio.run(asyncio.wait_for(provider.analyze_code("prompt"), timeout=0.4))
+
+    assert result["summary"] == "openai"
+    assert primary.calls == 1
+    assert time.monotonic() - started < 0.3
+
+
+class SlowProvider(LLMProvider):
+    def __init__(self, name: str, delays: list):
+        self.name = name
+        self.model_name = f"{name}-model"
+        self.delays = delays
+        self.cancelled = 0
+
+    async def analyze_code(self, prompt: str):
+        try:
+            await asyncio.sleep(self.delays.pop(0))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"summary": self.name, "score": 8.0, "issues": []}
+
+
+def test_slow_request_is_hedged_and_loser_cancelled():
+    from backend.llm_hedging import HedgedProvider
+
+    primary = SlowProvider("gemini", [10])
+    hedge = SlowProvider("openai", [0.01])
+    provider = HedgedProvider(primary, hedge, min_samples=1, initial_delay=0.05)
+
+    result = asyncio.run(provider.analyze_code("prompt"))
+
+    assert result["summary"] == "openai"
+    assert primary.cancelled == 1
+    stats = provider.get_stats()
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_fast_request_is_not_hedged():
+    from backend.llm_hedging import HedgedProvider
+
+    primary = SlowProvider("gemini", [0.01])
+    provider = HedgedProvider(primary, min_samples=1, initial_delay=1.0)
+
+    asyncio.run(provider.analyze_code("prompt"))
+
+    assert provider.get_stats()["hedged"] == 0
+    assert provider.get_stats()["primary_wins"] == 1
+
+
+def test_malformed_stream_is_aborted_early():
+    from backend.json_stream import MalformedResponseError
+    from backend.llm_provider import get_streaming_stats
+
+    provider = make_gemini(0)
+    sent = []
+
+    async def stream(prompt, stream=False, **kwargs):
+        async def chunks():
+            for text in ["I cannot ", "review this ", "code"] + ["..."] * 100:
+                sent.append(text)
+                yield type("Chunk", (), {"text": text})()
+        return type("Stream", (), {"__aiter__": lambda self: chunks()})()
+
+    provider.model.generate_content_async = stream
+    aborted = get_streaming_stats()["aborted"]
+
+    with pytest.raises(MalformedResponseError):
+        asyncio.run(provider.analyze_code("prompt"))
+
+    assert len(sent) == 1
+    assert get_streaming_stats()["aborted"] == aborted + 1
+
+
+def test_stream_with_prose_around_json_is_extracted(monkeypatch):
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "LLM_STRUCTURED_OUTPUT", False)
+    provider = make_gemini(0)
+    texts = ["Вот результат ревью:\n", "```json\n", '{"summary": "ok", "score": 9, ', '"issues": []}\n', "```"]
+
+    async def stream(prompt, stream=False, **kwargs):
+        async def chunks():
+            for text in texts:
+                yield type("Chunk", (), {"text": text})()
+        return type("Stream", (), {"__aiter__": lambda self: chunks()})()
+
+    provider.model.generate_content_async = stream
+    result = asyncio.run(provider.analyze_code("prompt"))
+
+    assert result["summary"] == "ok"
+    assert result["score"] == 9
+
+
+def test_streaming_is_a_provider_capability(monkeypatch):
+    from backend.config import settings
+    from backend.llm_provider import ClaudeProvider, OpenAIProvider
+
+    monkeypatch.setattr(settings, "LLM_STREAMING", True)
+    wrapper = FlakyProvider("wrapper", [])
+
+    assert all(cls.supports_streaming for cls in (OpenAIProvider, GeminiProvider, ClaudeProvider))
+    assert make_gemini(0).streaming
+    assert not wrapper.streaming
+    assert not hasattr(wrapper, "_stream_text")
+
+    monkeypatch.setattr(settings, "LLM_STREAMING", False)
+    assert not make_gemini(0).streaming
+
+
+def test_gemini_context_caches_are_bounded_and_retried(monkeypatch):
+    from backend.config import settings
+    from backend.prompts import ReviewPrompt
+
+    monkeypatch.setattr(settings, "LLM_PROMPT_CACHING", True)
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_MIN_TOKENS", 1)
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_MAX_SIZE", 2)
+    provider = make_gemini(0)
+    created = []
+
+    async def create(prefix):
+        created.append(prefix)
+        return None if prefix == "flaky" else f"model:{prefix}"
+
+    provider._create_cached_model = create
+
+    async def run():
+        for prefix in ["flaky", "flaky", "a", "a", "b", "c"]:
+            await provider._model_for(ReviewPrompt(prefix, "diff"))
+
+    asyncio.run(run())
+
+    assert created == ["flaky", "flaky", "a", "b", "c"]  # failed creation is not cached
+    assert provider._context_caches.get_stats()["size"] == 2
+
+
+def test_claude_marks_prompt_prefix_for_caching():
+    from backend.llm_provider import ClaudeProvider
+    from backend.prompts import get_review_prompt
+
+    provider = ClaudeProvider.__new__(ClaudeProvider)
+    provider.model = "claude-3-haiku-20240307"
+    prompt = get_review_prompt("+print(1)")
+
+    content = provider._request(prompt)["messages"][0]["content"]
+
+    assert content[0]["cache_control"] == {"type": "ephemeral"}
+    assert content[0]["text"] == prompt.prefix
+    assert "+print(1)" in content[1]["text"]
+    assert provider._request("plain prompt")["messages"][0]["content"] == "plain prompt"
+
+
+def test_review_schema_is_derived_from_models():
+    from backend.llm_provider import REVIEW_SCHEMA, to_json_schema
+
+    issue = REVIEW_SCHEMA["properties"]["issues"]["items"]
+    assert REVIEW_SCHEMA["required"] == ["summary", "score", "issues", "recommendation", "estimated_time_saved"]
+    assert issue["properties"]["severity"]["enum"] == ["critical", "medium", "low", "info"]
+    assert issue["properties"]["line"] == {"type": "integer", "nullable": True}
+
+    strict = to_json_schema(REVIEW_SCHEMA, strict=True)
+    strict_issue = strict["properties"]["issues"]["items"]
+    assert strict["additionalProperties"] is False
+    assert strict_issue["additionalProperties"] is False
+    assert strict_issue["properties"]["line"] == {"type": ["integer", "null"]}
+
+
+def test_providers_request_structured_output():
+    from backend.llm_provider import REVIEW_SCHEMA, ClaudeProvider, OpenAIProvider
+
+    openai = OpenAIProvider.__new__(OpenAIProvider)
+    openai.model = "gpt-4o-mini"
+    response_format = openai._request("prompt")["response_format"]
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"]["strict"] is True
+
+    generation_config = make_gemini(0)._request()["generation_config"]
+    assert generation_config["response_mime_type"] == "application/json"
+    assert generation_config["response_schema"] == REVIEW_SCHEMA
+
+    claude = ClaudeProvider.__new__(ClaudeProvider)
+    claude.model = "claude-3-haiku-20240307"
+    request = claude._request("prompt")
+    assert request["tool_choice"] == {"type": "tool", "name": "submit_review"}
+    assert request["tools"][0]["input_schema"]["properties"]["issues"]["type"] == "array"
+
+
+class FakeClaudeStream:
+    def __init__(self, events: list):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+    async def get_final_message(self):
+        usage = type("Usage", (), {"input_tokens": 10, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0})()
+        return type("Message", (), {"usage": usage})()
+
+
+def test_claude_streams_review_tool_input():
+    import json
+
+    from backend.llm_provider import ClaudeProvider
+
+    answer = json.dumps({
+        "summary": "ok", "score": 8, "recommendation": "merge", "estimated_time_saved": 5,
+        "issues": [{"file_path": "a.md", "line": 1, "severity": "low", "issue_type": "code_style",
+                    "description": "d", "suggestion": "s", "code_snippet": "```py\nx\n```"}]
+    })
+    events = [type("Event", (), {"type": "input_json", "partial_json": answer[i:i + 20]})() for i in range(0, len(answer), 20)]
+    events.insert(0, type("Event", (), {"type": "content_block_start"})())
+
+    provider = ClaudeProvider.__new__(ClaudeProvider)
+    provider.model = "claude-3-haiku-20240307"
+    provider.client = type("Client", (), {"messages": type("Messages", (), {"stream": lambda self, **kwargs: FakeClaudeStream(events)})()})()
+
+    result = asyncio.run(provider.analyze_code("prompt"))
+
+    assert result["score"] == 8
+    assert result["issues"][0]["code_snippet"] == "```py\nx\n```"  # fences inside the JSON are kept
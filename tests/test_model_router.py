@@ -0,0 +1,88 @@
+"""
+Tests for tiered model routing
+"""
+
+import asyncio
+
+from backend.code_analyzer import CodeAnalyzer
+from backend.llm_provider import LLMProvider
+from backend.model_router import ModelRouter, parse_tier_model
+
+
+class FakeProvider(LLMProvider):
+    name = "fake"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.prompts = []
+
+    async def analyze_code(self, prompt: str):
+        self.prompts.append(prompt)
+        return {"summary": self.model_name, "score": 8.0, "issues": [], "recommendation": "merge"}
+
+
+def make_router() -> ModelRouter:
+    tiers = {tier: FakeProvider(f"{tier}-model") for tier in ("fast", "standard", "strong")}
+    return ModelRouter(tiers, risky_paths=["payment/**", "*migration*"], fast_max_risk=1.0, strong_min_risk=3.0)
+
+
+def test_parse_tier_model():
+    assert parse_tier_model("", "gemini") == ("gemini", None)
+    assert parse_tier_model("gemini-2.5-pro", "gemini") == ("gemini", "gemini-2.5-pro")
+    assert parse_tier_model("claude:claude-sonnet-4-20250514", "gemini") == ("claude", "claude-sonnet-4-20250514")
+
+
+def test_route_by_size_paths_and_static_hits():
+    router = make_router()
+
+    assert router.route(500, ["README.md"], []) == "fast"
+    assert router.route(15000, ["app/views.py"], []) == "standard"
+    assert router.route(40000, ["app/views.py"], []) == "strong"
+    assert router.route(500, ["src/payment/charge.py"], []) == "strong"
+    assert router.route(500, ["db/0042_migration.py"], []) == "strong"
+    assert router.route(500, ["app/views.py"], [{"severity": "medium"}]) == "standard"
+    assert router.route(500, ["app/views.py"], [{"severity": "critical"}]) == "strong"
+
+
+def test_chunks_are_sent_to_their_tier():
+    router = make_router()
+    analyzer = CodeAnalyzer.__new__(CodeAnalyzer)
+    analyzer.llm_provider = router
+    changes = [
+        {"new_path": "docs/intro.py", "diff": "@@ -1 +1 @@\n-x = 1\n+x = 2\n"},
+        {"new_path": "payment/charge.py", "diff": "@@ -1 +1 @@\n-y = 1\n+y = 2\n"},
+    ]
+
+    first = asyncio.run(analyzer.analyze_changes(changes[:1], {}))
+    second = asyncio.run(analyzer.analyze_changes(changes[1:], {}))
+
+    assert first["model_tiers"] == {"fast": 1}
+    assert second["model_tiers"] == {"strong": 1}
+    assert len(router.tiers["fast"].prompts) == 1
+    assert len(router.tiers["strong"].prompts) == 1
+    stats = router.get_stats()
+    assert stats["fast"]["requests"] == 1
+    assert stats["strong"]["input_tokens"] > 0
+    assert stats["standard"]["requests"] == 0
+
+
+def test_cached_analysis_of_weaker_tier_is_not_reused(monkeypatch):
+    from backend import database
+    from backend.review_cache import ReviewCache
+
+    monkeypatch.setattr(database, "SessionLocal", None)
+    router = make_router()
+    analyzer = CodeAnalyzer.__new__(CodeAnalyzer)
+    analyzer.llm_provider = router
+    analyzer.cache = ReviewCache(max_size=10)
+    changes = [{"new_path": "app/views.py", "diff": "@@ -1 +1 @@\n-x = 1\n+x = 2\n"}]
+
+    assert asyncio.run(analyzer.analyze_changes(changes, {}))["model_tiers"] == {"fast": 1}
+
+    router.risky_paths = ["app/**"]  # same diff now needs the strong model
+    assert asyncio.run(analyzer.analyze_changes(changes, {}))["model_tiers"] == {"strong": 1}
+
+    router.risky_paths = []  # the strong answer is good enough for the fast tier
+    assert asyncio.run(analyzer.analyze_changes(changes, {}))["model_tiers"] == {}
+    assert len(router.tiers["fast"].prompts) == 1
+    assert len(router.tiers["strong"].prompts) == 1
@@ -0,0 +1,33 @@
+"""
+Tests for review prompt layout
+"""
+
+from backend.prompts import get_review_prompt
+
+
+def test_prompt_prefix_is_stable_and_diff_goes_last():
+    first = get_review_prompt("diff one", custom_rules="No prints", learned_patterns="\n- learned rule\n")
+    second = get_review_prompt("another diff", custom_rules="No prints", learned_patterns="\n- learned rule\n")
+
+    assert first.prefix == second.prefix
+    assert "No prints" in first.prefix
+    assert "learned rule" in first.prefix
+    assert "diff one" in first.changes
+    assert str(first) == first.prefix + first.changes
+
+
+def test_default_prompt_keeps_instructions_in_prefix():
+    prompt = get_review_prompt("some diff")
+
+    assert "КРИТЕРИИ АНАЛИЗА" in prompt.prefix
+    assert '"summary"' in prompt.prefix
+    assert prompt.changes.strip().startswith("ИЗМЕНЕНИЯ В КОДЕ:")
+
+
+def test_repository_rules_extend_the_full_review_prompt():
+    prompt = get_review_prompt("some diff", project_rules="CODE STYLE:\n- Follow PEP 8")
+
+    assert "КРИТЕРИИ АНАЛИЗА" in prompt.prefix
+    assert "УРОВНИ SEVERITY" in prompt.prefix
+    assert "Follow PEP 8" in prompt.prefix
+    assert "some diff" in prompt.changes
@@ -0,0 +1,131 @@
+import asyncio
+
+from backend import repo_rules
+from backend.repo_rules import compile_rules, load_repo_rules
+from backend.static_checks import scan_diff
+
+RULES = """
+project_context:
+  name: Demo
+  tech_stack: [Python, FastAPI]
+code_style:
+  - "Используйте type hints в Python"
+  - "Максимальная длина строки: 40 символов"
+  - "Следуйте PEP 8"
+security_rules:
+  - "Запрещены хардкод пароли"
+auto_actions:
+  auto_label: true
+checks:
+  forbidden_patterns:
+    - pattern: '\\bprint\\('
+      message: "print() вместо логирования"
+      severity: low
+    - pattern: '(unclosed'
+      message: "invalid"
+"""
+
+
+def test_machine_checkable_rules_are_compiled_out_of_the_prompt():
+    rules = compile_rules(RULES, "abc")
+
+    assert rules.checks.max_line_length == 40
+    assert rules.checks.require_type_hints
+    assert [p.pattern for p in rules.checks.forbidden_patterns] == [r"\bprint\("]
+    assert "PEP 8" in rules.prompt_rules
+    assert "хардкод пароли" in rules.prompt_rules
+    assert "Demo" in rules.prompt_rules
+    assert "type hints" not in rules.prompt_rules
+    assert "auto_label" not in rules.prompt_rules
+    assert "type hints" in rules.prompt(include_checked=True)
+
+
+def test_invalid_yaml_is_ignored():
+    assert compile_rules("code_style: [unclosed") is None
+
+
+def test_local_matchers_report_issues():
+    checks = compile_rules(RULES).checks.model_dump(mode="json")
+    diff = (
+        "@@ -1,1 +1,4 @@\n"
+        " import os\n"
+        "+def handler(request, user_id: int) -> dict:\n"
+        "+    print(request)\n"
+        "+    return {'value': os.environ.get('SOME_VERY_LONG_VARIABLE_NAME')}\n"
+    )
+
+    issues = scan_diff("app.py", diff, checks)["issues"]
+    by_rule = {issue["rule_id"]: issue["line"] for issue in issues}
+
+    assert by_rule["type-hints"] == 2
+    assert by_rule[r"forbidden:\bprint\("] == 3
+    assert by_rule["line-length"] == 4
+    assert scan_diff("app.py", diff)["issues"] == []
+
+
+def test_unknown_severity_is_mapped():
+    rules = compile_rules(
+        "checks:\n"
+        "  forbidden_patterns:\n"
+        "    - {pattern: 'a', message: m, severity: high}\n"
+        "    - {pattern: 'b', message: m, severity: bogus}\n"
+        "    - {pattern: 'c', message: m, severity: LOW}\n"
+    )
+
+    assert [p.severity.value for p in rules.checks.forbidden_patterns] == ["critical", "medium", "low"]
+
+
+def test_invalid_static_finding_does_not_abort_review():
+    from backend.code_analyzer import CodeAnalyzer
+    from backend.models import AnalysisResult
+
+    analysis = AnalysisResult(summary="ok", score=9.0, issues=[], recommendation="merge")
+    finding = {"rule_id": "forbidden:x", "file_path": "a.py", "line": 1, "severity": "high",
+               "issue_type": "code_style", "description": "d", "suggestion": "s"}
+
+    result = CodeAnalyzer.__new__(CodeAnalyzer)._add_static_issues(analysis, [finding, {**finding, "severity": "low"}])
+
+    assert [issue.severity.value for issue in result.issues] == ["low"]
+
+
+def test_rejected_patterns_are_reported():
+    from backend.static_checks import rule_error_issues
+
+    rules = compile_rules(
+        "checks:\n"
+        "  rule_errors: [injected]\n"
+        "  forbidden_patterns:\n"
+        "    - {pattern: '(unclosed', message: m}\n"
+        f"    - {{pattern: '{'a' * 300}', message: m}}\n"
+        "    - {pattern: 'ok', message: m}\n"
+    )
+
+    assert [p.pattern for p in rules.checks.forbidden_patterns] == ["ok"]
+    assert len(rules.checks.rule_errors) == 2
+    [issue] = rule_error_issues(rules.checks.model_dump(mode="json"))
+    assert issue["rule_id"] == "invalid-rule"
+    assert issue["file_path"] == ".codereview-rules.yaml"
+    assert "(unclosed" in issue["description"] and "longer than" in issue["description"]
+
+
+class FakeGitLab:
+    def __init__(self):
+        self.downloads = 0
+
+    async def get_file_blob_id(self, project_id, path, ref):
+        return "blob-sha-1"
+
+    async def get_blob_raw(self, project_id, blob_id):
+        self.downloads += 1
+        return RULES
+
+
+def test_rules_are_compiled_once_per_blob():
+    repo_rules._compiled.clear()
+    gitlab = FakeGitLab()
+
+    first = asyncio.run(load_repo_rules(gitlab, 1, "head-1"))
+    second = asyncio.run(load_repo_rules(gitlab, 1, "head-2"))
+
+    assert first is second
+    assert gitlab.downloads == 1
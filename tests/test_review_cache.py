@@ -0,0 +1,27 @@
+"""
+Tests for per-file review cache
+"""
+
+import asyncio
+
+from backend import database
+from backend.review_cache import ReviewCache, make_cache_key
+
+
+def test_review_cache_is_persisted(sqlite_db):
+    """Cached file analysis survives a restart via the review_cache table"""
+    key = make_cache_key("context", "diff")
+    asyncio.run(ReviewCache().set(key, {"file_path": "a.py", "score": 8.0, "issues": []}))
+
+    fresh = ReviewCache()
+    assert asyncio.run(fresh.get(key))["score"] == 8.0
+    assert fresh.get_stats()["db_hits"] == 1
+    assert asyncio.run(fresh.get(make_cache_key("context", "other"))) is None
+
+    for i in range(3):
+        database.save_cached_review(f"k{i}", {"i": i})
+    assert database.prune_review_cache(max_rows=2) == 2
+    assert database.prune_review_cache(max_rows=2) == 0
+    assert database.get_cached_review(key, 3600) is None
+    assert database.get_cached_review("k0", 3600) is None
+    assert database.get_cached_review("k2", 3600) == {"i": 2}
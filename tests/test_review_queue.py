@@ -0,0 +1,292 @@
+"""
+Tests for review job queue
+"""
+
+import asyncio
+import pytest
+
+from backend import database
+from backend.review_queue import ReviewQueue, ReviewJob, QueueFullError
+
+
+def make_job(mr_iid: int, head_sha: str = None) -> ReviewJob:
+    return ReviewJob(project_id=1, mr_iid=mr_iid, mr_data={"iid": mr_iid}, head_sha=head_sha)
+
+
+async def wait_until(condition, timeout: float = 10.0):
+    """Poll condition until it is true or timeout passes"""
+    for _ in range(int(timeout / 0.02)):
+        if condition():
+            return
+        await asyncio.sleep(0.02)
+
+
+def test_queue_runs_jobs_with_bounded_workers():
+    """Workers drain the queue without exceeding configured concurrency"""
+    async def scenario():
+        running = 0
+        max_running = 0
+        done = []
+
+        async def handler(job):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            done.append(job.mr_iid)
+
+        queue = ReviewQueue(handler, workers=2, max_size=10)
+        queue.start()
+        for i in range(6):
+            await queue.enqueue(make_job(i))
+        await wait_until(lambda: len(done) == 6)
+        await queue.stop()
+        return done, max_running, await queue.get_stats()
+
+    done, max_running, stats = asyncio.run(scenario())
+    assert sorted(done) == list(range(6))
+    assert max_running == 2
+    assert stats["completed"] == 6
+
+
+def test_queue_rejects_when_full():
+    """Enqueue fails fast when max depth is reached"""
+    async def scenario():
+        async def handler(job):
+            pass
+
+        queue = ReviewQueue(handler, workers=1, max_size=1)
+        await queue.enqueue(make_job(1))
+        with pytest.raises(QueueFullError):
+            await queue.enqueue(make_job(2))
+
+    asyncio.run(scenario())
+
+
+def test_claim_is_exclusive_and_expired_lease_is_reclaimed(sqlite_db):
+    """Only one worker gets a job; a crashed worker's job is picked up again"""
+    job_id = database.enqueue_review_job(1, 7, {"project_id": 1, "mr_iid": 7, "mr_data": {}})["id"]
+
+    first = database.claim_review_job("worker-a", lease_seconds=60)
+    assert first["id"] == job_id
+    assert first["attempts"] == 1
+    assert database.claim_review_job("worker-b", lease_seconds=60) is None
+
+    # Simulate crash: lease already expired
+    database.renew_review_job_lease(job_id, "worker-a", lease_seconds=-1)
+    second = database.claim_review_job("worker-b", lease_seconds=60)
+    assert second["id"] == job_id
+    assert second["attempts"] == 2
+
+    # Old worker can no longer complete the job
+    assert not database.complete_review_job(job_id, "worker-a")
+    assert database.complete_review_job(job_id, "worker-b")
+    assert database.get_review_job_stats() == {"done": 1}
+
+
+def test_failed_job_is_retried_then_marked_failed(sqlite_db):
+    """Failures go back to the queue until max attempts are used"""
+    job_id = database.enqueue_review_job(1, 8, {}, max_attempts=2)["id"]
+
+    job = database.claim_review_job("w", lease_seconds=60)
+    database.fail_review_job(job_id, "w", "boom", job["attempts"], job["max_attempts"], retry_delay=0)
+    job = database.claim_review_job("w", lease_seconds=60)
+    assert job["attempts"] == 2
+    database.fail_review_job(job_id, "w", "boom", job["attempts"], job["max_attempts"], retry_delay=0)
+
+    assert database.claim_review_job("w", lease_seconds=60) is None
+    assert database.get_review_job_stats() == {"failed": 1}
+
+
+def test_durable_queue_processes_persisted_jobs(sqlite_db):
+    """Durable queue stores jobs in the database and workers drain them"""
+    async def scenario():
+        done = []
+
+        async def handler(job):
+            done.append(job.mr_iid)
+
+        queue = ReviewQueue(handler, workers=2, max_size=10, durable=True, poll_interval=0.05)
+        queue.start()
+        for i in range(3):
+            await queue.enqueue(make_job(i))
+        await wait_until(lambda: database.get_review_job_stats() == {"done": 3})
+        await queue.stop()
+        return done
+
+    assert sorted(asyncio.run(scenario())) == [0, 1, 2]
+    assert database.get_review_job_stats() == {"done": 3}
+
+
+def test_stop_waits_for_job_completion_update(sqlite_db, monkeypatch):
+    """Stopping the queue while a job is being marked done does not leave it running"""
+    import time
+
+    complete_review_job = database.complete_review_job
+
+    def slow_complete(job_id, worker_id):
+        time.sleep(0.2)
+        return complete_review_job(job_id, worker_id)
+
+    monkeypatch.setattr(database, "complete_review_job", slow_complete)
+
+    async def scenario():
+        done = []
+
+        async def handler(job):
+            done.append(job.mr_iid)
+
+        queue = ReviewQueue(handler, workers=1, max_size=10, durable=True, poll_interval=0.05)
+        queue.start()
+        await queue.enqueue(make_job(1))
+        await wait_until(lambda: done)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert database.get_review_job_stats() == {"done": 1}
+
+
+def test_stop_right_after_handler_keeps_job_done(sqlite_db):
+    """Shutdown racing a just-finished review does not hand the job back for a rerun"""
+    async def scenario():
+        stopping = []
+
+        async def handler(job):
+            # Schedule stop() so it cancels the worker before it resumes after the handler
+            stopping.append(asyncio.ensure_future(queue.stop()))
+
+        queue = ReviewQueue(handler, workers=1, max_size=10, durable=True, poll_interval=0.05)
+        queue.start()
+        await queue.enqueue(make_job(1))
+        await wait_until(lambda: stopping)
+        await stopping[0]
+        return await queue.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["completed"] == 1
+    assert database.get_review_job_stats() == {"done": 1}
+
+
+def test_enqueue_does_not_cancel_its_own_claimed_job(sqlite_db, monkeypatch):
+    """A worker claiming the new row before enqueue returns is not treated as superseded"""
+    enqueue_review_job = database.enqueue_review_job
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        release = asyncio.Event()
+        started = []
+
+        async def handler(job):
+            started.append(job.job_id)
+            await release.wait()
+
+        async def claim():
+            queue.start()
+            await wait_until(lambda: started)
+
+        def enqueue_and_claim(*args, **kwargs):
+            # The worker wins the race between the insert and enqueue() returning
+            result = enqueue_review_job(*args, **kwargs)
+            asyncio.run_coroutine_threadsafe(claim(), loop).result()
+            return result
+
+        monkeypatch.setattr(database, "enqueue_review_job", enqueue_and_claim)
+        queue = ReviewQueue(handler, workers=1, max_size=10, durable=True, poll_interval=0.05)
+        await queue.enqueue(make_job(1, head_sha="a"))
+        release.set()
+        await wait_until(lambda: queue.completed_jobs == 1)
+        await queue.stop()
+        return await queue.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["cancelled"] == 0
+    assert stats["jobs"] == {"done": 1}
+
+
+def test_newer_event_replaces_pending_job():
+    """Only the latest queued event per MR is reviewed"""
+    async def scenario():
+        reviewed = []
+
+        async def handler(job):
+            reviewed.append(job.head_sha)
+
+        queue = ReviewQueue(handler, workers=1, max_size=10)
+        for sha in ["a", "b", "c"]:
+            await queue.enqueue(make_job(1, head_sha=sha))
+        queue.start()
+        await wait_until(lambda: reviewed)
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return reviewed, await queue.get_stats()
+
+    reviewed, stats = asyncio.run(scenario())
+    assert reviewed == ["c"]
+    assert stats["coalesced"] == 2
+
+
+def test_newer_event_cancels_running_review():
+    """Running review of an old head SHA is cancelled by a new push"""
+    async def scenario():
+        finished = []
+
+        async def handler(job):
+            await asyncio.sleep(0.3 if job.head_sha == "old" else 0)
+            finished.append(job.head_sha)
+
+        queue = ReviewQueue(handler, workers=1, max_size=10)
+        queue.start()
+        await queue.enqueue(make_job(1, head_sha="old"))
+        await wait_until(lambda: queue.active_jobs == 1)
+        await queue.enqueue(make_job(1, head_sha="new"))
+        await wait_until(lambda: finished)
+        await asyncio.sleep(0.4)
+        await queue.stop()
+        return finished, await queue.get_stats()
+
+    finished, stats = asyncio.run(scenario())
+    assert finished == ["new"]
+    assert stats["cancelled"] == 1
+
+
+def test_durable_enqueue_coalesces_and_supersedes(sqlite_db):
+    """Queued job is replaced in place, running job is marked superseded"""
+    first = database.enqueue_review_job(1, 9, {"v": 1}, head_sha="a")
+    second = database.enqueue_review_job(1, 9, {"v": 2}, head_sha="b")
+    assert second["coalesced"] and second["id"] == first["id"]
+
+    running = database.claim_review_job("w", lease_seconds=60)
+    assert running["payload"] == {"v": 2}
+
+    third = database.enqueue_review_job(1, 9, {"v": 3}, head_sha="c")
+    assert not third["coalesced"]
+    assert third["superseded"] == [running["id"]]
+    assert not database.renew_review_job_lease(running["id"], "w", 60)
+    assert database.get_review_job_stats() == {"superseded": 1, "queued": 1}
+
+
+def test_same_head_sha_is_not_queued_twice(sqlite_db):
+    """Event with an unchanged head SHA is a duplicate, both in memory and in the database"""
+    async def scenario():
+        async def handler(job):
+            pass
+
+        memory_queue = ReviewQueue(handler, workers=1, max_size=10)
+        durable_queue = ReviewQueue(handler, workers=1, max_size=10, durable=True)
+        return (
+            [await memory_queue.enqueue(make_job(1, head_sha="a")) for _ in range(2)],
+            [await durable_queue.enqueue(make_job(2, head_sha="b")) for _ in range(2)]
+        )
+
+    assert asyncio.run(scenario()) == (["queued", "duplicate"], ["queued", "duplicate"])
+
+
+def test_reviewed_head_sha_is_persisted(sqlite_db):
+    """Last reviewed head SHA is stored per MR and overwritten by newer reviews"""
+    assert database.get_reviewed_head_sha(1, 5) is None
+    database.save_reviewed_head_sha(1, 5, "abc123")
+    database.save_reviewed_head_sha(1, 5, "def456")
+    assert database.get_reviewed_head_sha(1, 5) == "def456"
+    assert database.get_reviewed_head_sha(1, 6) is None
+
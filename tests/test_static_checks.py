@@ -0,0 +1,133 @@
+"""
+Tests for local static pre-analysis
+"""
+
+import asyncio
+from pathlib import Path
+
+from backend.code_analyzer import CodeAnalyzer
+from backend.models import AnalysisResult
+from backend.static_checks import StaticAnalyzer, meaningful_lines, scan_diff
+
+
+def new_file_diff(text: str) -> str:
+    lines = text.split("\n")
+    return f"@@ -0,0 +1,{len(lines)} @@\n" + "\n".join("+" + line for line in lines)
+
+
+def test_bad_code_example_findings():
+    source = (Path(__file__).parent.parent / "examples" / "bad_code_example.py").read_text(encoding="utf-8")
+    result = scan_diff("examples/bad_code_example.py", new_file_diff(source))
+    found = {(i["line"], i["rule_id"]) for i in result["issues"]}
+
+    assert (20, "sql-concatenation") in found
+    assert (28, "hardcoded-secret") in found
+    assert all(i["severity"] == "critical" for i in result["issues"] if i["rule_id"] == "sql-concatenation")
+    assert result["meaningful_lines"] > 0
+
+
+def test_python_ast_and_entropy_checks():
+    source = "\n".join([
+        "def load(items=[]):",
+        "    try:",
+        "        subprocess.run(cmd, shell=True)",
+        "    except:",
+        "        pass",
+        "    h = hashlib.md5(data)",
+        "    token = 'Zx9aQ2LmP7rT4vB8nK1sW6yE3'",
+        "    # password = 'not-a-finding-in-comment'",
+    ])
+    rules = {(i["line"], i["rule_id"]) for i in scan_diff("app.py", new_file_diff(source))["issues"]}
+
+    assert {(1, "mutable-default"), (3, "shell-true"), (4, "bare-except"), (6, "weak-hash")} <= rules
+    assert any(line == 7 for line, _ in rules)
+    assert not any(line == 8 for line, _ in rules)
+
+
+def test_secret_names_with_plain_values_are_not_secrets():
+    source = "\n".join([
+        'token_type = "bearer"',
+        'password_field = "password"',
+        'SECRET_HEADER = "X-Secret"',
+        'api_key = "changeme"',
+        'db_password = "hunter22"',
+        'access_key = "kF8sPq2mZx7LwR4t"',
+    ])
+    found = {(i["line"], i["rule_id"]) for i in scan_diff("settings.py", new_file_diff(source))["issues"]}
+
+    assert found == {(5, "hardcoded-secret"), (6, "hardcoded-secret")}
+
+
+def test_only_added_lines_are_reported():
+    diff = "@@ -1,2 +1,3 @@\n eval(old)\n+x = 1\n ok()\n"
+    assert scan_diff("a.py", diff)["issues"] == []
+
+
+def test_comment_syntax_depends_on_language():
+    def code_lines(file_path: str, *lines: str) -> int:
+        return meaningful_lines(file_path, "@@ -1 +1 @@\n" + "\n".join("+" + line for line in lines))
+
+    assert code_lines("app.py", "# comment", "x = 1") == 1
+    assert code_lines("main.c", "#define MAX 10", "#include <stdio.h>", "*ptr = NULL;", "// note", " * doc", "*") == 3
+    assert code_lines("style.css", "#header { color: red; }", "/* note */") == 1
+    assert code_lines("init.lua", "-- note", "local x = 1") == 1
+    assert code_lines("query.sql", "-- note", "SELECT 1;") == 1
+    assert code_lines("schema.graphql", "# looks like a comment", "// so does this") == 2
+
+
+def test_static_findings_join_llm_result_and_trivial_mr_skips_llm(monkeypatch):
+    calls = []
+
+    async def fake_analyze_text(code_text, custom_rules=None, tier=None, project_rules=None):
+        calls.append(code_text)
+        return AnalysisResult(summary="ok", score=9.0, issues=[], recommendation="merge")
+
+    analyzer = CodeAnalyzer.__new__(CodeAnalyzer)
+    analyzer.static_analyzer = StaticAnalyzer(workers=0)
+    monkeypatch.setattr(analyzer, "_analyze_text", fake_analyze_text)
+
+    risky = [{"new_path": "db.py", "diff": '@@ -1 +1 @@\n-x = 1\n+API_KEY = "hardcoded_key_12345"\n'}]
+    result = asyncio.run(analyzer.analyze_changes(risky, {}))
+    assert len(calls) == 1
+    assert result["critical_count"] == 1 and result["issues"][0]["rule_id"] == "hardcoded-secret"
+    assert result["recommendation"] == "needs_fixes"
+
+    docs = [
+        {"new_path": "README.md", "diff": "@@ -1 +1 @@\n-Old\n+New text\n"},
+        {"new_path": "app.py", "diff": "@@ -1 +1 @@\n-# old comment\n+# new comment\n"},
+    ]
+    result = asyncio.run(analyzer.analyze_changes(docs, {}))
+    assert len(calls) == 1
+    assert result["llm_skipped"] is True and result["score"] == 10.0
+
+    c_code = [{"new_path": "main.c", "diff": "@@ -1 +1,2 @@\n-#define MAX 1\n+#define MAX 10\n+*ptr = NULL;\n"}]
+    asyncio.run(analyzer.analyze_changes(c_code, {}))
+    assert len(calls) == 2
+
+
+def test_scan_runs_in_process_pool():
+    static = StaticAnalyzer(workers=1)
+    try:
+        result = asyncio.run(static.scan("a.py", new_file_diff("eval(user_input)")))
+    finally:
+        static.shutdown()
+    assert [i["rule_id"] for i in result["issues"]] == ["eval"]
+
+
+def test_runaway_repository_pattern_times_out():
+    import time
+
+    static = StaticAnalyzer(workers=1, rules_timeout=0.3)
+    checks = {"forbidden_patterns": [
+        {"pattern": "(a+)+$", "message": "backtracking"},
+        {"pattern": "TODO", "message": "todo"},
+    ]}
+    diff = new_file_diff("eval(x)  # TODO " + "a" * 40 + "!")
+    started = time.monotonic()
+    try:
+        result = asyncio.run(static.scan("a.py", diff, checks))
+    finally:
+        static.shutdown()
+
+    assert time.monotonic() - started < 5
+    assert [i["rule_id"] for i in result["issues"]] == ["eval", "rule-timeout:(a+)+$", "forbidden:TODO"]
@@ -45,3 +45,28 @@ def test_webhook_with_wrong_event():
     )
     # Should be ignored
     assert response.status_code in [200, 401]
+
+
+def test_webhook_mr_event_without_queue():
+    """MR event is rejected with 503 when review workers are not running"""
+    from backend.config import settings
+    payload = {
+        "object_kind": "merge_request",
+        "project": {"id": 1},
+        "object_attributes": {"iid": 1, "action": "open"}
+    }
+    response = client.post(
+        "/webhook/gitlab",
+        json=payload,
+        headers={"X-Gitlab-Token": settings.WEBHOOK_SECRET}
+    )
+    assert response.status_code == 503
+
+
+def test_head_sha_matches_worker_snapshot():
+    """Webhook and worker key reviews on the same head SHA"""
+    from backend.models import MRSnapshot, mr_head_sha
+
+    mr = {"diff_refs": {"head_sha": "abc"}, "last_commit": {"id": "def"}, "sha": "def"}
+    assert mr_head_sha(mr) == MRSnapshot(project_id=1, mr_iid=1, mr=mr).head_sha == "abc"
+    assert mr_head_sha({"last_commit": {"id": "def"}}) == "def"